@@ -0,0 +1,135 @@
+"""
+Microbenchmark for the offline title pipeline in chinese_translator.py.
+
+Compares the current brand/term mapping and post-processing with the
+previous per-key / per-pattern loops on a corpus of Che168 titles. No
+network or database access.
+
+Run with:  python3 bench_translator.py [rounds]
+"""
+
+import re
+import sys
+import random
+import timeit
+
+from chinese_translator import (
+    BRAND_TRANSLATIONS,
+    TERM_TRANSLATIONS,
+    POST_PROCESS_PATTERNS,
+    POST_PROCESS_SIMPLE,
+    PhraseMatcher,
+    _apply_brand_mapping,
+    _apply_term_mapping,
+    _post_process,
+    _MULTI_SPACE_RE,
+)
+
+CHE168_TITLES = [
+    "银河星舰6 2026款 60km 远航版",
+    "宝马 3系 2020款 325Li M运动套装",
+    "奔驰 E级 2021款 E300L 豪华型",
+    "丰田 凯美瑞 2022款 2.5L 双擎豪华版",
+    "特斯拉 Model 3 2023款 长续航全轮驱动版",
+    "比亚迪 汉 2023款 EV 冠军版 610KM 四驱旗舰型",
+    "问界 M9 2024款 纯电旗舰版",
+    "小米汽车 SU7 2024款 标准版",
+    "深蓝汽车 S7 2024款 增程版",
+    "星途 凌云 2024款 豪华版",
+    "极氪 001 2024款 长续航四驱版",
+    "理想汽车 L9 2024款 Pro版",
+    "蔚来 ET5 2024款 长续航版",
+    "吉利银河 E8 2024款 665km 星舰版",
+    "大众 帕萨特 2019款 330TSI 精英版",
+    "本田 雅阁 2021款 260TURBO 旗舰版",
+]
+
+# Typical Google Translate output before post-processing
+TRANSLATED_TITLES = [
+    "Geely Galaxy Star 6 2026 60km sailing version",
+    "BYD Han 2023 EV champion version 610KM four-wheel drive flagship version",
+    "Tesla Model 3 2023 long battery life all-wheel drive version",
+    "AITO M9 2024 pure electric Flagship version",
+    "Xiaomi SU7 2024 standard version",
+    "Deepal S7 2024 extended range Cruising version",
+    "Zeekr 001 2024 long endurance four-wheel drive version",
+    "Volkswagen Passat 2019 330TSI Elite Edition",
+]
+
+
+def _previous_mapping(text, translations, sorted_keys):
+    result = text
+    for chinese in sorted_keys:
+        if chinese in result:
+            result = result.replace(chinese, translations[chinese] + " ")
+    while "  " in result:
+        result = result.replace("  ", " ")
+    return result.strip()
+
+
+_sorted_brands = sorted(BRAND_TRANSLATIONS, key=len, reverse=True)
+_sorted_terms = sorted(TERM_TRANSLATIONS, key=len, reverse=True)
+
+
+def previous_mapping(text):
+    result = _previous_mapping(text, BRAND_TRANSLATIONS, _sorted_brands)
+    return _previous_mapping(result, TERM_TRANSLATIONS, _sorted_terms)
+
+
+def previous_post_process(text):
+    result = text
+    for pattern, replacement in POST_PROCESS_PATTERNS:
+        result = re.sub(pattern, replacement, result)
+    for wrong, correct in POST_PROCESS_SIMPLE.items():
+        if wrong in result:
+            result = result.replace(wrong, correct)
+    while "  " in result:
+        result = result.replace("  ", " ")
+    return result.strip()
+
+
+def current_mapping(text):
+    return _apply_term_mapping(_apply_brand_mapping(text))
+
+
+def _bench(label, previous, current, corpus, rounds):
+    for text in corpus:
+        assert previous(text) == current(text), text
+    before = timeit.timeit(lambda: [previous(t) for t in corpus], number=rounds)
+    after = timeit.timeit(lambda: [current(t) for t in corpus], number=rounds)
+    per_title = 1e6 / (rounds * len(corpus))
+    print(
+        f"{label:<16} previous {before * per_title:7.1f} µs/title   "
+        f"current {after * per_title:7.1f} µs/title   x{before / after:.1f}"
+    )
+
+
+def _grown_terms(size, seed=1):
+    """TERM_TRANSLATIONS padded with random fragments, as a mined dictionary would be."""
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+    terms = dict(TERM_TRANSLATIONS)
+    while len(terms) < size:
+        terms["".join(rng.choice(chars) for _ in range(rng.randint(2, 4)))] = "x"
+    return terms
+
+
+def main(rounds=2000):
+    post_corpus = TRANSLATED_TITLES + [current_mapping(t) for t in CHE168_TITLES]
+    _bench("mapping", previous_mapping, current_mapping, CHE168_TITLES, rounds)
+
+    terms = _grown_terms(3000)
+    sorted_terms = sorted(terms, key=len, reverse=True)
+    matcher = PhraseMatcher(terms)
+    _bench(
+        "3000 terms",
+        lambda text: _previous_mapping(text, terms, sorted_terms),
+        lambda text: _MULTI_SPACE_RE.sub(" ", matcher.replace(text)).strip(),
+        [_apply_brand_mapping(t) for t in CHE168_TITLES],
+        rounds // 10,
+    )
+    _bench("post-process", previous_post_process, _post_process, post_corpus, rounds)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
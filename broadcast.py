@@ -0,0 +1,539 @@
+"""
+Broadcast engine for admin mailings.
+
+Recipients are streamed from PostgreSQL with a server-side cursor and sent
+through a small worker pool. A global token bucket keeps the send rate under
+Telegram's ~30 messages/second limit, and a 429 response pauses every worker
+for the retry_after the API asks for.
+
+Each broadcast is a job row in broadcast_jobs with a per-user delivery log,
+so a run interrupted by a dyno restart or a database error resumes where it
+stopped without messaging anyone twice. Users who blocked the bot are flagged in the users
+table and skipped by later broadcasts.
+
+Photos, videos and albums are broadcast by the file_id Telegram assigned
+when the admin sent them, so the media is uploaded exactly once no matter
+how many recipients there are.
+"""
+
+import time
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+from db import get_connection
+from utils import RateLimiter
+
+BROADCAST_RATE_LIMIT = 25  # msg/sec, a little under Telegram's ~30 msg/sec
+BROADCAST_WORKERS = 8
+BROADCAST_MAX_RETRIES = 3
+BROADCAST_MAX_FLOOD_WAITS = 20  # 429s per recipient; these don't use up BROADCAST_MAX_RETRIES
+BROADCAST_FETCH_SIZE = 500  # rows per server-side cursor round trip
+BROADCAST_PROGRESS_INTERVAL = 10  # seconds between progress updates to the admin
+BROADCAST_RESUME_DELAY = 60  # seconds before retrying a run interrupted by an error
+BROADCAST_MAX_RESUMES = 5  # automatic retries; after that the job resumes on restart
+
+# Recipients of a job, in user_id order so the job cursor is a simple watermark
+RECIPIENTS_QUERY = """
+    SELECT u.user_id FROM users u
+    WHERE u.username IS NOT NULL AND u.phone_number IS NOT NULL
+      AND NOT u.is_blocked
+      AND u.user_id > %s
+      AND NOT EXISTS (
+          SELECT 1 FROM broadcast_deliveries d
+          WHERE d.job_id = %s AND d.user_id = u.user_id
+      )
+    ORDER BY u.user_id
+"""
+
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+
+
+def ensure_tables():
+    """Create the broadcast job tables and the users.is_blocked flag."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                ALTER TABLE users ADD COLUMN IF NOT EXISTS is_blocked BOOLEAN NOT NULL DEFAULT FALSE;
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                    job_id SERIAL PRIMARY KEY,
+                    admin_chat_id BIGINT NOT NULL,
+                    text TEXT NOT NULL,
+                    payload JSONB,
+                    status VARCHAR NOT NULL DEFAULT 'running',
+                    cursor_user_id BIGINT NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    updated_at TIMESTAMP DEFAULT NOW()
+                );
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                    job_id INTEGER NOT NULL REFERENCES broadcast_jobs (job_id) ON DELETE CASCADE,
+                    user_id BIGINT NOT NULL,
+                    status VARCHAR NOT NULL,
+                    delivered_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (job_id, user_id)
+                );
+            """)
+            cursor.execute("""
+                ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS payload JSONB;
+            """)
+
+
+class BroadcastMessage:
+    """
+    What a broadcast sends: text, a photo, a video or an album.
+
+    Media is referenced by Telegram file_id, so nothing is re-uploaded per
+    recipient.
+    """
+
+    KIND_TEXT = "text"
+    KIND_PHOTO = "photo"
+    KIND_VIDEO = "video"
+    KIND_ALBUM = "album"
+
+    def __init__(self, kind, text="", file_id=None, items=None):
+        """
+        :param kind: One of the KIND_* constants
+        :param text: Message text, or caption for media
+        :param file_id: file_id for a single photo/video
+        :param items: For albums, a list of {"type", "file_id", "caption"} dicts
+        """
+        self.kind = kind
+        self.text = text or ""
+        self.file_id = file_id
+        self.items = items or []
+
+    @classmethod
+    def from_message(cls, message):
+        """Build from a single admin message (text, photo or video)."""
+        if message.content_type == "photo":
+            # Telegram sends several sizes; the last one is the largest
+            return cls(cls.KIND_PHOTO, message.caption, file_id=message.photo[-1].file_id)
+        if message.content_type == "video":
+            return cls(cls.KIND_VIDEO, message.caption, file_id=message.video.file_id)
+        if message.content_type == "text":
+            return cls(cls.KIND_TEXT, message.text)
+        return None
+
+    @classmethod
+    def album_part(cls, message):
+        """
+        One photo/video of a media group as a JSON-serialisable dict
+        ({"message_id", "type", "file_id", "caption"}), or None if the
+        message can't be part of an album.
+        """
+        single = cls.from_message(message)
+        if single is None or single.kind == cls.KIND_TEXT:
+            return None
+        return {
+            "message_id": message.message_id,
+            "type": single.kind,
+            "file_id": single.file_id,
+            "caption": single.text,
+        }
+
+    @classmethod
+    def from_album_parts(cls, parts):
+        """Build from album_part() dicts, in the order the messages were sent."""
+        items = [
+            {"type": part["type"], "file_id": part["file_id"], "caption": part["caption"]}
+            for part in sorted(parts, key=lambda part: part["message_id"])
+        ]
+        caption = next((item["caption"] for item in items if item["caption"]), "")
+        return cls(cls.KIND_ALBUM, caption, items=items)
+
+    @classmethod
+    def from_album(cls, messages):
+        """Build from the messages of one media group, in the order they were sent."""
+        parts = [cls.album_part(message) for message in messages]
+        return cls.from_album_parts([part for part in parts if part is not None])
+
+    @classmethod
+    def from_payload(cls, payload, text=""):
+        if not payload:
+            return cls(cls.KIND_TEXT, text)
+        return cls(
+            payload.get("kind", cls.KIND_TEXT),
+            payload.get("text", text),
+            file_id=payload.get("file_id"),
+            items=payload.get("items"),
+        )
+
+    def to_payload(self):
+        return {"kind": self.kind, "text": self.text, "file_id": self.file_id, "items": self.items}
+
+    @property
+    def cost(self):
+        """Number of Telegram messages one delivery produces (for rate limiting)."""
+        return max(len(self.items), 1) if self.kind == self.KIND_ALBUM else 1
+
+    def describe(self):
+        """Short label for admin notifications."""
+        labels = {
+            self.KIND_TEXT: "текст",
+            self.KIND_PHOTO: "фото",
+            self.KIND_VIDEO: "видео",
+            self.KIND_ALBUM: f"альбом ({len(self.items)} шт.)",
+        }
+        return labels.get(self.kind, self.kind)
+
+    def send(self, bot, chat_id):
+        caption = self.text or None
+        if self.kind == self.KIND_PHOTO:
+            return bot.send_photo(chat_id, self.file_id, caption=caption, parse_mode="HTML")
+        if self.kind == self.KIND_VIDEO:
+            return bot.send_video(chat_id, self.file_id, caption=caption, parse_mode="HTML")
+        if self.kind == self.KIND_ALBUM:
+            media = []
+            for item in self.items:
+                media_cls = types.InputMediaVideo if item["type"] == self.KIND_VIDEO else types.InputMediaPhoto
+                media.append(
+                    media_cls(item["file_id"], caption=item.get("caption") or None, parse_mode="HTML")
+                )
+            return bot.send_media_group(chat_id, media)
+        return bot.send_message(chat_id, self.text, parse_mode="HTML")
+
+
+class BroadcastJob:
+    """A persisted broadcast: what to send and how far it got."""
+
+    def __init__(self, job_id, admin_chat_id, message, cursor_user_id=0):
+        self.job_id = job_id
+        self.admin_chat_id = admin_chat_id
+        self.message = message
+        self.cursor_user_id = cursor_user_id
+
+    @classmethod
+    def create(cls, message, admin_chat_id):
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO broadcast_jobs (admin_chat_id, text, payload) "
+                    "VALUES (%s, %s, %s) RETURNING job_id",
+                    (admin_chat_id, message.text, json.dumps(message.to_payload())),
+                )
+                job_id = cursor.fetchone()[0]
+        return cls(job_id, admin_chat_id, message)
+
+    @classmethod
+    def unfinished(cls):
+        """Jobs that were running when the process stopped."""
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT job_id, admin_chat_id, text, payload, cursor_user_id FROM broadcast_jobs "
+                    "WHERE status = %s ORDER BY job_id",
+                    (JOB_STATUS_RUNNING,),
+                )
+                rows = cursor.fetchall()
+        return [
+            cls(job_id, admin_chat_id, BroadcastMessage.from_payload(payload, text), cursor_user_id)
+            for job_id, admin_chat_id, text, payload, cursor_user_id in rows
+        ]
+
+    def save_cursor(self, cursor_user_id):
+        """Persist the watermark below which every recipient has been handled."""
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE broadcast_jobs SET cursor_user_id = %s, updated_at = NOW() "
+                    "WHERE job_id = %s AND cursor_user_id < %s",
+                    (cursor_user_id, self.job_id, cursor_user_id),
+                )
+        self.cursor_user_id = max(self.cursor_user_id, cursor_user_id)
+
+    def set_status(self, status):
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE broadcast_jobs SET status = %s, updated_at = NOW() WHERE job_id = %s",
+                    (status, self.job_id),
+                )
+
+    def record_delivery(self, user_id, status):
+        """Log the outcome for one user; blocked chats are excluded from future runs."""
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO broadcast_deliveries (job_id, user_id, status) VALUES (%s, %s, %s) "
+                    "ON CONFLICT (job_id, user_id) DO UPDATE SET status = EXCLUDED.status, "
+                    "delivered_at = NOW()",
+                    (self.job_id, user_id, status),
+                )
+                if status == "blocked":
+                    cursor.execute(
+                        "UPDATE users SET is_blocked = TRUE WHERE user_id = %s", (user_id,)
+                    )
+
+    def delivery_counts(self):
+        """Outcome counts from the delivery log (used when resuming)."""
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT status, COUNT(*) FROM broadcast_deliveries WHERE job_id = %s GROUP BY status",
+                    (self.job_id,),
+                )
+                return dict(cursor.fetchall())
+
+
+class BroadcastStats:
+    """Thread-safe counters for a running broadcast."""
+
+    def __init__(self, sent=0, failed=0, blocked=0):
+        self.sent = sent
+        self.failed = failed
+        self.blocked = blocked
+        self._lock = threading.Lock()
+
+    def record(self, status):
+        with self._lock:
+            if status == "sent":
+                self.sent += 1
+            elif status == "blocked":
+                self.blocked += 1
+            else:
+                self.failed += 1
+
+    @property
+    def processed(self):
+        return self.sent + self.failed + self.blocked
+
+
+class BroadcastEngine:
+    """Send one message to every recipient as fast as Telegram allows."""
+
+    def __init__(self, bot, rate_limit=BROADCAST_RATE_LIMIT, workers=BROADCAST_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate_limit=rate_limit)
+        self._pause_until = 0.0
+        self._pause_lock = threading.Lock()
+
+    def start(self, message, admin_chat_id):
+        """
+        Create a broadcast job and run it in a background thread.
+
+        :param message: BroadcastMessage, or a plain string for text broadcasts
+        """
+        if isinstance(message, str):
+            message = BroadcastMessage(BroadcastMessage.KIND_TEXT, message)
+        job = BroadcastJob.create(message, admin_chat_id)
+        logging.info(f"Broadcast job #{job.job_id} created")
+        return self._spawn([job])
+
+    def resume_unfinished(self):
+        """Restart jobs interrupted by a restart (call once at startup)."""
+        jobs = BroadcastJob.unfinished()
+        if not jobs:
+            return None
+        for job in jobs:
+            logging.info(f"Resuming broadcast job #{job.job_id} after user_id {job.cursor_user_id}")
+        return self._spawn(jobs, resumed=True)
+
+    def _spawn(self, jobs, resumed=False, retries=0):
+        def _run_all():
+            for job in jobs:
+                self.run(job, resumed=resumed, retries=retries)
+
+        thread = threading.Thread(target=_run_all, name="broadcast", daemon=True)
+        thread.start()
+        return thread
+
+    def iter_recipients(self, job):
+        """Stream the job's remaining recipients without loading the whole table."""
+        with get_connection() as conn:
+            with conn.cursor(name=f"broadcast_recipients_{job.job_id}") as cursor:
+                cursor.itersize = BROADCAST_FETCH_SIZE
+                cursor.execute(RECIPIENTS_QUERY, (job.cursor_user_id, job.job_id))
+                for (user_id,) in cursor:
+                    yield user_id
+
+    def _wait_for_pause(self):
+        with self._pause_lock:
+            delay = self._pause_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pause(self, seconds):
+        with self._pause_lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    def send_one(self, user_id, message):
+        """
+        Deliver the message to one user.
+
+        A 429 pauses the whole engine and is retried without counting
+        against BROADCAST_MAX_RETRIES, up to BROADCAST_MAX_FLOOD_WAITS times.
+
+        Returns:
+            "sent", "blocked" (bot blocked / chat deactivated) or "failed"
+        """
+        attempt = 0
+        flood_waits = 0
+        while attempt < BROADCAST_MAX_RETRIES:
+            self._wait_for_pause()
+            for _ in range(message.cost):
+                self.rate_limiter.acquire()
+            try:
+                message.send(self.bot, user_id)
+                return "sent"
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    flood_waits += 1
+                    if flood_waits > BROADCAST_MAX_FLOOD_WAITS:
+                        logging.warning(f"Broadcast send to {user_id} failed: still rate limited after {flood_waits - 1} waits")
+                        break
+                    retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                    logging.warning(f"Broadcast hit 429, pausing for {retry_after}s")
+                    self._pause(retry_after)
+                    continue
+                if e.error_code == 403 or (
+                    e.error_code == 400 and "chat not found" in str(e.description).lower()
+                ):
+                    return "blocked"
+                logging.warning(f"Broadcast send to {user_id} failed (attempt {attempt + 1}): {e}")
+            except Exception as e:
+                logging.warning(f"Broadcast send to {user_id} failed (attempt {attempt + 1}): {e}")
+            attempt += 1
+        return "failed"
+
+    def _schedule_resume(self, job, retries):
+        """Retry an interrupted job later, or leave it for resume_unfinished()."""
+        if retries < BROADCAST_MAX_RESUMES:
+            text = (
+                f"⚠️ Рассылка #{job.job_id} прервана из-за ошибки. "
+                f"Продолжу автоматически через {BROADCAST_RESUME_DELAY} сек."
+            )
+            timer = threading.Timer(
+                BROADCAST_RESUME_DELAY,
+                self._spawn,
+                args=([job],),
+                kwargs={"resumed": True, "retries": retries + 1},
+            )
+            timer.daemon = True
+            timer.start()
+        else:
+            text = (
+                f"⚠️ Рассылка #{job.job_id} прервана из-за ошибки. "
+                "Она продолжится после перезапуска бота."
+            )
+        try:
+            self.bot.send_message(job.admin_chat_id, text)
+        except Exception as e:
+            logging.warning(f"Failed to notify admin about broadcast #{job.job_id}: {e}")
+
+    def _report_progress(self, admin_chat_id, progress_message, stats, done=False):
+        text = (
+            f"{'✅ Рассылка завершена!' if done else '📤 Идёт рассылка...'}\n\n"
+            f"Отправлено: {stats.sent}\n"
+            f"Заблокировали бота: {stats.blocked}\n"
+            f"Ошибки: {stats.failed}"
+        )
+        try:
+            if progress_message is None:
+                return self.bot.send_message(admin_chat_id, text)
+            self.bot.edit_message_text(
+                text, chat_id=admin_chat_id, message_id=progress_message.message_id
+            )
+        except Exception as e:
+            logging.warning(f"Failed to update broadcast progress: {e}")
+        return progress_message
+
+    def run(self, job, resumed=False, retries=0):
+        """
+        Send the job's message to every remaining recipient, reporting progress to the admin.
+
+        If the run is interrupted by an error (e.g. the database connection
+        behind the recipient cursor drops), the job stays running with its
+        watermark saved and is retried after BROADCAST_RESUME_DELAY, up to
+        BROADCAST_MAX_RESUMES times; after that it resumes on the next start.
+
+        :param retries: Automatic retries of this job so far
+        """
+        admin_chat_id = job.admin_chat_id
+        if resumed:
+            counts = job.delivery_counts()
+            stats = BroadcastStats(
+                sent=counts.get("sent", 0),
+                failed=counts.get("failed", 0),
+                blocked=counts.get("blocked", 0),
+            )
+            reason = "после ошибки" if retries else "после перезапуска бота"
+            self.bot.send_message(admin_chat_id, f"🔁 Возобновляю рассылку #{job.job_id} {reason}.")
+        else:
+            stats = BroadcastStats()
+        progress_message = self._report_progress(admin_chat_id, None, stats)
+        last_report = time.monotonic()
+
+        # Bound in-flight sends so the cursor is consumed at the sending pace
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+        pending = set()  # user_ids dispatched but not yet logged
+        unlogged = set()  # user_ids whose delivery row couldn't be written
+        pending_lock = threading.Lock()
+        last_dispatched = job.cursor_user_id
+
+        def _task(user_id):
+            try:
+                status = self.send_one(user_id, job.message)
+                job.record_delivery(user_id, status)
+                stats.record(status)
+            except Exception as e:
+                logging.error(f"Broadcast job #{job.job_id}: failed to log delivery to {user_id}: {e}")
+                # Pin the watermark below this user so a resume covers them
+                with pending_lock:
+                    unlogged.add(user_id)
+            finally:
+                with pending_lock:
+                    pending.discard(user_id)
+                in_flight.release()
+
+        def _watermark():
+            # Every recipient below the smallest in-flight or unlogged id has been logged
+            with pending_lock:
+                held = pending | unlogged
+                return min(held) - 1 if held else last_dispatched
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="broadcast") as pool:
+                for user_id in self.iter_recipients(job):
+                    in_flight.acquire()
+                    with pending_lock:
+                        pending.add(user_id)
+                    last_dispatched = user_id
+                    pool.submit(_task, user_id)
+
+                    if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                        job.save_cursor(_watermark())
+                        progress_message = self._report_progress(admin_chat_id, progress_message, stats)
+                        last_report = time.monotonic()
+            if unlogged:
+                raise RuntimeError(f"{len(unlogged)} deliveries could not be logged")
+        except Exception as e:
+            # The pool has drained, so every dispatched recipient is logged
+            # or held in `unlogged`. Keep the job running so it can pick up
+            # after the watermark.
+            logging.error(f"Broadcast job #{job.job_id} interrupted: {e}")
+            try:
+                job.save_cursor(_watermark())
+            except Exception as save_error:
+                logging.error(f"Broadcast job #{job.job_id}: failed to save cursor: {save_error}")
+            self._schedule_resume(job, retries)
+            return stats
+
+        job.save_cursor(last_dispatched)
+        job.set_status(JOB_STATUS_DONE)
+        self._report_progress(admin_chat_id, progress_message, stats, done=True)
+        logging.info(
+            f"Broadcast job #{job.job_id} finished: "
+            f"sent={stats.sent} blocked={stats.blocked} failed={stats.failed}"
+        )
+        return stats
@@ -0,0 +1,122 @@
+"""
+In-process cache primitives shared by the bot modules.
+
+Kept dependency-free and thread-safe: pyTelegramBotAPI runs handlers on a
+thread pool, so every structure here guards its state with a lock.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded least-recently-used cache."""
+
+    def __init__(self, maxsize=1024):
+        """
+        :param maxsize: Maximum number of entries kept in memory
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it as most recently used."""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        """Insert or refresh an entry, evicting the oldest one if full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class TTLCache:
+    """
+    Bounded cache whose entries expire after a per-entry time-to-live.
+
+    Expired entries are dropped lazily on access; when full, the least
+    recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        """
+        :param maxsize: Maximum number of entries kept in memory
+        :param ttl: Default time-to-live in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Insert or refresh an entry; `ttl` overrides the default lifetime."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None or item[0] <= time.monotonic():
+            return default
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def expire(self):
+        """Drop expired entries now instead of on their next access."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (expires_at, _) in self._data.items() if expires_at <= now]:
+                del self._data[key]
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -11,7 +11,7 @@ import requests
 import logging
 from datetime import datetime
 
-from chinese_translator import translate_car_title
+from chinese_translator import preview_car_title, start_car_title_translation
 
 # Che168 API endpoints
 CHE168_API_URL = "https://apiuscdt.che168.com/apic/v2/car/getcarinfo"
@@ -311,14 +311,18 @@ def parse_che168_response(result):
     guidance_price = result.get("guidanceprice", 0)
     guidance_price_cny = int(float(guidance_price) * 10000) if guidance_price else 0
 
-    # Translate car name from Chinese to English
+    # Translate car name from Chinese to English. Parsing doesn't wait for
+    # the translator: car_name starts as the locally mapped title and the
+    # full translation runs in the background until the quote is rendered
+    # (get_car_title_translation).
     car_name_chinese = result.get("carname", "")
-    car_name_english = translate_car_title(car_name_chinese)
+    car_name_english = preview_car_title(car_name_chinese)
+    start_car_title_translation(car_name_chinese)
 
     return {
         # Basic info
         "infoid": result.get("infoid"),
-        "car_name": car_name_english,  # English translated name (displayed to user)
+        "car_name": car_name_english,  # English name (preview until the translation finishes)
         "car_name_original": car_name_chinese,  # Original Chinese (preserved for reference)
         "brand_name": result.get("brandname", ""),
         "series_name": result.get("seriesname", ""),
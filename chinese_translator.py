@@ -6,25 +6,44 @@ Updated with comprehensive brand dictionary (240+ brands) from Che168.com
 and improved translation logic for accurate model name handling.
 """
 
+import os
+import re
+import json
 import time
 import logging
 import threading
-import os
-import re
-import psycopg2
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 from deep_translator import GoogleTranslator
 from deep_translator.exceptions import TooManyRequests, RequestError, TranslationNotFound
+from psycopg2.extras import execute_values
+
+from cache import LRUCache, TTLCache
+from db import get_connection, is_configured, BatchWriter
+from utils import RateLimiter
 
 # Configuration
-DATABASE_URL = os.getenv("DATABASE_URL")
 MAX_RETRIES = 3
 RETRY_DELAY_BASE = 1.0
 RATE_LIMIT_DELAY = 0.2  # 5 req/sec
+RATE_LIMIT_BURST = 3  # requests allowed back to back after an idle period
+MEMORY_CACHE_SIZE = 5000  # Hot titles kept in process memory
+MEMORY_CACHE_WARM_ROWS = 2000  # Rows preloaded from PostgreSQL at startup
+LAST_USED_TOUCH_INTERVAL = 60 * 60  # Seconds between last_used_at bumps for memory hits
+TRANSLATE_BATCH_MAX_CHARS = 4500  # Google Translate rejects requests over 5000 chars
+SEGMENT_CACHE_SIZE = 20000  # Residual Chinese fragments kept in process memory
+TRANSLATION_WORKERS = 2  # Background title translations (see start_car_title_translation)
+TRANSLATION_JOIN_TIMEOUT = 15.0  # Seconds a quote waits for its title before using the preview
+# Fragment translations mined from the cache (mine_translation_dictionary.py)
+LEARNED_TRANSLATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "learned_translations.json")
+
 
-# Rate limiter
-_last_request_time = 0
-_rate_lock = threading.Lock()
+# Only network calls go through the limiter; cache and segment-memory hits never wait
+_rate_limiter = RateLimiter(rate_limit=1 / RATE_LIMIT_DELAY, burst=RATE_LIMIT_BURST)
+
+# GoogleTranslator keeps per-request state on the instance (URL params), so
+# each thread gets one long-lived instance instead of sharing a single one
+_translator_local = threading.local()
 
 # =============================================================================
 # COMPREHENSIVE BRAND TRANSLATIONS (240+ brands from Che168.com)
@@ -528,105 +547,431 @@ POST_PROCESS_SIMPLE = {
 }
 
 
+def _compile_post_process(patterns):
+    """
+    Fold POST_PROCESS_PATTERNS into one alternation regex.
+
+    Entries that only differ in the case of their first letter and share a
+    replacement ("sailing" / "Sailing") become a single alternative with a
+    [sS] class. Each alternative is wrapped in its own group, so the
+    replacement is looked up by the index of the group that matched.
+    Alternatives keep their list order, which is the priority when several
+    start at the same position.
+    """
+    alternatives = []  # [pattern, replacement, first-letter variants or None]
+    folded = {}
+    for pattern, replacement in patterns:
+        head = re.match(r"\\b([A-Za-z])", pattern)
+        if head is None:
+            alternatives.append([pattern, replacement, None])
+            continue
+        key = (pattern[:2] + head.group(1).lower() + pattern[3:], replacement)
+        if key in folded:
+            folded[key][2].add(head.group(1))
+        else:
+            folded[key] = [pattern, replacement, {head.group(1)}]
+            alternatives.append(folded[key])
+
+    sources = []
+    replacements = [None]  # group 0 is the whole match
+    for pattern, replacement, letters in alternatives:
+        if letters and len(letters) > 1:
+            pattern = pattern[:2] + "[" + "".join(sorted(letters)) + "]" + pattern[3:]
+        sources.append(f"({pattern})")
+        replacements.append(replacement)
+    return re.compile("|".join(sources)), replacements
+
+
+_POST_PROCESS_RE, _POST_PROCESS_REPLACEMENTS = _compile_post_process(POST_PROCESS_PATTERNS)
+
+
 class PostgresTranslationCache:
-    """Persistent cache using existing PostgreSQL database."""
+    """
+    Persistent cache using existing PostgreSQL database.
+
+    A bounded in-process LRU sits in front of the table, so repeated titles
+    are served from memory and PostgreSQL is only hit on true misses and
+    writes.
+
+    Rows carry last_used_at, bumped on database hits and writes, and (at
+    most once per LAST_USED_TOUCH_INTERVAL, batched in the background) on
+    memory hits, so warm() can preload the titles that are actually in use.
+    """
 
-    def __init__(self):
+    def __init__(self, table="translation_cache", memory_size=MEMORY_CACHE_SIZE):
+        """
+        :param table: Table holding the (chinese_text, english_text) pairs
+        :param memory_size: Entries kept in the in-process LRU
+        """
+        self.table = table
         self._table_ensured = False
+        self._memory = LRUCache(maxsize=memory_size)
+        self._touched = TTLCache(maxsize=memory_size, ttl=LAST_USED_TOUCH_INTERVAL)
+        self._touch_writer = BatchWriter(
+            f"UPDATE {table} AS c SET last_used_at = CURRENT_TIMESTAMP "
+            "FROM (VALUES %s) AS v (chinese_text) WHERE c.chinese_text = v.chinese_text",
+            name=f"{table}-touch",
+        )
 
     def _ensure_table(self):
-        """Create translation_cache table if it doesn't exist."""
+        """Create the cache table if it doesn't exist."""
         if self._table_ensured:
             return
 
-        if not DATABASE_URL:
+        if not is_configured():
             logging.warning("DATABASE_URL not set, cache disabled")
             return
 
         try:
-            conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS translation_cache (
-                    chinese_text TEXT PRIMARY KEY,
-                    english_text TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {self.table} (
+                            chinese_text TEXT PRIMARY KEY,
+                            english_text TEXT NOT NULL,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        );
+                        ALTER TABLE {self.table}
+                            ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+                        CREATE INDEX IF NOT EXISTS {self.table}_last_used_at_idx
+                            ON {self.table} (last_used_at);
+                    """)
             self._table_ensured = True
-            logging.info("Translation cache table ensured")
+            logging.info(f"Translation cache table {self.table} ensured")
         except Exception as e:
             logging.error(f"Failed to ensure translation cache table: {e}")
 
+    def _touch(self, chinese_text: str):
+        """Record a memory hit in last_used_at (throttled and batched)."""
+        if not self._table_ensured or chinese_text in self._touched:
+            return
+        self._touched.set(chinese_text, True)
+        self._touch_writer.put((chinese_text,))
+
+    def warm(self, limit: int = MEMORY_CACHE_WARM_ROWS) -> int:
+        """
+        Preload the most recently used translations into the in-memory cache.
+
+        Returns:
+            Number of rows loaded
+        """
+        self._ensure_table()
+
+        if not is_configured():
+            return 0
+
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT chinese_text, english_text FROM {self.table} "
+                        "ORDER BY last_used_at DESC LIMIT %s",
+                        (limit,)
+                    )
+                    rows = cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Cache warm-up error: {e}")
+            return 0
+
+        # Insert least recently used first so the LRU order matches the table
+        for chinese_text, english_text in reversed(rows):
+            self._memory.set(chinese_text, english_text)
+            self._touched.set(chinese_text, True)
+        logging.info(f"Translation cache {self.table} warmed with {len(rows)} rows")
+        return len(rows)
+
     def get(self, chinese_text: str) -> str | None:
-        """Get cached translation from PostgreSQL."""
+        """Get cached translation from memory, falling back to PostgreSQL."""
+        cached = self._memory.get(chinese_text)
+        if cached is not None:
+            self._touch(chinese_text)
+            return cached
+
         self._ensure_table()
 
-        if not DATABASE_URL:
+        if not is_configured():
             return None
 
         try:
-            conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT english_text FROM translation_cache WHERE chinese_text = %s",
-                (chinese_text,)
-            )
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {self.table} SET last_used_at = CURRENT_TIMESTAMP "
+                        "WHERE chinese_text = %s RETURNING english_text",
+                        (chinese_text,)
+                    )
+                    result = cursor.fetchone()
 
             if result:
                 logging.debug(f"Cache hit for: {chinese_text[:30]}...")
+                self._memory.set(chinese_text, result[0])
+                self._touched.set(chinese_text, True)
                 return result[0]
             return None
         except Exception as e:
             logging.error(f"Cache get error: {e}")
             return None
 
+    def peek(self, chinese_text: str) -> str | None:
+        """Cached translation from memory only (never touches PostgreSQL)."""
+        return self._memory.get(chinese_text)
+
+    def get_many(self, chinese_texts: list[str]) -> dict[str, str]:
+        """
+        Look up several titles at once: memory first, then a single
+        UPDATE ... WHERE chinese_text = ANY(...) RETURNING for the rest
+        (which also bumps their last_used_at).
+
+        Returns:
+            {chinese_text: english_text} for the titles that were found
+        """
+        found = {}
+        missing = []
+        for chinese_text in chinese_texts:
+            cached = self._memory.get(chinese_text)
+            if cached is not None:
+                self._touch(chinese_text)
+                found[chinese_text] = cached
+            else:
+                missing.append(chinese_text)
+
+        if not missing:
+            return found
+
+        self._ensure_table()
+
+        if not is_configured():
+            return found
+
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {self.table} SET last_used_at = CURRENT_TIMESTAMP "
+                        "WHERE chinese_text = ANY(%s) RETURNING chinese_text, english_text",
+                        (missing,)
+                    )
+                    rows = cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Cache get_many error: {e}")
+            return found
+
+        for chinese_text, english_text in rows:
+            self._memory.set(chinese_text, english_text)
+            self._touched.set(chinese_text, True)
+            found[chinese_text] = english_text
+        logging.debug(f"Cache batch lookup: {len(found)}/{len(chinese_texts)} hits")
+        return found
+
     def set(self, chinese_text: str, english_text: str):
         """Store translation in PostgreSQL cache."""
+        self._memory.set(chinese_text, english_text)
         self._ensure_table()
 
-        if not DATABASE_URL:
+        if not is_configured():
             return
 
         try:
-            conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO translation_cache (chinese_text, english_text)
-                VALUES (%s, %s)
-                ON CONFLICT (chinese_text) DO UPDATE SET english_text = EXCLUDED.english_text
-            """, (chinese_text, english_text))
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"""
+                        INSERT INTO {self.table} (chinese_text, english_text)
+                        VALUES (%s, %s)
+                        ON CONFLICT (chinese_text) DO UPDATE
+                        SET english_text = EXCLUDED.english_text, last_used_at = CURRENT_TIMESTAMP
+                    """, (chinese_text, english_text))
             logging.debug(f"Cached translation for: {chinese_text[:30]}...")
         except Exception as e:
             logging.error(f"Cache set error: {e}")
 
+    def set_many(self, translations: dict[str, str]):
+        """Store several translations with a single multi-row upsert."""
+        if not translations:
+            return
+
+        for chinese_text, english_text in translations.items():
+            self._memory.set(chinese_text, english_text)
+        self._ensure_table()
 
-# Global cache instance
+        if not is_configured():
+            return
+
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, f"""
+                        INSERT INTO {self.table} (chinese_text, english_text)
+                        VALUES %s
+                        ON CONFLICT (chinese_text) DO UPDATE
+                        SET english_text = EXCLUDED.english_text, last_used_at = CURRENT_TIMESTAMP
+                    """, list(translations.items()))
+            logging.debug(f"Cached {len(translations)} translations")
+        except Exception as e:
+            logging.error(f"Cache set_many error: {e}")
+
+
+# Global cache instances: whole titles, and the Chinese fragments left in
+# titles after the brand/term mappings (translation memory)
 _cache = PostgresTranslationCache()
+_segments = PostgresTranslationCache("translation_segments", memory_size=SEGMENT_CACHE_SIZE)
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over a {chinese: english} dictionary.
+
+    Built once at import; replace() finds every dictionary phrase in a
+    single left-to-right pass over the title, so mapping cost depends on
+    the title length rather than the dictionary size.
+
+    Overlapping matches are resolved exactly like the previous
+    "for key in keys sorted by length: text.replace(key, ...)" loop: longer
+    keys win (ties by dictionary order), and occurrences of the same key
+    are taken left to right.
+    """
+
+    def __init__(self, phrases: dict):
+        self.phrases = phrases
+        order = sorted(phrases, key=len, reverse=True)
+        priority = {phrase: i for i, phrase in enumerate(order)}
+
+        # Trie: per-node transitions and (priority, length, phrase) ending there
+        goto = [{}]
+        output = [[]]
+        for phrase in phrases:
+            node = 0
+            for char in phrase:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    output.append([])
+                node = next_node
+            output[node].append((priority[phrase], len(phrase), phrase))
+
+        # Failure links, breadth-first. Each node's transition table also
+        # gets the transitions of its (non-root) failure node, so the scan
+        # never walks failure chains: a missing transition means "continue
+        # from the root".
+        fail = [0] * len(goto)
+        self._delta = delta = [dict(edges) for edges in goto]
+        queue = list(goto[0].values())
+        for node in queue:  # queue grows while iterating
+            for char, child in goto[node].items():
+                fallback = fail[node]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(char, 0)
+                output[child] = output[child] + output[fail[child]]
+                if fail[child]:
+                    for edge, target in delta[fail[child]].items():
+                        delta[child].setdefault(edge, target)
+                queue.append(child)
+        self._output = [tuple(items) for items in output]
+
+    def find(self, text: str) -> list[tuple[int, int, int, str]]:
+        """All (priority, start, end, phrase) occurrences, overlapping included."""
+        delta, output = self._delta, self._output
+        root = delta[0]
+        matches = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            node = delta[node].get(char) or root.get(char, 0)
+            if output[node]:
+                for priority, length, phrase in output[node]:
+                    matches.append((priority, end - length, end, phrase))
+        return matches
+
+    def replace(self, text: str) -> str:
+        """Replace each selected phrase with its translation followed by a space."""
+        matches = self.find(text)
+        if not matches:
+            return text
+
+        # find() reports matches by end position; if none of them overlap
+        # (the usual case) they are all replaced as they are.
+        selected = matches
+        position = 0
+        for _, start, end, _ in matches:
+            if start < position:
+                selected = self._resolve_overlaps(matches, len(text))
+                break
+            position = end
+
+        phrases = self.phrases
+        parts = []
+        position = 0
+        for _, start, end, phrase in selected:
+            parts.append(text[position:start])
+            parts.append(phrases[phrase] + " ")
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
+
+    @staticmethod
+    def _resolve_overlaps(matches, length):
+        """Pick non-overlapping matches by priority, returned in text order."""
+        taken = bytearray(length)
+        selected = []
+        # Lowest priority value first; same phrase left to right
+        for match in sorted(matches):
+            _, start, end, _ = match
+            if any(taken[start:end]):
+                continue
+            taken[start:end] = b"\x01" * (end - start)
+            selected.append(match)
+        selected.sort(key=lambda match: match[1])
+        return selected
+
+
+def load_learned_translations(path: str = LEARNED_TRANSLATIONS_FILE) -> dict[str, str]:
+    """
+    Load the mined {chinese: english} fragment dictionary, if present.
+
+    Entries already covered by BRAND_TRANSLATIONS / TERM_TRANSLATIONS are
+    ignored, so the curated dictionaries always win. A missing or broken
+    file yields an empty dictionary.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to load learned translations from {path}: {e}")
+        return {}
+    if not isinstance(data, dict):
+        logging.error(f"Ignoring learned translations in {path}: expected a JSON object")
+        return {}
+
+    learned = {
+        chinese: english
+        for chinese, english in data.items()
+        if isinstance(chinese, str) and isinstance(english, str) and chinese and english.strip()
+        and chinese not in BRAND_TRANSLATIONS and chinese not in TERM_TRANSLATIONS
+    }
+    logging.info(f"Loaded {len(learned)} learned translations from {path}")
+    return learned
+
+
+LEARNED_TRANSLATIONS = load_learned_translations()
 
-# Pre-sorted brand list for longest-match-first processing
-_sorted_brands = sorted(BRAND_TRANSLATIONS.keys(), key=len, reverse=True)
-_sorted_terms = sorted(TERM_TRANSLATIONS.keys(), key=len, reverse=True)
+_MULTI_SPACE_RE = re.compile(r" {2,}")
+_CHINESE_SEGMENT_RE = re.compile(r"[\u4e00-\u9fff]+")
 
+# Built once at import (longest-match-first for sub-brands)
+_brand_matcher = PhraseMatcher(BRAND_TRANSLATIONS)
+_term_matcher = PhraseMatcher(TERM_TRANSLATIONS)
 
-def _rate_limit():
-    """Enforce 5 requests/second rate limit."""
-    global _last_request_time
-    with _rate_lock:
-        now = time.time()
-        elapsed = now - _last_request_time
-        if elapsed < RATE_LIMIT_DELAY:
-            time.sleep(RATE_LIMIT_DELAY - elapsed)
-        _last_request_time = time.time()
+
+def _get_translator() -> GoogleTranslator:
+    """This thread's GoogleTranslator, created on first use."""
+    translator = getattr(_translator_local, "translator", None)
+    if translator is None:
+        translator = _translator_local.translator = GoogleTranslator(source='zh-CN', target='en')
+    return translator
 
 
 def _apply_brand_mapping(text: str) -> str:
@@ -636,16 +981,10 @@ def _apply_brand_mapping(text: str) -> str:
 
     For example: "银河" must be matched before "吉利" to get "Geely Galaxy"
     """
-    result = text
-    for chinese in _sorted_brands:
-        if chinese in result:
-            english = BRAND_TRANSLATIONS[chinese]
-            # Add space after brand name if followed by Chinese or alphanumeric
-            result = result.replace(chinese, english + " ")
+    # Add space after brand name if followed by Chinese or alphanumeric
+    result = _brand_matcher.replace(text)
     # Clean up multiple spaces
-    while "  " in result:
-        result = result.replace("  ", " ")
-    return result.strip()
+    return _MULTI_SPACE_RE.sub(" ", result).strip()
 
 
 def _apply_term_mapping(text: str) -> str:
@@ -653,18 +992,35 @@ def _apply_term_mapping(text: str) -> str:
     Replace common Chinese automotive terms with English equivalents.
     Uses longest-match-first for proper handling.
     """
-    result = text
-    for chinese in _sorted_terms:
-        if chinese in result:
-            english = TERM_TRANSLATIONS[chinese]
-            if english:  # Only add space if there's actual replacement text
-                result = result.replace(chinese, english + " ")
-            else:
-                result = result.replace(chinese, " ")  # Just remove the Chinese char
+    # Terms with an empty translation (e.g. "款") are just removed
+    result = _term_matcher.replace(text)
     # Clean up multiple spaces
-    while "  " in result:
-        result = result.replace("  ", " ")
-    return result.strip()
+    return _MULTI_SPACE_RE.sub(" ", result).strip()
+
+
+def _apply_learned_mapping(text: str) -> str:
+    """
+    Replace Chinese segments found in the mined dictionary.
+    Runs after the curated mappings, so it only sees what they left.
+
+    Entries were mined as whole segments and only replace whole segments:
+    "汉" (BYD Han) must not turn "汉兰达" (Highlander) into "Han 兰达".
+    """
+    if not LEARNED_TRANSLATIONS:
+        return text
+
+    def substitute(match):
+        english = LEARNED_TRANSLATIONS.get(match.group())
+        return f" {english} " if english is not None else match.group()
+
+    result = _CHINESE_SEGMENT_RE.sub(substitute, text)
+    # Clean up multiple spaces
+    return _MULTI_SPACE_RE.sub(" ", result).strip()
+
+
+def _apply_mappings(text: str) -> str:
+    """Brand, term and learned mappings, in that order."""
+    return _apply_learned_mapping(_apply_term_mapping(_apply_brand_mapping(text)))
 
 
 def _post_process(text: str) -> str:
@@ -673,11 +1029,10 @@ def _post_process(text: str) -> str:
     Applies deterministic corrections for known mistranslations.
     Uses regex with word boundaries to avoid partial matches.
     """
-    result = text
-
-    # Apply regex-based patterns with word boundaries
-    for pattern, replacement in POST_PROCESS_PATTERNS:
-        result = re.sub(pattern, replacement, result)
+    # All word-boundary patterns in a single scan
+    result = _POST_PROCESS_RE.sub(
+        lambda m: _POST_PROCESS_REPLACEMENTS[m.lastindex], text
+    )
 
     # Apply simple string replacements
     for wrong, correct in POST_PROCESS_SIMPLE.items():
@@ -685,19 +1040,15 @@ def _post_process(text: str) -> str:
             result = result.replace(wrong, correct)
 
     # Clean up multiple spaces
-    while "  " in result:
-        result = result.replace("  ", " ")
-
-    return result.strip()
+    return _MULTI_SPACE_RE.sub(" ", result).strip()
 
 
 def _translate_with_retry(text: str) -> str:
     """Translate text with exponential backoff retry."""
     for attempt in range(MAX_RETRIES):
         try:
-            _rate_limit()
-            translator = GoogleTranslator(source='zh-CN', target='en')
-            result = translator.translate(text)
+            _rate_limiter.acquire()
+            result = _get_translator().translate(text)
             return result if result else text
         except TooManyRequests:
             delay = RETRY_DELAY_BASE * (2 ** attempt)
@@ -714,6 +1065,88 @@ def _translate_with_retry(text: str) -> str:
     return text
 
 
+def _has_chinese(text: str) -> bool:
+    return any('\u4e00' <= char <= '\u9fff' for char in text)
+
+
+def _translate_many(texts: list[str]) -> list[str]:
+    """
+    Translate several texts with as few requests as possible.
+
+    Texts are joined with newlines into chunks of up to
+    TRANSLATE_BATCH_MAX_CHARS and each chunk is sent as one request. If a
+    reply does not split back into the same number of lines, that chunk is
+    translated text by text instead.
+    """
+    chunks = []
+    chunk, size = [], 0
+    for text in texts:
+        if chunk and size + len(text) + 1 > TRANSLATE_BATCH_MAX_CHARS:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(text)
+        size += len(text) + 1
+    if chunk:
+        chunks.append(chunk)
+
+    results = []
+    for chunk in chunks:
+        if len(chunk) == 1:
+            results.append(_translate_with_retry(chunk[0]))
+            continue
+
+        joined = "\n".join(chunk)
+        translated = _translate_with_retry(joined)
+        if translated == joined:  # request failed, keep the mapped texts
+            results.extend(chunk)
+            continue
+
+        lines = translated.split("\n")
+        if len(lines) == len(chunk):
+            results.extend(lines)
+        else:
+            logging.warning(
+                f"Batch translation returned {len(lines)} lines for {len(chunk)} titles, "
+                "translating them one by one"
+            )
+            results.extend(_translate_with_retry(text) for text in chunk)
+    return results
+
+
+def _translate_segments(texts: list[str]) -> list[str]:
+    """
+    Translate the Chinese left in brand/term-mapped titles, fragment by fragment.
+
+    Che168 titles are compositional, so the fragments that survive the
+    mappings (model names, rare trim words) repeat across many titles.
+    Each fragment is looked up in the segment memory; only unknown ones
+    are sent to Google Translate (in one batched request) and remembered.
+    A title made of known fragments costs no external call at all.
+    """
+    segments = list(dict.fromkeys(
+        segment for text in texts for segment in _CHINESE_SEGMENT_RE.findall(text)
+    ))
+    known = _segments.get_many(segments)
+
+    unknown = [segment for segment in segments if not known.get(segment)]
+    if unknown:
+        learned = {}
+        for segment, english in zip(unknown, _translate_many(unknown)):
+            english = english.strip()
+            # Failed requests return the Chinese unchanged; don't remember those
+            if english and not _has_chinese(english):
+                learned[segment] = english
+        _segments.set_many(learned)
+        known.update(learned)
+        logging.info(f"Segment memory: {len(segments) - len(unknown)} known, {len(unknown)} translated")
+
+    def substitute(match):
+        english = known.get(match.group())
+        return f" {english} " if english else match.group()
+
+    return [_MULTI_SPACE_RE.sub(" ", _CHINESE_SEGMENT_RE.sub(substitute, text)).strip() for text in texts]
+
+
 def translate_car_title(chinese_text: str) -> str:
     """
     Translate Chinese car title to English with accurate brand names.
@@ -743,15 +1176,14 @@ def translate_car_title(chinese_text: str) -> str:
         # Step 1: Apply brand mapping (longest match first for sub-brands)
         result = _apply_brand_mapping(chinese_text)
 
-        # Step 2: Apply term mapping for model names and trim levels
-        result = _apply_term_mapping(result)
+        # Step 2: Apply term mapping for model names and trim levels,
+        # then fragments learned from earlier translations
+        result = _apply_learned_mapping(_apply_term_mapping(result))
 
         # Step 3: Check if any Chinese characters remain
-        has_chinese = any('\u4e00' <= char <= '\u9fff' for char in result)
-
-        if has_chinese:
-            # Translate remaining Chinese via Google Translate
-            result = _translate_with_retry(result)
+        if _has_chinese(result):
+            # Translate remaining Chinese fragments (segment memory, then Google Translate)
+            result = _translate_segments([result])[0]
 
         # Step 4: Post-process to fix common translation mistakes
         result = _post_process(result)
@@ -768,22 +1200,119 @@ def translate_car_title(chinese_text: str) -> str:
 
     except Exception as e:
         logging.error(f"Translation failed for '{chinese_text}': {e}")
-        # Fallback: return with brand and term mappings applied
-        fallback = _post_process(_apply_term_mapping(_apply_brand_mapping(chinese_text)))
+        # Fallback: return with brand, term and learned mappings applied
+        fallback = _post_process(_apply_mappings(chinese_text))
         return fallback
 
 
+# Title translations started by start_car_title_translation(), keyed by the
+# Chinese title; abandoned ones (quote never finished) simply expire
+_translation_pool = ThreadPoolExecutor(max_workers=TRANSLATION_WORKERS, thread_name_prefix="translate")
+_pending_translations = TTLCache(maxsize=1000, ttl=10 * 60)
+
+
+def preview_car_title(chinese_text: str) -> str:
+    """
+    Instant title for display: the cached translation if it is in memory,
+    otherwise the title with brand/term/learned mappings applied. No
+    network or database access.
+    """
+    if not chinese_text:
+        return chinese_text
+    chinese_text = chinese_text.strip()
+    cached = _cache.peek(chinese_text)
+    if cached:
+        return cached
+    return _post_process(_apply_mappings(chinese_text))
+
+
+def start_car_title_translation(chinese_text: str):
+    """Start the full translation of a title in the background."""
+    if not chinese_text:
+        return
+    chinese_text = chinese_text.strip()
+    if _cache.peek(chinese_text) or chinese_text in _pending_translations:
+        return
+    _pending_translations.set(chinese_text, _translation_pool.submit(translate_car_title, chinese_text))
+
+
+def get_car_title_translation(chinese_text: str, timeout: float = TRANSLATION_JOIN_TIMEOUT) -> str:
+    """
+    Full translation of a title, joining the background job started by
+    start_car_title_translation() if there is one. Falls back to the
+    preview if the translation takes longer than `timeout` seconds.
+    """
+    if not chinese_text:
+        return chinese_text
+    chinese_text = chinese_text.strip()
+    future = _pending_translations.pop(chinese_text)
+    if future is None:
+        return translate_car_title(chinese_text)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        logging.warning(f"Translation of '{chinese_text}' still running after {timeout}s, using preview")
+        return preview_car_title(chinese_text)
+
+
+def warm_cache(limit: int = MEMORY_CACHE_WARM_ROWS) -> int:
+    """Preload recent title and segment translations into memory (call once at startup)."""
+    return _cache.warm(limit) + _segments.warm(limit)
+
+
 def translate_batch(chinese_texts: list[str]) -> list[str]:
     """
     Translate multiple Chinese car titles to English.
 
+    Costs a handful of round trips however many titles are passed: one
+    cache lookup for all of them, one segment-memory lookup for the
+    Chinese fragments left after the brand/term mappings, one translation
+    request per TRANSLATE_BATCH_MAX_CHARS of unknown fragments, and one
+    upsert each for the new segments and titles. Duplicate titles are
+    translated once.
+
     Args:
         chinese_texts: List of Chinese car titles
 
     Returns:
         List of English translations in the same order
     """
-    return [translate_car_title(text) for text in chinese_texts]
+    titles = [text.strip() if text else text for text in chinese_texts]
+    unique = list(dict.fromkeys(title for title in titles if title))
+    if not unique:
+        return titles
+
+    translations = _cache.get_many(unique)
+    misses = [title for title in unique if not translations.get(title)]
+
+    if misses:
+        # Local mappings first, so only the remaining Chinese is sent out
+        mapped = {}
+        for title in misses:
+            try:
+                mapped[title] = _apply_mappings(title).replace("\n", " ")
+            except Exception as e:
+                logging.error(f"Translation failed for '{title}': {e}")
+                mapped[title] = title
+
+        residual = [title for title in misses if _has_chinese(mapped[title])]
+        if residual:
+            translated = _translate_segments([mapped[title] for title in residual])
+            mapped.update(zip(residual, translated))
+
+        fresh = {}
+        for title in misses:
+            result = _post_process(mapped[title])
+            translations[title] = result
+            if result and result != title:
+                fresh[title] = result
+        _cache.set_many(fresh)
+        logging.info(
+            f"Translated batch of {len(unique)} titles: {len(unique) - len(misses)} cached, "
+            f"{len(residual)} with Chinese fragments left after mapping"
+        )
+
+    return [translations.get(title, title) if title else title for title in titles]
 
 
 # For testing
@@ -0,0 +1,250 @@
+"""
+Shared PostgreSQL connection pool.
+
+Every module that talks to Heroku Postgres borrows a connection from here
+instead of opening its own psycopg2.connect() per query, so a lookup costs
+one round trip instead of a full TCP + TLS + auth handshake.
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_values
+
+# Configuration
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "1"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "10"))
+DB_POOL_CHECKOUT_TIMEOUT = 30  # seconds to wait for a free connection
+DB_HEALTH_CHECK_IDLE = 60  # ping connections that sat idle longer than this
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DB_POOL_MAX_CONN)
+_last_used = {}  # id(conn) -> time.monotonic() of last checkin
+
+
+def get_database_url():
+    """Read DATABASE_URL lazily so load_dotenv() in main.py is honoured."""
+    return os.getenv("DATABASE_URL")
+
+
+def is_configured() -> bool:
+    """True if a database is configured for this process."""
+    return bool(get_database_url())
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(
+                    DB_POOL_MIN_CONN,
+                    DB_POOL_MAX_CONN,
+                    get_database_url(),
+                    sslmode="require",
+                )
+                logging.info(
+                    f"PostgreSQL pool created ({DB_POOL_MIN_CONN}-{DB_POOL_MAX_CONN} connections)"
+                )
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    """
+    Check that a pooled connection is still usable.
+
+    Connections that were used recently are trusted without a round trip;
+    only ones idle longer than DB_HEALTH_CHECK_IDLE get a SELECT 1, since
+    Heroku drops idle server-side sessions.
+    """
+    if conn.closed:
+        return False
+
+    last_used = _last_used.get(id(conn))
+    if last_used is not None and time.monotonic() - last_used < DB_HEALTH_CHECK_IDLE:
+        return True
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _checkout(db_pool):
+    """Get a healthy connection, replacing dead ones transparently."""
+    for _ in range(DB_POOL_MAX_CONN + 1):
+        conn = db_pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        logging.warning("Discarding dead PostgreSQL connection, reconnecting")
+        _last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("Could not obtain a healthy PostgreSQL connection")
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a pooled connection for the duration of a ``with`` block.
+
+    Commits on success, rolls back on error, and drops the connection from
+    the pool if it broke while in use so the next caller gets a fresh one.
+
+    Usage:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(...)
+    """
+    if not _slots.acquire(timeout=DB_POOL_CHECKOUT_TIMEOUT):
+        raise pool.PoolError("Timed out waiting for a PostgreSQL connection")
+
+    conn = None
+    try:
+        db_pool = _get_pool()
+        conn = _checkout(db_pool)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    pass
+            raise
+        finally:
+            broken = bool(conn.closed)
+            if broken:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            db_pool.putconn(conn, close=broken)
+    finally:
+        _slots.release()
+
+
+def close_pool():
+    """Close every pooled connection (used on shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+class BatchWriter:
+    """
+    Buffer row writes in memory and flush them from a background thread.
+
+    Rows are sent with a single multi-row statement per batch via
+    execute_values, so handler threads never wait on PostgreSQL and a burst
+    of writes costs one round trip per batch.
+
+    Usage:
+        writer = BatchWriter(
+            "INSERT INTO users (user_id, username) VALUES %s ON CONFLICT DO NOTHING",
+            name="users",
+        )
+        writer.put((user_id, username))
+    """
+
+    def __init__(self, statement, name="batch", batch_size=200, flush_interval=1.0, max_queue=10000):
+        """
+        :param statement: SQL with a single ``VALUES %s`` placeholder
+        :param name: Label used in logs and the thread name
+        :param batch_size: Maximum rows per INSERT
+        :param flush_interval: Seconds to wait for more rows before flushing
+        :param max_queue: Rows buffered before put() starts dropping writes
+        """
+        self.statement = statement
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def put(self, row) -> bool:
+        """Queue a row for writing. Returns False if the buffer is full."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            logging.error(f"{self.name} writer queue full, dropping row")
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _drain(self, first_row):
+        batch = [first_row]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, self.statement, batch, page_size=self.batch_size)
+            logging.debug(f"{self.name} writer flushed {len(batch)} rows")
+        except Exception as e:
+            logging.error(f"{self.name} writer failed to flush {len(batch)} rows: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                row = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._write(self._drain(row))
+
+    def flush(self):
+        """Synchronously write everything currently buffered."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """Stop the background thread and flush what is left."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
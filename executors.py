@@ -0,0 +1,140 @@
+"""
+Bounded executor for slow handler work.
+
+Quote calculations (Encar/Che168 scraping, translation, calcus.ru, photos)
+can hold a thread for a minute, so they run on their own pool instead of
+the bot's handler threads. That keeps menus and other light updates
+responsive however many quotes are in flight. The pool has a fixed number
+of workers and a bounded backlog; submit() refuses work when the backlog is
+full so the caller can tell the user to retry instead of queueing forever.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor with a cap on running + queued jobs."""
+
+    def __init__(self, name, workers=4, max_pending=20):
+        """
+        :param name: Label used in logs and worker thread names
+        :param workers: Jobs that run concurrently
+        :param max_pending: Jobs that may wait for a worker before submit() refuses
+        """
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def submit(self, fn, *args, **kwargs) -> bool:
+        """Schedule fn(*args, **kwargs). Returns False if the backlog is full."""
+        if not self._slots.acquire(blocking=False):
+            logging.warning(f"{self.name} executor full, rejecting {fn.__name__}")
+            return False
+        with self._lock:
+            self._active += 1
+        try:
+            self._executor.submit(self._run, fn, args, kwargs)
+        except RuntimeError:
+            self._release()
+            raise
+        return True
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+        self._slots.release()
+
+    def _run(self, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            logging.exception(f"{self.name} job {fn.__name__} failed: {e}")
+        finally:
+            self._release()
+
+    @property
+    def pending(self) -> int:
+        """Jobs running or waiting for a worker."""
+        with self._lock:
+            return self._active
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_current_job = threading.local()
+
+
+class JobSlots:
+    """
+    One in-flight job per owner (e.g. per chat), newest wins.
+
+    claim() hands out a generation token; claiming again for the same owner
+    supersedes the previous token. Jobs started through run() can call
+    job_superseded() at their checkpoints and stop early once a newer job
+    has been claimed, instead of finishing work nobody will read. Claiming
+    with the same key as the job already in flight is treated as a
+    duplicate and refused.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}  # owner -> (token, key)
+        self._counter = 0
+
+    def claim(self, owner, key=None):
+        """Return a new token for owner, or None if `key` is already in flight."""
+        with self._lock:
+            current = self._slots.get(owner)
+            if key is not None and current is not None and current[1] == key:
+                return None
+            self._counter += 1
+            self._slots[owner] = (self._counter, key)
+            return self._counter
+
+    def is_current(self, owner, token) -> bool:
+        with self._lock:
+            current = self._slots.get(owner)
+            return current is not None and current[0] == token
+
+    def release(self, owner, token):
+        """Free the slot if token still owns it."""
+        with self._lock:
+            current = self._slots.get(owner)
+            if current is not None and current[0] == token:
+                del self._slots[owner]
+
+    def run(self, owner, token, fn, *args, **kwargs):
+        """Run fn as owner's job unless it was superseded while queued."""
+        if not self.is_current(owner, token):
+            logging.info(f"Skipping superseded job {fn.__name__} for {owner}")
+            return
+        _current_job.slot = (self, owner, token)
+        try:
+            fn(*args, **kwargs)
+        finally:
+            _current_job.slot = None
+            self.release(owner, token)
+
+
+def job_superseded() -> bool:
+    """
+    True if the job running on this thread has been replaced by a newer one.
+
+    Always False outside JobSlots.run(), so checkpoints are harmless when a
+    function is called directly.
+    """
+    slot = getattr(_current_job, "slot", None)
+    if slot is None:
+        return False
+    slots, owner, token = slot
+    if slots.is_current(owner, token):
+        return False
+    logging.info(f"Job for {owner} superseded, stopping early")
+    return True
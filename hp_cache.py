@@ -0,0 +1,225 @@
+"""
+In-memory index over the car_hp_cache table.
+
+The table is small and append-mostly, so the whole thing is loaded into a
+dict at startup and HP lookups on the Encar URL path become dict lookups.
+Saves are written through to PostgreSQL and the index is periodically
+resynced to pick up rows written by other processes.
+"""
+
+import time
+import logging
+import threading
+
+from db import get_connection, is_configured
+
+HP_CACHE_RESYNC_INTERVAL = 15 * 60  # seconds between full reloads
+
+# Fuzzy matching tolerances for find_nearest()
+HP_MATCH_MAX_CC_DELTA = 50  # e.g. 1998cc vs 1999cc is the same engine
+HP_MATCH_MAX_YEAR_DELTA = 1  # neighbouring model years usually share engines
+HP_MATCH_MIN_CONFIDENCE = 0.7  # below this the user is asked for HP
+
+
+class HPCache:
+    """Write-through in-memory cache of car_hp_cache rows."""
+
+    def __init__(self):
+        self._index = {}  # (manufacturer, model, engine_volume, year) -> horsepower
+        self._by_model = {}  # (manufacturer, model) -> [(engine_volume, year, horsepower)]
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_load_attempt = None  # time.monotonic() of the last load()
+        self._loads_in_flight = 0
+        self._saves_during_load = []  # (key, horsepower) saved while a load was running
+        self._resync_thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _key(manufacturer, model, engine_volume, year):
+        return (manufacturer, model, int(engine_volume), int(year))
+
+    @staticmethod
+    def _apply(index, by_model, key, horsepower):
+        previous = index.get(key)
+        index[key] = horsepower
+        entries = by_model.setdefault(key[:2], [])
+        if previous is not None:
+            entries.remove((key[2], key[3], previous))
+        entries.append((key[2], key[3], horsepower))
+
+    def _ensure_loaded(self):
+        """Load lazily, retrying a failed load at most once per resync interval."""
+        if self._loaded:
+            return
+        last_attempt = self._last_load_attempt
+        if last_attempt is not None and time.monotonic() - last_attempt < HP_CACHE_RESYNC_INTERVAL:
+            return
+        self.load()
+
+    def _finish_load(self):
+        # Called under self._lock
+        self._loads_in_flight -= 1
+        if not self._loads_in_flight:
+            self._saves_during_load = []
+
+    def _ensure_table(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS car_hp_cache (
+                manufacturer VARCHAR NOT NULL,
+                model VARCHAR NOT NULL,
+                engine_volume INTEGER NOT NULL,
+                year INTEGER NOT NULL,
+                horsepower INTEGER NOT NULL,
+                PRIMARY KEY (manufacturer, model, engine_volume, year)
+            )
+        """)
+
+    def load(self) -> int:
+        """
+        (Re)load the whole table into memory.
+
+        Returns:
+            Number of rows in the index after loading
+        """
+        if not is_configured():
+            return 0
+
+        with self._lock:
+            self._last_load_attempt = time.monotonic()
+            self._loads_in_flight += 1
+
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self._ensure_table(cursor)
+                    cursor.execute(
+                        "SELECT manufacturer, model, engine_volume, year, horsepower FROM car_hp_cache"
+                    )
+                    rows = cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Error loading HP cache: {e}")
+            with self._lock:
+                self._finish_load()
+                return len(self._index)
+
+        index = {
+            self._key(manufacturer, model, engine_volume, year): horsepower
+            for manufacturer, model, engine_volume, year, horsepower in rows
+        }
+        by_model = {}
+        for (manufacturer, model, engine_volume, year), horsepower in index.items():
+            by_model.setdefault((manufacturer, model), []).append((engine_volume, year, horsepower))
+        with self._lock:
+            # Saves that landed after the SELECT aren't in the snapshot
+            for key, horsepower in self._saves_during_load:
+                self._apply(index, by_model, key, horsepower)
+            self._index = index
+            self._by_model = by_model
+            self._loaded = True
+            self._finish_load()
+        logging.info(f"HP cache loaded: {len(index)} entries")
+        return len(index)
+
+    def get(self, manufacturer, model, engine_volume, year):
+        """Look up HP by Make+Model+Engine+Year, or None if unknown."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._index.get(self._key(manufacturer, model, engine_volume, year))
+
+    def find_nearest(
+        self,
+        manufacturer,
+        model,
+        engine_volume,
+        year,
+        max_cc_delta=HP_MATCH_MAX_CC_DELTA,
+        max_year_delta=HP_MATCH_MAX_YEAR_DELTA,
+    ):
+        """
+        Find the closest known HP for the same make/model.
+
+        Candidates must be within `max_cc_delta` cc and `max_year_delta`
+        years. Confidence is 1.0 for an exact match and drops with the
+        displacement and year distance; it is also reduced when equally
+        close candidates disagree on HP.
+
+        Returns:
+            (horsepower, confidence) tuple, or None if nothing is close enough
+        """
+        self._ensure_loaded()
+
+        engine_volume = int(engine_volume)
+        year = int(year)
+        with self._lock:
+            entries = list(self._by_model.get((manufacturer, model), ()))
+
+        scored = []
+        for cand_volume, cand_year, cand_hp in entries:
+            cc_delta = abs(cand_volume - engine_volume)
+            year_delta = abs(cand_year - year)
+            if cc_delta > max_cc_delta or year_delta > max_year_delta:
+                continue
+            confidence = 1.0
+            if cc_delta:
+                confidence -= 0.1 + 0.2 * cc_delta / max_cc_delta
+            if year_delta:
+                confidence -= 0.15 * year_delta
+            scored.append((confidence, cand_hp))
+
+        if not scored:
+            return None
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        best_confidence, best_hp = scored[0]
+        rivals = {hp for conf, hp in scored if conf == best_confidence}
+        if len(rivals) > 1:
+            best_confidence -= 0.2
+        return best_hp, round(max(best_confidence, 0.0), 2)
+
+    def save(self, manufacturer, model, engine_volume, year, horsepower):
+        """Write HP to PostgreSQL and update the in-memory index."""
+        key = self._key(manufacturer, model, engine_volume, year)
+        if is_configured():
+            try:
+                with get_connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("""
+                            INSERT INTO car_hp_cache (manufacturer, model, engine_volume, year, horsepower)
+                            VALUES (%s, %s, %s, %s, %s)
+                            ON CONFLICT (manufacturer, model, engine_volume, year)
+                            DO UPDATE SET horsepower = EXCLUDED.horsepower
+                        """, (*key, horsepower))
+            except Exception as e:
+                logging.error(f"Error saving HP to cache: {e}")
+                return False
+
+        with self._lock:
+            self._apply(self._index, self._by_model, key, horsepower)
+            if self._loads_in_flight:
+                self._saves_during_load.append((key, horsepower))
+        logging.info(f"Saved HP to cache: {manufacturer} {model} {engine_volume}cc {year} -> {horsepower} HP")
+        return True
+
+    def start_resync(self, interval=HP_CACHE_RESYNC_INTERVAL):
+        """Reload the index every `interval` seconds in a daemon thread."""
+        if self._resync_thread is not None:
+            return
+
+        def _loop():
+            while not self._stop.wait(interval):
+                self.load()
+
+        self._resync_thread = threading.Thread(target=_loop, name="hp-cache-resync", daemon=True)
+        self._resync_thread.start()
+
+    def stop_resync(self):
+        self._stop.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+
+# Global cache instance
+hp_cache = HPCache()
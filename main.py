@@ -2,7 +2,6 @@ import threading
 import time
 import telebot
 from telebot import apihelper
-import psycopg2
 import os
 import re
 import requests
@@ -16,10 +15,28 @@ from io import BytesIO
 from telebot import types
 from dotenv import load_dotenv
 from urllib.parse import urlparse, parse_qs
+from cache import TTLCache
+from quotes import KoreaQuote, ChinaQuote, load_quote, new_quote_id
+from state import StateStore, StateHandlerBackend, create_backend as create_state_backend
+from db import get_connection, BatchWriter
+from broadcast import BroadcastEngine, BroadcastMessage, ensure_tables as ensure_broadcast_tables
+from hp_cache import hp_cache, HP_MATCH_MIN_CONFIDENCE
+from webhook_server import WebhookServer
+from executors import BoundedExecutor, JobSlots, job_superseded
+from router import Router
+from user_stats import (
+    USERS_PER_PAGE,
+    STATS_EPOCH,
+    ensure_users_table,
+    encode_stats_cursor,
+    decode_stats_cursor,
+    fetch_stats_page,
+)
 from get_google_krwrub_rate import get_krwrub_rate
 from get_google_usdrub_rate import get_usdrub_rate
 from get_google_fees import get_russia_fees
 from get_vtb_cnyrub_rate import get_vtb_cnyrub_rate
+from chinese_translator import warm_cache as warm_translation_cache, get_car_title_translation
 from che168_scraper import (
     get_che168_car_info,
     get_che168_car_info_with_fallback,
@@ -50,11 +67,13 @@ from utils import (
     FUEL_TYPE_NAMES,
     compute_turnkey_total,
     compute_broker_fee,
-    AGENT_FEE_RUB,
-    DEALER_KRW,
-    KOREA_DELIVERY_KRW,
-    TRANSFER_TO_PORT_KRW,
-    SEA_FREIGHT_USD,
+    CHINA_FIRST_PAYMENT,
+    CHINA_DEALER_FEE,
+    CHINA_DELIVERY,
+    CHINA_BROKER_FEE,
+    CHINA_AGENT_FEE,
+    CHINA_SVH_FEE,
+    CHINA_LAB_FEE,
 )
 
 
@@ -82,18 +101,6 @@ def is_menu_button(text):
     """Check if text matches any menu button."""
     return text in MENU_BUTTON_TEXTS
 
-# China constants
-CHINA_DEPOSIT = 5000           # ¥5,000 задаток
-CHINA_EXPERT_REPORT = 1600     # ¥1,600 отчет эксперта
-CHINA_FIRST_PAYMENT = 6600     # ¥6,600 итого первая часть
-CHINA_DEALER_FEE = 3000        # ¥3,000 дилерский сбор
-CHINA_DELIVERY = 15000         # ¥15,000 доставка + оформление
-CHINA_BROKER_FEE = 60000       # ₽60,000 брокер (фиксированная)
-CHINA_AGENT_FEE = 50000        # ₽50,000 агентские услуги
-CHINA_SVH_FEE = 50000          # ₽50,000 СВХ
-CHINA_LAB_FEE = 30000          # ₽30,000 лаборатория
-DATABASE_URL = os.getenv("DATABASE_URL")
-
 # Список User-Agent'ов (можно дополнять)
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -123,6 +130,24 @@ logging.basicConfig(
 # Load keys from .env file
 load_dotenv()
 bot_token = os.getenv("BOT_TOKEN")
+# "polling" (default) or "webhook"; webhook mode also needs WEBHOOK_URL
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Handler threads for light updates (menus, callbacks) and workers for quote
+# calculations, which can take a minute each and run on their own pool.
+LIGHT_WORKERS = int(os.getenv("LIGHT_WORKERS", "4"))
+QUOTE_WORKERS = int(os.getenv("QUOTE_WORKERS", "4"))
+QUOTE_QUEUE_SIZE = int(os.getenv("QUOTE_QUEUE_SIZE", "20"))
+# Per-user state backend: STATE_BACKEND=memory (default) or postgres, so
+# conversations survive restarts and can be shared by several processes.
+# Entries expire after STATE_TTL of inactivity (half-finished inputs after
+# PENDING_INPUT_TTL); the memory backend also caps the number of users.
+PENDING_INPUT_TTL = 6 * 60 * 60
+state_backend = create_state_backend()
+
+QUOTE_BUSY_TEXT = (
+    "⏳ Сейчас бот обрабатывает много расчётов. Пожалуйста, повторите запрос через минуту."
+)
 
 
 class BotExceptionHandler(telebot.ExceptionHandler):
@@ -131,19 +156,36 @@ class BotExceptionHandler(telebot.ExceptionHandler):
         return True
 
 
-bot = telebot.TeleBot(bot_token, exception_handler=BotExceptionHandler())
+# In webhook mode WebhookServer's own worker pool runs the handlers, so the
+# bot must not hand them off to a second thread pool.
+bot = telebot.TeleBot(
+    bot_token,
+    exception_handler=BotExceptionHandler(),
+    threaded=BOT_MODE != "webhook",
+    num_threads=LIGHT_WORKERS,
+    next_step_backend=StateHandlerBackend(
+        StateStore("next_step_handlers", state_backend, ttl=PENDING_INPUT_TTL)
+    ),
+)
 apihelper.SESSION_TIME_TO_LIVE = 5 * 60  # Recreate HTTP session every 5 min to prevent ConnectionResetError
+broadcast_engine = BroadcastEngine(bot)
+quote_executor = BoundedExecutor("quote", workers=QUOTE_WORKERS, max_pending=QUOTE_QUEUE_SIZE)
+quote_slots = JobSlots()  # one in-flight quote per chat; a new one supersedes it
+
+# callback_data / message text -> handler (see handle_callback_query, handle_message)
+callback_router = Router("callback")
+message_router = Router("message")
+
+ENCAR_URL_RE = re.compile(r"^https?://(www|fem)\.encar\.com/.*")
 
 # Set locale for number formatting
 locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
 
 # Storage for the last error message ID
-last_error_message_id = {}
+last_error_message_id = StateStore("last_error_message_id", state_backend)
 
 # global variables (per-user state keyed by user_id)
-car_data = {}  # user_id -> {detail fields}
-user_manual_input = {}
-car_id_external = {}  # user_id -> car_id string
+user_manual_input = StateStore("user_manual_input", state_backend, ttl=PENDING_INPUT_TTL)
 users = set()
 admins = [728438182, 7311646338, 490148761, 463460708]  # админы
 
@@ -154,20 +196,20 @@ rub_to_krw_rate = None
 cny_rub_rate = None  # CNY to RUB rate for Chinese cars
 russia_fees = {"svh_rub": 35000, "lab_rub": 20000, "perm_registration_rub": 8000}
 
-vehicle_id = {}  # user_id -> vehicle_id
-vehicle_no = {}  # user_id -> vehicle_no
 
 # Pending HP requests for users (when pan-auto.ru doesn't have the car)
-pending_hp_requests = {}
+pending_hp_requests = StateStore("pending_hp_requests", state_backend, ttl=PENDING_INPUT_TTL)
 
 # Storage for China manual calculation
-user_manual_china_input = {}
+user_manual_china_input = StateStore("user_manual_china_input", state_backend, ttl=PENDING_INPUT_TTL)
 
 # Pending HP requests for China cars
-pending_china_hp_requests = {}
+pending_china_hp_requests = StateStore("pending_china_hp_requests", state_backend, ttl=PENDING_INPUT_TTL)
 
-# Storage for passable (проходная) recalculation data
-pending_passable_data = {}  # user_id -> {lowCosts values + car params for recalc}
+# Finished quotes by quote id (see save_quote); the buttons under a quote
+# carry its id in callback_data, so they keep working for older messages
+QUOTE_TTL = 7 * 24 * 60 * 60
+quote_store = StateStore("quotes", state_backend, ttl=QUOTE_TTL)
 
 
 def create_fuel_type_keyboard():
@@ -197,43 +239,26 @@ def extract_car_id_from_url(url):
 
 
 def get_cached_hp(manufacturer, model, engine_volume, year):
-    """Look up HP from cache by Make+Model+Engine+Year"""
-    conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            SELECT horsepower FROM car_hp_cache
-            WHERE manufacturer = %s AND model = %s
-            AND engine_volume = %s AND year = %s
-        """, (manufacturer, model, engine_volume, year))
-        result = cursor.fetchone()
-        return result[0] if result else None
-    except Exception as e:
-        logging.error(f"Error getting cached HP: {e}")
+    """Look up HP from cache by Make+Model+Engine+Year (served from memory)"""
+    return hp_cache.get(manufacturer, model, engine_volume, year)
+
+
+def find_known_hp(manufacturer, model, engine_volume, year):
+    """
+    Find HP for a car from the cache, allowing nearby engine sizes and years.
+    Returns (hp, confidence) or None when no sufficiently close match exists.
+    """
+    if not (manufacturer and model and engine_volume and year):
         return None
-    finally:
-        cursor.close()
-        conn.close()
+    match = hp_cache.find_nearest(manufacturer, model, engine_volume, year)
+    if match and match[1] >= HP_MATCH_MIN_CONFIDENCE:
+        return match
+    return None
 
 
 def save_hp_to_cache(manufacturer, model, engine_volume, year, horsepower):
     """Save HP to cache for future lookups (only called by trusted sources)"""
-    conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            INSERT INTO car_hp_cache (manufacturer, model, engine_volume, year, horsepower)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (manufacturer, model, engine_volume, year)
-            DO UPDATE SET horsepower = EXCLUDED.horsepower
-        """, (manufacturer, model, engine_volume, year, horsepower))
-        conn.commit()
-        logging.info(f"Saved HP to cache: {manufacturer} {model} {engine_volume}cc {year} -> {horsepower} HP")
-    except Exception as e:
-        logging.error(f"Error saving HP to cache: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+    hp_cache.save(manufacturer, model, engine_volume, year, horsepower)
 
 
 def is_valid_hp(hp_value):
@@ -258,52 +283,34 @@ def has_valid_customs(costs_rub):
 
 
 # Настройка базы данных
-import psycopg2
-from psycopg2 import sql
 from telebot import types
 
-# Подключение к базе данных
-DATABASE_URL = os.getenv("DATABASE_URL")
-conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-cursor = conn.cursor()
+# Подключение к базе данных (через общий пул соединений)
+with get_connection() as conn:
+    with conn.cursor() as cursor:
+        ensure_users_table(cursor)
+ensure_broadcast_tables()
 print("✅ Успешное подключение к БД")
 
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        user_id BIGINT PRIMARY KEY,
-        username VARCHAR,
-        first_name VARCHAR,
-        phone_number VARCHAR,
-        created_at TIMESTAMP DEFAULT NOW()
-    );
-""")
-conn.commit()
+
+# Фоновая пакетная запись пользователей (не блокирует обработчик /start)
+user_writer = BatchWriter(
+    """
+    INSERT INTO users (user_id, username, first_name, phone_number)
+    VALUES %s
+    ON CONFLICT (user_id) DO NOTHING;
+    """,
+    name="users",
+)
 
 
 def save_user_to_db(user_id, username, first_name, phone_number):
-    """Сохраняет пользователя в базу данных."""
+    """Ставит пользователя в очередь на сохранение в базу данных."""
     if username is None or phone_number is None:
         return  # Пропускаем пользователей с скрытыми данными
 
-    try:
-        conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-        cursor = conn.cursor()
-
-        # SQL-запрос для вставки данных
-        query = sql.SQL(
-            """
-            INSERT INTO users (user_id, username, first_name, phone_number)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (user_id) DO NOTHING;
-        """
-        )
-
-        cursor.execute(query, (user_id, username, first_name, phone_number))
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print(f"Ошибка при сохранении пользователя: {e}")
+    if not user_writer.put((user_id, username, first_name, phone_number)):
+        print(f"Ошибка при сохранении пользователя: очередь записи переполнена ({user_id})")
 
 
 @bot.message_handler(commands=["start"])
@@ -338,56 +345,63 @@ def show_statistics(message):
         return
     
     # Отправляем первую страницу статистики
-    send_stats_page(user_id, page=1)
+    send_stats_page(user_id)
 
 
-def send_stats_page(chat_id, page=1, message_id=None):
-    """Отправляет страницу статистики с пагинацией"""
-    USERS_PER_PAGE = 20
-    
+USER_COUNT_TTL = 60  # секунд кэшируем общее количество пользователей
+
+_user_count_cache = {"value": None, "fetched_at": 0.0}
+_user_count_lock = threading.Lock()
+
+
+def get_total_users(cursor):
+    """Возвращает количество пользователей (COUNT(*) не чаще раза в минуту)."""
+    with _user_count_lock:
+        if (
+            _user_count_cache["value"] is not None
+            and time.monotonic() - _user_count_cache["fetched_at"] < USER_COUNT_TTL
+        ):
+            return _user_count_cache["value"]
+
+    cursor.execute("SELECT COUNT(*) FROM users;")
+    total = cursor.fetchone()[0]
+
+    with _user_count_lock:
+        _user_count_cache["value"] = total
+        _user_count_cache["fetched_at"] = time.monotonic()
+    return total
+
+
+def send_stats_page(chat_id, message_id=None, cursor_key=None, direction="next"):
+    """
+    Отправляет страницу статистики с keyset-пагинацией по (created_at, user_id).
+
+    :param cursor_key: граничная строка (created_at, user_id) соседней страницы;
+        None — первая страница
+    :param direction: "next" — строки старше cursor_key, "prev" — новее
+    """
     try:
-        conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-        cursor = conn.cursor()
-        
-        # Получаем общее количество пользователей
-        cursor.execute("SELECT COUNT(*) FROM users;")
-        total_users = cursor.fetchone()[0]
-        
-        if total_users == 0:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                # Получаем общее количество пользователей (кэшируется)
+                total_users = get_total_users(cursor)
+                users, rank, has_next = fetch_stats_page(cursor, cursor_key, direction)
+
+        if total_users == 0 or not users:
             bot.send_message(chat_id, "📊 В базе пока нет пользователей.")
-            cursor.close()
-            conn.close()
             return
-        
-        # Вычисляем количество страниц
-        total_pages = (total_users + USERS_PER_PAGE - 1) // USERS_PER_PAGE
-        
-        # Проверяем корректность номера страницы
-        if page < 1:
-            page = 1
-        elif page > total_pages:
-            page = total_pages
-        
-        # Вычисляем offset для запроса
-        offset = (page - 1) * USERS_PER_PAGE
-        
-        # Получаем пользователей для текущей страницы (сортировка по дате, самые новые первыми)
-        cursor.execute(
-            "SELECT user_id, username, first_name, created_at FROM users "
-            "ORDER BY created_at DESC LIMIT %s OFFSET %s;",
-            (USERS_PER_PAGE, offset)
-        )
-        users = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
+
+        # Номер страницы — по позиции первой строки, а не по нажатой кнопке
+        page = rank // USERS_PER_PAGE + 1
+        total_pages = max((total_users + USERS_PER_PAGE - 1) // USERS_PER_PAGE, page)
+
         # Формируем сообщение со статистикой
         stats_message = f"📊 <b>Статистика пользователей</b>\n"
         stats_message += f"👥 Всего пользователей: <b>{total_users}</b>\n"
         stats_message += f"📄 Страница <b>{page}/{total_pages}</b>\n\n"
         
         # Вычисляем правильную нумерацию (учитывая обратный порядок)
-        start_num = offset + 1
+        start_num = rank + 1
         
         for idx, user in enumerate(users):
             user_id_db, username, first_name, created_at = user
@@ -398,9 +412,10 @@ def send_stats_page(chat_id, page=1, message_id=None):
             else:
                 first_name = "Без имени"
             
+            joined = created_at.strftime('%Y-%m-%d') if created_at != STATS_EPOCH else "—"
             user_info = (
                 f"👤 <b>{start_num + idx}.</b> {first_name} ({username_text}) — "
-                f"{created_at.strftime('%Y-%m-%d')}\n"
+                f"{joined}\n"
             )
             stats_message += user_info
         
@@ -409,10 +424,11 @@ def send_stats_page(chat_id, page=1, message_id=None):
         buttons = []
         
         # Кнопка "Назад"
-        if page > 1:
+        if rank > 0:
+            first_key = encode_stats_cursor(users[0][3], users[0][0])
             buttons.append(types.InlineKeyboardButton(
                 "⬅️ Назад", 
-                callback_data=f"stats_page_{page-1}"
+                callback_data=f"stats_prev_{first_key}"
             ))
         
         # Кнопка с номером страницы (неактивная)
@@ -422,10 +438,11 @@ def send_stats_page(chat_id, page=1, message_id=None):
         ))
         
         # Кнопка "Вперед"
-        if page < total_pages:
+        if has_next:
+            last_key = encode_stats_cursor(users[-1][3], users[-1][0])
             buttons.append(types.InlineKeyboardButton(
                 "Вперед ➡️", 
-                callback_data=f"stats_page_{page+1}"
+                callback_data=f"stats_next_{last_key}"
             ))
         
         if buttons:
@@ -457,8 +474,20 @@ def send_stats_page(chat_id, page=1, message_id=None):
         logging.error(f"Ошибка статистики: {e}")
 
 
-def is_subscribed(user_id):
+SUBSCRIPTION_POSITIVE_TTL = 10 * 60  # подписан — не перепроверяем 10 минут
+SUBSCRIPTION_NEGATIVE_TTL = 30  # не подписан — перепроверяем через 30 секунд
+
+# user_id -> bool, чтобы не дёргать get_chat_member на каждое сообщение
+subscription_cache = TTLCache(maxsize=50000, ttl=SUBSCRIPTION_POSITIVE_TTL)
+
+
+def is_subscribed(user_id, use_cache=True):
     """Проверяет, подписан ли пользователь на канал GetAuto"""
+    if use_cache:
+        cached = subscription_cache.get(user_id)
+        if cached is not None:
+            return cached
+
     channel_username = "@Getauto_kor"
     try:
         chat_member = bot.get_chat_member(channel_username, user_id)
@@ -468,6 +497,11 @@ def is_subscribed(user_id):
         # Проверяем все возможные статусы участника канала
         is_member = status in ["member", "administrator", "creator", "owner"]
         print(f"Результат проверки подписки: {is_member}")
+        subscription_cache.set(
+            user_id,
+            is_member,
+            ttl=SUBSCRIPTION_POSITIVE_TTL if is_member else SUBSCRIPTION_NEGATIVE_TTL,
+        )
         return is_member
 
     except Exception as e:
@@ -483,6 +517,17 @@ def print_message(message):
     return None
 
 
+BROADCAST_ALBUM_WAIT = 1.5  # секунд ждём остальные части альбома
+
+# Черновики рассылки: admin chat_id -> {"media_group_id", "parts": [BroadcastMessage.album_part()]}.
+# Запись есть, пока ждём содержимое рассылки (части альбома идут мимо next_step_handler).
+# Хранится в state store, чтобы перезапуск посреди альбома не терял черновик.
+broadcast_drafts = StateStore("broadcast_drafts", state_backend, ttl=PENDING_INPUT_TTL)
+broadcast_drafts_lock = threading.Lock()
+# admin chat_id -> threading.Timer, который завершит альбом (только в этом процессе)
+broadcast_album_timers = {}
+
+
 @bot.message_handler(commands=["setbroadcast"])
 def set_broadcast(message):
     """Команда для запуска рассылки вручную"""
@@ -490,51 +535,101 @@ def set_broadcast(message):
         bot.send_message(message.chat.id, "🚫 У вас нет прав для запуска рассылки.")
         return
 
-    bot.send_message(message.chat.id, "✍️ Введите текст рассылки:")
+    bot.send_message(
+        message.chat.id,
+        "✍️ Введите текст рассылки или отправьте фото, видео или альбом (с подписью):",
+    )
+    broadcast_drafts[message.chat.id] = {"media_group_id": None, "parts": []}
     bot.register_next_step_handler(message, process_broadcast)
 
 
 def process_broadcast(message):
-    """Обрабатывает введённый текст и запускает рассылку"""
-    text = message.text
-    bot.send_message(message.chat.id, f"📢 Начинаю рассылку...\n\n{text}")
+    """Обрабатывает введённый текст или медиа и запускает рассылку"""
+    if message.media_group_id:
+        # Альбом приходит несколькими сообщениями — собираем его целиком
+        collect_broadcast_album(message)
+        return
+
+    broadcast_message = BroadcastMessage.from_message(message)
+    if broadcast_message is None:
+        bot.send_message(
+            message.chat.id, "❌ Поддерживаются только текст, фото, видео и альбомы. Попробуйте снова."
+        )
+        bot.register_next_step_handler(message, process_broadcast)
+        return
+
+    broadcast_drafts.pop(message.chat.id)
+    if broadcast_message.kind == BroadcastMessage.KIND_TEXT:
+        bot.send_message(message.chat.id, f"📢 Начинаю рассылку...\n\n{broadcast_message.text}")
+    else:
+        bot.send_message(message.chat.id, f"📢 Начинаю рассылку ({broadcast_message.describe()})...")
 
     # Запускаем рассылку
-    send_broadcast(text, message.chat.id)
+    send_broadcast(broadcast_message, message.chat.id)
 
 
-def send_broadcast(text, admin_chat_id):
-    """Функция отправки рассылки всем пользователям из базы"""
-    try:
-        conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT user_id, username FROM users WHERE username IS NOT NULL AND phone_number IS NOT NULL"
-        )
-        users = cursor.fetchall()
+@bot.message_handler(
+    content_types=["photo", "video"],
+    func=lambda message: (
+        message.media_group_id is not None
+        and message.chat.id in admins
+        and message.chat.id in broadcast_drafts
+    ),
+)
+def collect_broadcast_album(message):
+    """Копит части альбома и запускает рассылку, когда пришли все"""
+    chat_id = message.chat.id
+    part = BroadcastMessage.album_part(message)
+    with broadcast_drafts_lock:
+        draft = broadcast_drafts.get(chat_id)
+        if draft is None:
+            return
+        if draft["media_group_id"] is None:
+            draft["media_group_id"] = message.media_group_id
+        # Части другого альбома в этот черновик не попадают
+        if part is not None and draft["media_group_id"] == message.media_group_id:
+            draft["parts"].append(part)
+            broadcast_drafts[chat_id] = draft
+        schedule_broadcast_album(chat_id)
+
+
+def schedule_broadcast_album(chat_id):
+    """(Пере)запускает таймер, который завершит альбом. Вызывать под broadcast_drafts_lock."""
+    timer = broadcast_album_timers.get(chat_id)
+    if timer is not None:
+        timer.cancel()
+    timer = broadcast_album_timers[chat_id] = threading.Timer(
+        BROADCAST_ALBUM_WAIT, finish_broadcast_album, args=(chat_id,)
+    )
+    timer.daemon = True
+    timer.start()
 
-        count = 0  # Счётчик успешных сообщений
 
-        for user in users:
-            user_id, username = user
-            # {username}, на связи GetAuto!\n\n
-            personalized_text = f"{text}"
-            try:
-                bot.send_message(user_id, personalized_text, parse_mode="HTML")
-                count += 1
-                time.sleep(0.5)  # Задержка, чтобы не блокировали
-            except Exception as e:
-                print(f"Ошибка отправки пользователю {user_id}: {e}")
+def finish_broadcast_album(chat_id):
+    with broadcast_drafts_lock:
+        broadcast_album_timers.pop(chat_id, None)
+        draft = broadcast_drafts.get(chat_id)
+        if not draft or not draft["parts"]:
+            return
+        broadcast_drafts.pop(chat_id)
 
-        bot.send_message(
-            admin_chat_id, f"✅ Рассылка завершена! Отправлено {count} сообщений."
-        )
-    except Exception as e:
-        bot.send_message(admin_chat_id, "❌ Ошибка при отправке рассылки.")
-        print(f"Ошибка рассылки: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+    broadcast_message = BroadcastMessage.from_album_parts(draft["parts"])
+    bot.send_message(chat_id, f"📢 Начинаю рассылку ({broadcast_message.describe()})...")
+    send_broadcast(broadcast_message, chat_id)
+
+
+def resume_broadcast_drafts():
+    """Завершает альбомы, которые собирались до перезапуска (вызывать при старте)."""
+    with broadcast_drafts_lock:
+        for chat_id in admins:
+            draft = broadcast_drafts.get(chat_id)
+            if draft and draft["parts"]:
+                schedule_broadcast_album(chat_id)
+
+
+def send_broadcast(broadcast_message, admin_chat_id):
+    """Запускает рассылку всем пользователям из базы в фоновом потоке"""
+    broadcast_engine.start(broadcast_message, admin_chat_id)
 
 
 # Функция для установки команд меню
@@ -700,9 +795,10 @@ def send_error_message(message, error_text):
     global last_error_message_id
 
     # Remove previous error message if it exists
-    if last_error_message_id.get(message.chat.id):
+    previous_error_id = last_error_message_id.get(message.chat.id)
+    if previous_error_id:
         try:
-            bot.delete_message(message.chat.id, last_error_message_id[message.chat.id])
+            bot.delete_message(message.chat.id, previous_error_id)
         except Exception as e:
             logging.error(f"Error deleting message: {e}")
 
@@ -804,9 +900,31 @@ def format_age_with_passable_hint(age, age_formatted, year, month):
     return age_formatted, None
 
 
+def submit_quote_job(chat_id, fn, *args, key=None, notify=True) -> bool:
+    """
+    Run a quote calculation on the quote pool as the chat's current job.
+
+    A new job supersedes the chat's in-flight one, which stops at its next
+    job_superseded() checkpoint. Re-sending the same `key` (e.g. the same
+    link) while it is still being calculated is ignored. Returns False when
+    the job was not started; with `notify` the user is told why.
+    """
+    token = quote_slots.claim(chat_id, key)
+    if token is None:
+        if notify:
+            bot.send_message(chat_id, "⏳ Этот автомобиль уже рассчитывается, пожалуйста подождите.")
+        return False
+    if quote_executor.submit(quote_slots.run, chat_id, token, fn, *args):
+        return True
+    quote_slots.release(chat_id, token)
+    if notify:
+        bot.send_message(chat_id, QUOTE_BUSY_TEXT)
+    return False
+
+
 # Function to calculate the total cost
 def calculate_cost(link, message):
-    global car_id_external, vehicle_id, vehicle_no, krw_rub_rate, eur_rub_rate, rub_to_krw_rate
+    global krw_rub_rate, eur_rub_rate, rub_to_krw_rate
 
     print_message("ЗАПРОС НА РАСЧЁТ АВТОМОБИЛЯ")
 
@@ -837,11 +955,12 @@ def calculate_cost(link, message):
             query_params = parse_qs(parsed_url.query)
             car_id = query_params.get("carid", [None])[0]
 
-    car_id_external[user_id] = car_id
-
     # Step 1: Try pan-auto.ru API first (has pre-calculated customs with HP)
     print_message(f"Пробуем получить данные с pan-auto.ru для car_id={car_id}")
     pan_auto_data = get_pan_auto_car_data(car_id)
+    if job_superseded():
+        bot.delete_message(user_id, processing_message.message_id)
+        return
 
     # Store manufacturer/model from pan-auto.ru if available (for HP caching later)
     manufacturer_from_pan = ""
@@ -884,8 +1003,9 @@ def calculate_cost(link, message):
         v_id,
     ) = result
 
-    vehicle_id[user_id] = v_id
-    vehicle_no[user_id] = v_no
+    if job_superseded():
+        bot.delete_message(user_id, processing_message.message_id)
+        return
 
     if not car_price and car_engine_displacement and formatted_car_date:
         keyboard = types.InlineKeyboardMarkup()
@@ -922,6 +1042,31 @@ def calculate_cost(link, message):
             "pan_auto_data": pan_auto_data,
         }
 
+        # Try the HP cache (nearby displacement/year allowed) before asking the user
+        known_hp = find_known_hp(
+            manufacturer_from_pan, model_from_pan, int(car_engine_displacement), int(f"20{year}")
+        )
+        if known_hp:
+            hp, confidence = known_hp
+            pending_hp_requests.patch(user_id, hp=hp)
+            logging.info(
+                f"Using cached HP {hp} (confidence {confidence}) for "
+                f"{manufacturer_from_pan} {model_from_pan} {car_engine_displacement}cc 20{year}"
+            )
+            # The match may come from a neighbouring trim or year, so let the user correct it
+            source = "по базе" if confidence >= 1.0 else "по базе похожих автомобилей"
+            keyboard = create_fuel_type_keyboard()
+            keyboard.add(types.InlineKeyboardButton("✏️ Изменить мощность", callback_data="hp_change"))
+            bot.send_message(
+                user_id,
+                f"🚗 {car_title}\n\n"
+                f"🐎 Мощность: {hp} л.с. ({source})\n"
+                "Если мощность другая, нажмите «✏️ Изменить мощность».\n\n"
+                "Выберите тип двигателя:",
+                reply_markup=keyboard,
+            )
+            return
+
         # Ask user for HP
         bot.send_message(
             user_id,
@@ -939,7 +1084,7 @@ def calculate_cost_with_pan_auto(pan_auto_data, car_id, message):
     This function uses the trusted customs data (clearanceCost, customsDuty, utilizationFee)
     directly from pan-auto.ru API response.
     """
-    global car_data, usd_rate, krw_rub_rate, rub_to_krw_rate, vehicle_id, vehicle_no
+    global usd_rate, krw_rub_rate, rub_to_krw_rate
 
     user_id = message.chat.id
 
@@ -958,9 +1103,9 @@ def calculate_cost_with_pan_auto(pan_auto_data, car_id, message):
     price_krw = price_krw_from_api
     mileage = pan_auto_data.get("mileage", 0)
 
-    # Store vehicle info for insurance lookup (per-user)
-    vehicle_id[user_id] = pan_auto_data.get("vehicleId", "")
-    vehicle_no[user_id] = pan_auto_data.get("vehicleNo", "")
+    # Vehicle info for the insurance lookup ("Выплаты по ДТП")
+    v_id = pan_auto_data.get("vehicleId", "")
+    v_no = pan_auto_data.get("vehicleNo", "")
 
     # Cache HP for future use (pan-auto.ru is a trusted source)
     if hp and manufacturer and model and engine_volume and year:
@@ -989,9 +1134,10 @@ def calculate_cost_with_pan_auto(pan_auto_data, car_id, message):
     engine_volume_formatted = f"{format_number(int(engine_volume))} cc"
     formatted_mileage = f"{format_number(mileage)} км" if mileage else "Н/Д"
 
-    # Store passable recalculation data if within threshold and lowCosts available
+    # Keep passable recalculation data if within threshold and lowCosts available
+    passable_data = None
     if months_remaining is not None and has_valid_low_costs:
-        pending_passable_data[user_id] = {
+        passable_data = {
             "low_customs_duty": low_customs_duty,
             "low_customs_fee": low_customs_fee,
             "low_recycling_fee": low_recycling_fee,
@@ -1017,73 +1163,16 @@ def calculate_cost_with_pan_auto(pan_auto_data, car_id, message):
     )
     total_cost = pricing["total_rub"]
 
-    # Store car_data for detail view (per-user)
-    car_data[user_id] = {}
-    car_data[user_id]["agent_korea_rub"] = AGENT_FEE_RUB
-    car_data[user_id]["agent_korea_usd"] = AGENT_FEE_RUB / usd_rate
-    car_data[user_id]["agent_korea_krw"] = AGENT_FEE_RUB / krw_rub_rate
-
-    car_data[user_id]["advance_rub"] = 1000000 * krw_rub_rate
-    car_data[user_id]["advance_usd"] = (1000000 * krw_rub_rate) / usd_rate
-    car_data[user_id]["advance_krw"] = 1000000
-
-    car_data[user_id]["car_price_krw"] = price_krw - 1000000
-    car_data[user_id]["car_price_usd"] = (price_krw - 1000000) * krw_rub_rate / usd_rate
-    car_data[user_id]["car_price_rub"] = (price_krw - 1000000) * krw_rub_rate
-
-    car_data[user_id]["dealer_korea_usd"] = DEALER_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["dealer_korea_krw"] = DEALER_KRW
-    car_data[user_id]["dealer_korea_rub"] = DEALER_KRW * krw_rub_rate
-
-    car_data[user_id]["delivery_korea_usd"] = KOREA_DELIVERY_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["delivery_korea_krw"] = KOREA_DELIVERY_KRW
-    car_data[user_id]["delivery_korea_rub"] = KOREA_DELIVERY_KRW * krw_rub_rate
-
-    car_data[user_id]["transfer_korea_usd"] = TRANSFER_TO_PORT_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["transfer_korea_krw"] = TRANSFER_TO_PORT_KRW
-    car_data[user_id]["transfer_korea_rub"] = TRANSFER_TO_PORT_KRW * krw_rub_rate
-
-    car_data[user_id]["freight_korea_usd"] = SEA_FREIGHT_USD
-    car_data[user_id]["freight_korea_krw"] = SEA_FREIGHT_USD * usd_rate / krw_rub_rate
-    car_data[user_id]["freight_korea_rub"] = SEA_FREIGHT_USD * usd_rate
-
-    car_data[user_id]["korea_total_usd"] = pricing["korea_operating_rub"] / usd_rate
-    car_data[user_id]["korea_total_krw"] = pricing["korea_operating_rub"] / krw_rub_rate
-    car_data[user_id]["korea_total_rub"] = pricing["korea_operating_rub"]
-
-    # Russia expenses
-    car_data[user_id]["customs_duty_usd"] = customs_duty / usd_rate
-    car_data[user_id]["customs_duty_krw"] = customs_duty * rub_to_krw_rate
-    car_data[user_id]["customs_duty_rub"] = customs_duty
-
-    car_data[user_id]["customs_fee_usd"] = customs_fee / usd_rate
-    car_data[user_id]["customs_fee_krw"] = customs_fee / krw_rub_rate
-    car_data[user_id]["customs_fee_rub"] = customs_fee
-
-    car_data[user_id]["util_fee_usd"] = recycling_fee / usd_rate
-    car_data[user_id]["util_fee_krw"] = recycling_fee / krw_rub_rate
-    car_data[user_id]["util_fee_rub"] = recycling_fee
-
-    broker_rub = pricing["broker_rub"]
-    svh_rub = russia_fees["svh_rub"]
-    lab_rub = russia_fees["lab_rub"]
-    perm_reg_rub = russia_fees["perm_registration_rub"]
-
-    car_data[user_id]["broker_russia_usd"] = broker_rub / usd_rate
-    car_data[user_id]["broker_russia_krw"] = broker_rub * rub_to_krw_rate
-    car_data[user_id]["broker_russia_rub"] = broker_rub
-
-    car_data[user_id]["svh_russia_usd"] = svh_rub / usd_rate
-    car_data[user_id]["svh_russia_krw"] = svh_rub / krw_rub_rate
-    car_data[user_id]["svh_russia_rub"] = svh_rub
-
-    car_data[user_id]["lab_russia_usd"] = lab_rub / usd_rate
-    car_data[user_id]["lab_russia_krw"] = lab_rub / krw_rub_rate
-    car_data[user_id]["lab_russia_rub"] = lab_rub
-
-    car_data[user_id]["perm_registration_russia_usd"] = perm_reg_rub / usd_rate
-    car_data[user_id]["perm_registration_russia_krw"] = perm_reg_rub / krw_rub_rate
-    car_data[user_id]["perm_registration_russia_rub"] = perm_reg_rub
+    # Store the quote for "Детали расчёта" and the other buttons under it
+    quote_id = save_quote(
+        KoreaQuote.create(
+            price_krw, customs_duty, customs_fee, recycling_fee, russia_fees, krw_rub_rate, usd_rate, rub_to_krw_rate
+        ),
+        passable=passable_data,
+        car_id=car_id,
+        vehicle_id=v_id,
+        vehicle_no=v_no,
+    )
 
     preview_link = f"https://fem.encar.com/cars/detail/{car_id}"
 
@@ -1105,19 +1194,19 @@ def calculate_cost_with_pan_auto(pan_auto_data, car_id, message):
     # Keyboard with actions
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
-        types.InlineKeyboardButton("Детали расчёта", callback_data="detail")
+        types.InlineKeyboardButton("Детали расчёта", callback_data=f"detail:{quote_id}")
     )
     if months_remaining is not None and has_valid_low_costs:
         keyboard.add(
             types.InlineKeyboardButton(
                 "Посчитать как проходную",
-                callback_data="calc_passable",
+                callback_data=f"calc_passable:{quote_id}",
             )
         )
     keyboard.add(
         types.InlineKeyboardButton(
             "Выплаты по ДТП",
-            callback_data="technical_report",
+            callback_data=f"technical_report:{quote_id}",
         )
     )
     keyboard.add(
@@ -1201,7 +1290,7 @@ def process_hp_input_for_url(message):
         return
 
     # Check if user sent an Encar URL
-    if re.match(r"^https?://(www|fem)\.encar\.com/.*", user_input):
+    if ENCAR_URL_RE.match(user_input):
         bot.clear_step_handler_by_chat_id(user_id)
         pending_hp_requests.pop(user_id, None)
         handle_message(message)
@@ -1232,15 +1321,16 @@ def process_hp_input_for_url(message):
 
     hp = int(user_input)
 
-    if user_id not in pending_hp_requests:
+    pending_data = pending_hp_requests.get(user_id)
+    if pending_data is None:
         bot.send_message(user_id, "Ошибка: данные автомобиля не найдены. Попробуйте снова.")
         return
 
     # Store HP in pending data (don't pop yet - wait for fuel type selection)
-    pending_hp_requests[user_id]["hp"] = hp
+    pending_data["hp"] = hp
+    pending_hp_requests[user_id] = pending_data
 
     # Get data for manager HP caching
-    pending_data = pending_hp_requests[user_id]
     car_info = pending_data["car_info"]
     manufacturer = pending_data.get("manufacturer", "")
     model = pending_data.get("model", "")
@@ -1311,8 +1401,8 @@ def complete_url_calculation(user_id, message):
         car_photos,
         year,
         month,
-        _v_no,  # already stored in calculate_cost
-        _v_id,  # already stored in calculate_cost
+        v_no,
+        v_id,
     ) = car_info
 
     car_engine_displacement = int(car_engine_displacement)
@@ -1329,6 +1419,9 @@ def complete_url_calculation(user_id, message):
         engine_type=fuel_type,
     )
 
+    if job_superseded():
+        return
+
     if not response["ok"]:
         if response["reason"] == "rate_limited":
             bot.send_message(
@@ -1365,9 +1458,10 @@ def complete_url_calculation(user_id, message):
         low_customs_duty, low_customs_fee, low_recycling_fee, _ = extract_pan_auto_costs(low_costs_rub)
         has_valid_low_costs = low_customs_duty > 0
 
-    # Store passable recalculation data if within threshold and lowCosts available
+    # Keep passable recalculation data if within threshold and lowCosts available
+    passable_data = None
     if months_remaining is not None and has_valid_low_costs:
-        pending_passable_data[user_id] = {
+        passable_data = {
             "low_customs_duty": low_customs_duty,
             "low_customs_fee": low_customs_fee,
             "low_recycling_fee": low_recycling_fee,
@@ -1396,73 +1490,16 @@ def complete_url_calculation(user_id, message):
     )
     total_cost = pricing["total_rub"]
 
-    # Store car_data for detail view (per-user)
-    car_data[user_id] = {}
-    car_data[user_id]["agent_korea_rub"] = AGENT_FEE_RUB
-    car_data[user_id]["agent_korea_usd"] = AGENT_FEE_RUB / usd_rate
-    car_data[user_id]["agent_korea_krw"] = AGENT_FEE_RUB / krw_rub_rate
-
-    car_data[user_id]["advance_rub"] = 1000000 * krw_rub_rate
-    car_data[user_id]["advance_usd"] = (1000000 * krw_rub_rate) / usd_rate
-    car_data[user_id]["advance_krw"] = 1000000
-
-    car_data[user_id]["car_price_krw"] = price_krw - 1000000
-    car_data[user_id]["car_price_usd"] = (price_krw - 1000000) * krw_rub_rate / usd_rate
-    car_data[user_id]["car_price_rub"] = (price_krw - 1000000) * krw_rub_rate
-
-    car_data[user_id]["dealer_korea_usd"] = DEALER_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["dealer_korea_krw"] = DEALER_KRW
-    car_data[user_id]["dealer_korea_rub"] = DEALER_KRW * krw_rub_rate
-
-    car_data[user_id]["delivery_korea_usd"] = KOREA_DELIVERY_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["delivery_korea_krw"] = KOREA_DELIVERY_KRW
-    car_data[user_id]["delivery_korea_rub"] = KOREA_DELIVERY_KRW * krw_rub_rate
-
-    car_data[user_id]["transfer_korea_usd"] = TRANSFER_TO_PORT_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["transfer_korea_krw"] = TRANSFER_TO_PORT_KRW
-    car_data[user_id]["transfer_korea_rub"] = TRANSFER_TO_PORT_KRW * krw_rub_rate
-
-    car_data[user_id]["freight_korea_usd"] = SEA_FREIGHT_USD
-    car_data[user_id]["freight_korea_krw"] = SEA_FREIGHT_USD * usd_rate / krw_rub_rate
-    car_data[user_id]["freight_korea_rub"] = SEA_FREIGHT_USD * usd_rate
-
-    car_data[user_id]["korea_total_usd"] = pricing["korea_operating_rub"] / usd_rate
-    car_data[user_id]["korea_total_krw"] = pricing["korea_operating_rub"] / krw_rub_rate
-    car_data[user_id]["korea_total_rub"] = pricing["korea_operating_rub"]
-
-    # Russia expenses
-    car_data[user_id]["customs_duty_usd"] = customs_duty / usd_rate
-    car_data[user_id]["customs_duty_krw"] = customs_duty * rub_to_krw_rate
-    car_data[user_id]["customs_duty_rub"] = customs_duty
-
-    car_data[user_id]["customs_fee_usd"] = customs_fee / usd_rate
-    car_data[user_id]["customs_fee_krw"] = customs_fee / krw_rub_rate
-    car_data[user_id]["customs_fee_rub"] = customs_fee
-
-    car_data[user_id]["util_fee_usd"] = recycling_fee / usd_rate
-    car_data[user_id]["util_fee_krw"] = recycling_fee / krw_rub_rate
-    car_data[user_id]["util_fee_rub"] = recycling_fee
-
-    broker_rub = pricing["broker_rub"]
-    svh_rub = russia_fees["svh_rub"]
-    lab_rub = russia_fees["lab_rub"]
-    perm_reg_rub = russia_fees["perm_registration_rub"]
-
-    car_data[user_id]["broker_russia_usd"] = broker_rub / usd_rate
-    car_data[user_id]["broker_russia_krw"] = broker_rub * rub_to_krw_rate
-    car_data[user_id]["broker_russia_rub"] = broker_rub
-
-    car_data[user_id]["svh_russia_usd"] = svh_rub / usd_rate
-    car_data[user_id]["svh_russia_krw"] = svh_rub / krw_rub_rate
-    car_data[user_id]["svh_russia_rub"] = svh_rub
-
-    car_data[user_id]["lab_russia_usd"] = lab_rub / usd_rate
-    car_data[user_id]["lab_russia_krw"] = lab_rub / krw_rub_rate
-    car_data[user_id]["lab_russia_rub"] = lab_rub
-
-    car_data[user_id]["perm_registration_russia_usd"] = perm_reg_rub / usd_rate
-    car_data[user_id]["perm_registration_russia_krw"] = perm_reg_rub / krw_rub_rate
-    car_data[user_id]["perm_registration_russia_rub"] = perm_reg_rub
+    # Store the quote for "Детали расчёта" and the other buttons under it
+    quote_id = save_quote(
+        KoreaQuote.create(
+            price_krw, customs_duty, customs_fee, recycling_fee, russia_fees, krw_rub_rate, usd_rate, rub_to_krw_rate
+        ),
+        passable=passable_data,
+        car_id=car_id,
+        vehicle_id=v_id,
+        vehicle_no=v_no,
+    )
 
     preview_link = f"https://fem.encar.com/cars/detail/{car_id}"
 
@@ -1488,19 +1525,19 @@ def complete_url_calculation(user_id, message):
     # Keyboard with actions
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
-        types.InlineKeyboardButton("Детали расчёта", callback_data="detail")
+        types.InlineKeyboardButton("Детали расчёта", callback_data=f"detail:{quote_id}")
     )
     if months_remaining is not None and has_valid_low_costs:
         keyboard.add(
             types.InlineKeyboardButton(
                 "Посчитать как проходную",
-                callback_data="calc_passable",
+                callback_data=f"calc_passable:{quote_id}",
             )
         )
     keyboard.add(
         types.InlineKeyboardButton(
             "Выплаты по ДТП",
-            callback_data="technical_report",
+            callback_data=f"technical_report:{quote_id}",
         )
     )
     keyboard.add(
@@ -1550,7 +1587,7 @@ def calculate_china_cost(link, message):
     """
     Calculate import cost for a car from Che168.com (China).
     """
-    global car_data, cny_rub_rate, usd_rate
+    global cny_rub_rate, usd_rate
 
     print_message("ЗАПРОС НА РАСЧЁТ АВТОМОБИЛЯ ИЗ КИТАЯ")
 
@@ -1580,6 +1617,9 @@ def calculate_china_cost(link, message):
 
     # Fetch car info from Che168 API (with proxy fallback)
     car_info = get_che168_car_info_with_fallback(car_id)
+    if job_superseded():
+        bot.delete_message(user_id, processing_message.message_id)
+        return
     if not car_info:
         bot.delete_message(user_id, processing_message.message_id)
         send_error_message(message, "Не удалось получить данные об автомобиле. Попробуйте позже.")
@@ -1621,7 +1661,7 @@ def calculate_china_cost(link, message):
     # Check if HP was successfully extracted and is valid
     if horsepower and 50 <= horsepower <= 1000:
         # Use auto-extracted HP, skip manual input
-        pending_china_hp_requests[user_id]["hp"] = horsepower
+        pending_china_hp_requests.patch(user_id, hp=horsepower)
         logging.info(f"Using auto-extracted HP: {horsepower} for user {user_id}")
 
         # Check if fuel type is also valid
@@ -1690,7 +1730,7 @@ def process_china_hp_input(message):
         return
 
     # Check if user sent an Encar URL
-    if re.match(r"^https?://(www|fem)\.encar\.com/.*", user_input):
+    if ENCAR_URL_RE.match(user_input):
         bot.clear_step_handler_by_chat_id(user_id)
         pending_china_hp_requests.pop(user_id, None)
         handle_message(message)
@@ -1721,12 +1761,14 @@ def process_china_hp_input(message):
 
     hp = int(user_input)
 
-    if user_id not in pending_china_hp_requests:
+    pending_data = pending_china_hp_requests.get(user_id)
+    if pending_data is None:
         bot.send_message(user_id, "Ошибка: данные автомобиля не найдены. Попробуйте снова.")
         return
 
     # Store HP and show fuel type selection
-    pending_china_hp_requests[user_id]["hp"] = hp
+    pending_data["hp"] = hp
+    pending_china_hp_requests[user_id] = pending_data
 
     # Show fuel type keyboard
     keyboard = create_fuel_type_keyboard()
@@ -1740,14 +1782,13 @@ def process_china_hp_input(message):
 
 def complete_china_calculation(user_id, message):
     """Complete China car cost calculation after HP and fuel type are selected."""
-    global car_data, cny_rub_rate, usd_rate
+    global cny_rub_rate, usd_rate
 
-    if user_id not in pending_china_hp_requests:
+    pending_data = pending_china_hp_requests.pop(user_id)
+    if pending_data is None:
         bot.send_message(user_id, "Ошибка: данные автомобиля не найдены.")
         return
 
-    pending_data = pending_china_hp_requests.pop(user_id)
-
     price_cny = pending_data["price_cny"]
     displacement_cc = pending_data["displacement_cc"]
     year = pending_data["year"]
@@ -1770,6 +1811,9 @@ def complete_china_calculation(user_id, message):
         currency="CNY",
     )
 
+    if job_superseded():
+        return
+
     if not response["ok"]:
         if response["reason"] == "rate_limited":
             bot.send_message(
@@ -1813,32 +1857,13 @@ def complete_china_calculation(user_id, message):
         else "от 5 до 7 лет" if age == "5-7" else "от 7 лет")
     )
 
-    # Store car_data for detail view (per-user)
-    car_data[user_id] = {}
-    car_data[user_id]["source"] = "che168"
-    car_data[user_id]["first_payment_cny"] = CHINA_FIRST_PAYMENT
-    car_data[user_id]["first_payment_rub"] = first_payment_rub
-    car_data[user_id]["car_price_cny"] = car_price_after_deposit
-    car_data[user_id]["car_price_rub"] = car_price_after_deposit * cny_rub_rate
-    car_data[user_id]["dealer_china_cny"] = CHINA_DEALER_FEE
-    car_data[user_id]["dealer_china_rub"] = dealer_fee_rub
-    car_data[user_id]["delivery_china_cny"] = CHINA_DELIVERY
-    car_data[user_id]["delivery_china_rub"] = delivery_rub
-    car_data[user_id]["china_total_cny"] = china_total_cny
-    car_data[user_id]["china_total_rub"] = china_total_rub
-    car_data[user_id]["customs_duty_rub"] = customs_duty
-    car_data[user_id]["customs_fee_rub"] = customs_fee
-    car_data[user_id]["util_fee_rub"] = recycling_fee
-    car_data[user_id]["agent_russia_rub"] = CHINA_AGENT_FEE
-    car_data[user_id]["broker_russia_rub"] = CHINA_BROKER_FEE
-    car_data[user_id]["svh_russia_rub"] = CHINA_SVH_FEE
-    car_data[user_id]["lab_russia_rub"] = CHINA_LAB_FEE
-    car_data[user_id]["total_cost_rub"] = total_cost_rub
-    car_data[user_id]["total_cost_usd"] = total_cost_usd
-    car_data[user_id]["total_cost_cny"] = total_cost_cny
-    car_data[user_id]["link"] = link
-    car_data[user_id]["car_name"] = car_name
-    car_data[user_id]["fuel_type_name"] = fuel_type_name
+    # Join the title translation started when the listing was parsed
+    car_name_original = pending_data.get("car_info", {}).get("car_name_original")
+    if car_name_original:
+        car_name = get_car_title_translation(car_name_original)
+
+    # Store the quote for "Детали расчёта"
+    quote_id = save_quote(ChinaQuote(price_cny, customs_duty, customs_fee, recycling_fee, cny_rub_rate))
 
     # Format result message (matching Korean format)
     result_message = (
@@ -1861,7 +1886,7 @@ def complete_china_calculation(user_id, message):
     # Create keyboard
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
-        types.InlineKeyboardButton("Детали расчёта", callback_data="detail_china")
+        types.InlineKeyboardButton("Детали расчёта", callback_data=f"detail_china:{quote_id}")
     )
     keyboard.add(
         types.InlineKeyboardButton(
@@ -1924,7 +1949,7 @@ def process_china_manual_month(message):
         bot.register_next_step_handler(message, process_china_manual_month)
         return
 
-    user_manual_china_input[user_id]["month"] = int(user_input)
+    user_manual_china_input.patch(user_id, month=int(user_input))
     bot.send_message(user_id, "Введите год первой регистрации (например, 2020):")
     bot.register_next_step_handler(message, process_china_manual_year)
 
@@ -1948,7 +1973,7 @@ def process_china_manual_year(message):
         bot.register_next_step_handler(message, process_china_manual_year)
         return
 
-    user_manual_china_input[user_id]["year"] = int(user_input)
+    user_manual_china_input.patch(user_id, year=int(user_input))
     bot.send_message(user_id, "Введите объём двигателя в литрах (например, 3.0):")
     bot.register_next_step_handler(message, process_china_manual_engine)
 
@@ -1976,8 +2001,9 @@ def process_china_manual_engine(message):
         bot.register_next_step_handler(message, process_china_manual_engine)
         return
 
-    user_manual_china_input[user_id]["engine_liters"] = engine_liters
-    user_manual_china_input[user_id]["engine_cc"] = int(engine_liters * 1000)
+    user_manual_china_input.patch(
+        user_id, engine_liters=engine_liters, engine_cc=int(engine_liters * 1000)
+    )
     bot.send_message(user_id, "Введите цену автомобиля в юанях (например, 303800):")
     bot.register_next_step_handler(message, process_china_manual_price)
 
@@ -2005,7 +2031,7 @@ def process_china_manual_price(message):
         bot.register_next_step_handler(message, process_china_manual_price)
         return
 
-    user_manual_china_input[user_id]["price_cny"] = price_cny
+    user_manual_china_input.patch(user_id, price_cny=price_cny)
     bot.send_message(user_id, "Введите мощность двигателя в л.с. (например, 340):")
     bot.register_next_step_handler(message, process_china_manual_hp)
 
@@ -2027,7 +2053,7 @@ def process_china_manual_hp(message):
         bot.register_next_step_handler(message, process_china_manual_hp)
         return
 
-    user_manual_china_input[user_id]["hp"] = int(user_input)
+    user_manual_china_input.patch(user_id, hp=int(user_input))
 
     # Show fuel type keyboard
     keyboard = create_fuel_type_keyboard()
@@ -2041,7 +2067,7 @@ def process_china_manual_hp(message):
 
 def calculate_manual_china_cost(user_id):
     """Calculate China car import cost from manual input."""
-    global car_data, cny_rub_rate, usd_rate
+    global cny_rub_rate, usd_rate
 
     if user_id not in user_manual_china_input:
         bot.send_message(user_id, "Ошибка: данные не найдены.")
@@ -2074,6 +2100,9 @@ def calculate_manual_china_cost(user_id):
         currency="CNY",
     )
 
+    if job_superseded():
+        return
+
     if not response["ok"]:
         if response["reason"] == "rate_limited":
             bot.send_message(
@@ -2119,30 +2148,8 @@ def calculate_manual_china_cost(user_id):
 
     fuel_type_name = FUEL_TYPE_NAMES.get(fuel_type, "Бензин")
 
-    # Store car_data for detail view (per-user)
-    car_data[user_id] = {}
-    car_data[user_id]["source"] = "che168_manual"
-    car_data[user_id]["first_payment_cny"] = CHINA_FIRST_PAYMENT
-    car_data[user_id]["first_payment_rub"] = first_payment_rub
-    car_data[user_id]["car_price_cny"] = car_price_after_deposit
-    car_data[user_id]["car_price_rub"] = car_price_after_deposit * cny_rub_rate
-    car_data[user_id]["dealer_china_cny"] = CHINA_DEALER_FEE
-    car_data[user_id]["dealer_china_rub"] = dealer_fee_rub
-    car_data[user_id]["delivery_china_cny"] = CHINA_DELIVERY
-    car_data[user_id]["delivery_china_rub"] = delivery_rub
-    car_data[user_id]["china_total_cny"] = china_total_cny
-    car_data[user_id]["china_total_rub"] = china_total_rub
-    car_data[user_id]["customs_duty_rub"] = customs_duty
-    car_data[user_id]["customs_fee_rub"] = customs_fee
-    car_data[user_id]["util_fee_rub"] = recycling_fee
-    car_data[user_id]["agent_russia_rub"] = CHINA_AGENT_FEE
-    car_data[user_id]["broker_russia_rub"] = CHINA_BROKER_FEE
-    car_data[user_id]["svh_russia_rub"] = CHINA_SVH_FEE
-    car_data[user_id]["lab_russia_rub"] = CHINA_LAB_FEE
-    car_data[user_id]["total_cost_rub"] = total_cost_rub
-    car_data[user_id]["total_cost_usd"] = total_cost_usd
-    car_data[user_id]["total_cost_cny"] = total_cost_cny
-    car_data[user_id]["fuel_type_name"] = fuel_type_name
+    # Store the quote for "Детали расчёта"
+    quote_id = save_quote(ChinaQuote(price_cny, customs_duty, customs_fee, recycling_fee, cny_rub_rate))
 
     # Format result message (matching Korean manual format)
     result_message = (
@@ -2164,7 +2171,7 @@ def calculate_manual_china_cost(user_id):
     # Create keyboard
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
-        types.InlineKeyboardButton("Детали расчёта", callback_data="detail_china_manual")
+        types.InlineKeyboardButton("Детали расчёта", callback_data=f"detail_china_manual:{quote_id}")
     )
     keyboard.add(
         types.InlineKeyboardButton(
@@ -2185,12 +2192,35 @@ def calculate_manual_china_cost(user_id):
     )
 
 
+def save_quote(quote, passable=None, car_id="", vehicle_id="", vehicle_no=""):
+    """
+    Store a finished quote with what its buttons need and return its id.
+
+    The id goes into the buttons' callback_data ("detail:<id>"), so a button
+    under an older message still opens that message's car.
+    """
+    quote_id = new_quote_id()
+    quote_store[quote_id] = {
+        "quote": quote.to_record(),
+        "passable": passable,
+        "car_id": car_id,
+        "vehicle_id": vehicle_id,
+        "vehicle_no": vehicle_no,
+    }
+    return quote_id
+
+
+def get_quote_entry(callback_data):
+    """Resolve the quote id in callback_data ("detail:<id>") to its stored entry."""
+    _, _, quote_id = callback_data.partition(":")
+    return quote_store.get(quote_id) if quote_id else None
+
+
 # Function to get insurance total
-def get_insurance_total(user_id):
+def get_insurance_total(v_id, v_no):
     print_message("[ЗАПРОС] ТЕХНИЧЕСКИЙ ОТЧËТ ОБ АВТОМОБИЛЕ")
 
-    formatted_vehicle_no = urllib.parse.quote(str(vehicle_no.get(user_id, "")).strip())
-    v_id = vehicle_id.get(user_id, "")
+    formatted_vehicle_no = urllib.parse.quote(str(v_no or "").strip())
     url = f"https://api.encar.com/v1/readside/record/vehicle/{str(v_id)}/open?vehicleNo={formatted_vehicle_no}"
 
     try:
@@ -2223,291 +2253,411 @@ def get_insurance_total(user_id):
 # Callback query handler
 @bot.callback_query_handler(func=lambda call: True)
 def handle_callback_query(call):
-    global usd_rate
+    callback_router.dispatch(call.data, call)
+
+
+# Обработка пагинации статистики
+@callback_router.prefix("stats_next_", "stats_prev_", "stats_page_")
+def handle_stats_page_callback(call):
+    # Проверяем, что пользователь - администратор
+    if call.from_user.id not in admins:
+        bot.answer_callback_query(call.id, "❌ У вас нет доступа к этой команде.")
+        return
+
+    try:
+        if call.data.startswith("stats_page_"):
+            # Кнопки из старых сообщений (OFFSET-пагинация) — открываем первую страницу
+            send_stats_page(call.from_user.id, call.message.message_id)
+        else:
+            # stats_{next|prev}_{micros}_{user_id}; старые кнопки ещё несут номер страницы перед границей
+            parts = call.data.split("_")
+            direction, cursor_value = parts[1], "_".join(parts[-2:])
+            send_stats_page(
+                call.from_user.id,
+                call.message.message_id,
+                cursor_key=decode_stats_cursor(cursor_value),
+                direction=direction,
+            )
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        bot.answer_callback_query(call.id, "❌ Ошибка при переключении страницы")
+        logging.error(f"Ошибка пагинации статистики: {e}")
+
+
+@callback_router.exact("stats_current")
+def handle_stats_current_callback(call):
+    # Для кнопки с текущей страницей - просто закрываем уведомление
+    bot.answer_callback_query(call.id)
+
+
+@callback_router.prefix("fuel_")
+def handle_fuel_type_callback(call):
     user_id = call.message.chat.id
+    # Handle fuel type selection for all calculation flows
+    fuel_type = int(call.data.split("_")[1])
+    fuel_type_name = FUEL_TYPE_NAMES.get(fuel_type, "Бензин")
+
+    # Check which flow the user is in
+    if "price_krw" in user_manual_input.get(user_id, {}):
+        # Korea manual calculation flow
+        flow_store, job = user_manual_input, (calculate_manual_cost, user_id)
+    elif "hp" in pending_hp_requests.get(user_id, {}):
+        # Korea URL fallback flow
+        flow_store, job = pending_hp_requests, (complete_url_calculation, user_id, call.message)
+    elif "hp" in user_manual_china_input.get(user_id, {}):
+        # China manual calculation flow
+        flow_store, job = user_manual_china_input, (calculate_manual_china_cost, user_id)
+    elif "hp" in pending_china_hp_requests.get(user_id, {}):
+        # China URL flow
+        flow_store, job = pending_china_hp_requests, (complete_china_calculation, user_id, call.message)
+    else:
+        flow_store = job = None
 
-    # Обработка пагинации статистики
-    if call.data.startswith("stats_page_"):
-        # Проверяем, что пользователь - администратор
-        if call.from_user.id not in admins:
-            bot.answer_callback_query(call.id, "❌ У вас нет доступа к этой команде.")
+    if job:
+        flow_store.patch(user_id, fuel_type=fuel_type)
+        if not submit_quote_job(user_id, *job, notify=False):
+            # Keep the keyboard so the user can pick the fuel type again later
+            bot.answer_callback_query(call.id, QUOTE_BUSY_TEXT, show_alert=True)
             return
-        
+        bot.answer_callback_query(call.id, f"Выбран тип: {fuel_type_name}")
+        # Delete the fuel type selection message
         try:
-            page = int(call.data.replace("stats_page_", ""))
-            send_stats_page(call.from_user.id, page, call.message.message_id)
-            bot.answer_callback_query(call.id)
-        except Exception as e:
-            bot.answer_callback_query(call.id, "❌ Ошибка при переключении страницы")
-            logging.error(f"Ошибка пагинации статистики: {e}")
-        return
-    
-    elif call.data == "stats_current":
-        # Для кнопки с текущей страницей - просто закрываем уведомление
-        bot.answer_callback_query(call.id)
+            bot.delete_message(call.message.chat.id, call.message.message_id)
+        except:
+            pass
+    else:
+        bot.answer_callback_query(call.id, "Ошибка: данные не найдены")
+
+
+@callback_router.exact("hp_change")
+def handle_hp_change_callback(call):
+    # The user rejected the HP found in the cache: ask for it instead
+    user_id = call.message.chat.id
+    pending_data = pending_hp_requests.get(user_id)
+    if pending_data is None:
+        bot.answer_callback_query(call.id, "Ошибка: данные не найдены")
         return
 
-    elif call.data.startswith("fuel_"):
-        # Handle fuel type selection for all calculation flows
-        fuel_type = int(call.data.split("_")[1])
-        fuel_type_name = FUEL_TYPE_NAMES.get(fuel_type, "Бензин")
-
-        # Check which flow the user is in
-        if user_id in user_manual_input and "price_krw" in user_manual_input[user_id]:
-            # Korea manual calculation flow
-            user_manual_input[user_id]["fuel_type"] = fuel_type
-            bot.answer_callback_query(call.id, f"Выбран тип: {fuel_type_name}")
-            # Delete the fuel type selection message
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            calculate_manual_cost(user_id)
-        elif user_id in pending_hp_requests and "hp" in pending_hp_requests[user_id]:
-            # Korea URL fallback flow
-            pending_hp_requests[user_id]["fuel_type"] = fuel_type
-            bot.answer_callback_query(call.id, f"Выбран тип: {fuel_type_name}")
-            # Delete the fuel type selection message
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            complete_url_calculation(user_id, call.message)
-        elif user_id in user_manual_china_input and "hp" in user_manual_china_input[user_id]:
-            # China manual calculation flow
-            user_manual_china_input[user_id]["fuel_type"] = fuel_type
-            bot.answer_callback_query(call.id, f"Выбран тип: {fuel_type_name}")
-            # Delete the fuel type selection message
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            calculate_manual_china_cost(user_id)
-        elif user_id in pending_china_hp_requests and "hp" in pending_china_hp_requests[user_id]:
-            # China URL flow
-            pending_china_hp_requests[user_id]["fuel_type"] = fuel_type
-            bot.answer_callback_query(call.id, f"Выбран тип: {fuel_type_name}")
-            # Delete the fuel type selection message
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            complete_china_calculation(user_id, call.message)
-        else:
-            bot.answer_callback_query(call.id, "Ошибка: данные не найдены")
+    pending_data.pop("hp", None)
+    pending_hp_requests[user_id] = pending_data
+    bot.answer_callback_query(call.id)
+    # Delete the fuel type selection message until the new HP is entered
+    try:
+        bot.delete_message(user_id, call.message.message_id)
+    except:
+        pass
+    bot.send_message(user_id, "Пожалуйста, введите мощность двигателя в л.с. (например: 150):")
+    bot.register_next_step_handler(call.message, process_hp_input_for_url)
+
+
+@callback_router.prefix("calc_passable")
+def handle_calc_passable_callback(call):
+    # Recalculate cost as if the car were "проходная" (3-5 years) using lowCosts
+    entry = get_quote_entry(call.data)
+    passable_data = entry.get("passable") if entry else None
+
+    if not passable_data:
+        bot.answer_callback_query(call.id, "Данные не найдены. Попробуйте рассчитать заново.")
         return
 
-    elif call.data == "calc_passable":
-        # Recalculate cost as if the car were "проходная" (3-5 years) using lowCosts
-        passable_data = pending_passable_data.pop(user_id, None)
+    bot.answer_callback_query(call.id)
+
+    # Extract lowCosts customs values
+    low_customs_duty = passable_data["low_customs_duty"]
+    low_customs_fee = passable_data["low_customs_fee"]
+    low_recycling_fee = passable_data["low_recycling_fee"]
+    price_krw = passable_data["price_krw"]
+    car_title = passable_data["car_title"]
+    engine_volume = passable_data["engine_volume"]
+    hp = passable_data["hp"]
+    p_formatted_mileage = passable_data["formatted_mileage"]
+    car_id = passable_data["car_id"]
+    p_year = passable_data["year"]
+    p_month = passable_data["month"]
 
-        if not passable_data:
-            bot.answer_callback_query(call.id, "Данные не найдены. Попробуйте рассчитать заново.")
-            return
+    engine_volume_formatted = f"{format_number(int(engine_volume))} cc"
+    price_usd = price_krw * krw_rub_rate / usd_rate
 
-        bot.answer_callback_query(call.id)
+    # Recalculate total cost with lowCosts customs values via the canonical helper.
+    pricing = compute_turnkey_total(
+        price_krw=price_krw,
+        krw_rub=krw_rub_rate,
+        usd_rub=usd_rate,
+        customs_duty_rub=low_customs_duty,
+        customs_fee_rub=low_customs_fee,
+        recycling_fee_rub=low_recycling_fee,
+        russia_fees=russia_fees,
+    )
+    total_cost = pricing["total_rub"]
+
+    # Store the recalculated quote for its "Детали расчёта" button
+    quote_id = save_quote(
+        KoreaQuote.create(
+            price_krw,
+            low_customs_duty,
+            low_customs_fee,
+            low_recycling_fee,
+            russia_fees,
+            krw_rub_rate,
+            usd_rate,
+            rub_to_krw_rate,
+        ),
+        car_id=entry.get("car_id", ""),
+        vehicle_id=entry.get("vehicle_id", ""),
+        vehicle_no=entry.get("vehicle_no", ""),
+    )
+
+    preview_link = f"https://fem.encar.com/cars/detail/{car_id}"
 
-        # Extract lowCosts customs values
-        low_customs_duty = passable_data["low_customs_duty"]
-        low_customs_fee = passable_data["low_customs_fee"]
-        low_recycling_fee = passable_data["low_recycling_fee"]
-        price_krw = passable_data["price_krw"]
-        car_title = passable_data["car_title"]
-        engine_volume = passable_data["engine_volume"]
-        hp = passable_data["hp"]
-        p_formatted_mileage = passable_data["formatted_mileage"]
-        car_id = passable_data["car_id"]
-        p_year = passable_data["year"]
-        p_month = passable_data["month"]
-
-        engine_volume_formatted = f"{format_number(int(engine_volume))} cc"
-        price_usd = price_krw * krw_rub_rate / usd_rate
-
-        # Recalculate total cost with lowCosts customs values via the canonical helper.
-        pricing = compute_turnkey_total(
-            price_krw=price_krw,
-            krw_rub=krw_rub_rate,
-            usd_rub=usd_rate,
-            customs_duty_rub=low_customs_duty,
-            customs_fee_rub=low_customs_fee,
-            recycling_fee_rub=low_recycling_fee,
-            russia_fees=russia_fees,
+    # Build result message with passable header
+    result_message = (
+        f"⏳ <b>РАСЧЁТ КАК ПРОХОДНАЯ (от 3 до 5 лет)</b>\n\n"
+        f"{car_title}\n\n"
+        f"Возраст: от 3 до 5 лет (дата регистрации: {p_month}/{p_year})\n"
+        f"Пробег: {p_formatted_mileage}\n"
+        f"Стоимость автомобиля в Корее: ₩{format_number(price_krw)} | ${format_number(price_usd)}\n"
+        f"Объём двигателя: {engine_volume_formatted}\n"
+        f"Мощность: {hp} л.с.\n"
+        f"🟰 <b>Стоимость под ключ до Владивостока</b>:\n<b>{format_number(total_cost)} ₽</b>\n\n"
+        f"‼️ <b>Доставку до вашего города уточняйте у менеджера @GetAuto_manager_bot</b>\n\n"
+        f"Стоимость под ключ актуальна на сегодняшний день, возможны колебания курса на 3-5% от стоимости авто, на момент покупки автомобиля\n\n"
+        f"🔗 <a href='{preview_link}'>Ссылка на автомобиль</a>\n\n"
+        f"🔗 <a href='https://t.me/Getauto_kor'>Официальный телеграм канал</a>\n"
+    )
+
+    # Keyboard
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton("Детали расчёта", callback_data=f"detail:{quote_id}")
+    )
+    keyboard.add(
+        types.InlineKeyboardButton(
+            "Расчёт другого автомобиля",
+            callback_data="calculate_another",
         )
-        total_cost = pricing["total_rub"]
-        broker_rub = pricing["broker_rub"]
-
-        # Update car_data for "Детали расчёта" (per-user)
-        if user_id not in car_data:
-            car_data[user_id] = {}
-        car_data[user_id]["customs_duty_usd"] = low_customs_duty / usd_rate
-        car_data[user_id]["customs_duty_krw"] = low_customs_duty * rub_to_krw_rate
-        car_data[user_id]["customs_duty_rub"] = low_customs_duty
-
-        car_data[user_id]["customs_fee_usd"] = low_customs_fee / usd_rate
-        car_data[user_id]["customs_fee_krw"] = low_customs_fee / krw_rub_rate
-        car_data[user_id]["customs_fee_rub"] = low_customs_fee
-
-        car_data[user_id]["util_fee_usd"] = low_recycling_fee / usd_rate
-        car_data[user_id]["util_fee_krw"] = low_recycling_fee / krw_rub_rate
-        car_data[user_id]["util_fee_rub"] = low_recycling_fee
-
-        car_data[user_id]["broker_russia_usd"] = broker_rub / usd_rate
-        car_data[user_id]["broker_russia_krw"] = broker_rub * rub_to_krw_rate
-        car_data[user_id]["broker_russia_rub"] = broker_rub
-
-        preview_link = f"https://fem.encar.com/cars/detail/{car_id}"
-
-        # Build result message with passable header
-        result_message = (
-            f"⏳ <b>РАСЧЁТ КАК ПРОХОДНАЯ (от 3 до 5 лет)</b>\n\n"
-            f"{car_title}\n\n"
-            f"Возраст: от 3 до 5 лет (дата регистрации: {p_month}/{p_year})\n"
-            f"Пробег: {p_formatted_mileage}\n"
-            f"Стоимость автомобиля в Корее: ₩{format_number(price_krw)} | ${format_number(price_usd)}\n"
-            f"Объём двигателя: {engine_volume_formatted}\n"
-            f"Мощность: {hp} л.с.\n"
-            f"🟰 <b>Стоимость под ключ до Владивостока</b>:\n<b>{format_number(total_cost)} ₽</b>\n\n"
-            f"‼️ <b>Доставку до вашего города уточняйте у менеджера @GetAuto_manager_bot</b>\n\n"
-            f"Стоимость под ключ актуальна на сегодняшний день, возможны колебания курса на 3-5% от стоимости авто, на момент покупки автомобиля\n\n"
-            f"🔗 <a href='{preview_link}'>Ссылка на автомобиль</a>\n\n"
-            f"🔗 <a href='https://t.me/Getauto_kor'>Официальный телеграм канал</a>\n"
+    )
+    keyboard.add(
+        types.InlineKeyboardButton(
+            "Написать менеджеру", url="https://t.me/GetAuto_manager_bot"
         )
+    )
 
-        # Keyboard
-        keyboard = types.InlineKeyboardMarkup()
+    # Send as a new message (not edit)
+    bot.send_message(
+        call.message.chat.id,
+        result_message,
+        parse_mode="HTML",
+        reply_markup=keyboard,
+    )
+
+
+@callback_router.prefix("detail_china")
+def handle_china_detail_callback(call):
+    user_id = call.message.chat.id
+    # Detail view for Chinese car calculations
+    print_message("[ЗАПРОС] ДЕТАЛИЗАЦИЯ РАСЧËТА (КИТАЙ)")
+
+    entry = get_quote_entry(call.data)
+    quote = load_quote(entry["quote"]) if entry else None
+    if quote is None or quote.kind != ChinaQuote.kind:
+        bot.send_message(user_id, "Данные расчёта не найдены. Попробуйте рассчитать заново.")
+        return
+    ud = quote.breakdown()
+
+    detail_message = (
+        f"<i>ПЕРВАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
+        f"Задаток (бронь авто):\n<b>¥{format_number(ud['first_payment_cny'])}</b> | <b>{format_number(int(ud['first_payment_rub']))} ₽</b>\n\n\n"
+        f"<i>ВТОРАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
+        f"Стоимость авто (минус задаток):\n<b>¥{format_number(ud['car_price_cny'])}</b> | <b>{format_number(int(ud['car_price_rub']))} ₽</b>\n\n"
+        f"Дилерский сбор:\n<b>¥{format_number(ud['dealer_china_cny'])}</b> | <b>{format_number(int(ud['dealer_china_rub']))} ₽</b>\n\n"
+        f"Доставка, снятие с учёта, оформление:\n<b>¥{format_number(ud['delivery_china_cny'])}</b> | <b>{format_number(int(ud['delivery_china_rub']))} ₽</b>\n\n"
+        f"<b>Итого расходов по Китаю</b>:\n<b>¥{format_number(ud['china_total_cny'])}</b> | <b>{format_number(int(ud['china_total_rub']))} ₽</b>\n\n\n"
+        f"<i>РАСХОДЫ РОССИЯ</i>:\n\n"
+        f"Единая таможенная ставка:\n<b>{format_number(int(ud['customs_duty_rub']))} ₽</b>\n\n"
+        f"Таможенное оформление:\n<b>{format_number(int(ud['customs_fee_rub']))} ₽</b>\n\n"
+        f"Утилизационный сбор:\n<b>{format_number(int(ud['util_fee_rub']))} ₽</b>\n\n"
+        f"Агентские услуги:\n<b>{format_number(ud['agent_russia_rub'])} ₽</b>\n\n"
+        f"Брокер:\n<b>{format_number(ud['broker_russia_rub'])} ₽</b>\n\n"
+        f"СВХ:\n<b>{format_number(ud['svh_russia_rub'])} ₽</b>\n\n"
+        f"Лаборатория, СБКТС, ЭПТС:\n<b>{format_number(ud['lab_russia_rub'])} ₽</b>\n\n"
+        f"<b>Доставку до вашего города уточняйте у менеджера @GetAuto_manager_bot</b>\n\n"
+        "<b>СТОИМОСТЬ ПОД КЛЮЧ АКТУАЛЬНА НА СЕГОДНЯШНИЙ ДЕНЬ, ВОЗМОЖНЫ КОЛЕБАНИЯ КУРСА НА 3-5% ОТ СТОИМОСТИ АВТО, НА МОМЕНТ ПОКУПКИ АВТОМОБИЛЯ</b>\n\n"
+    )
+
+    # Inline buttons for further actions
+    keyboard = types.InlineKeyboardMarkup()
+
+    if call.data.startswith("detail_china_manual"):
         keyboard.add(
-            types.InlineKeyboardButton("Детали расчёта", callback_data="detail")
+            types.InlineKeyboardButton(
+                "Рассчитать стоимость другого автомобиля",
+                callback_data="calculate_another_manual",
+            )
         )
+    else:
         keyboard.add(
             types.InlineKeyboardButton(
-                "Расчёт другого автомобиля",
+                "Рассчитать стоимость другого автомобиля",
                 callback_data="calculate_another",
             )
         )
+
+    keyboard.add(
+        types.InlineKeyboardButton(
+            "Связаться с менеджером", url="https://t.me/GetAuto_manager_bot"
+        )
+    )
+
+    bot.send_message(
+        call.message.chat.id,
+        detail_message,
+        parse_mode="HTML",
+        reply_markup=keyboard,
+    )
+
+
+@callback_router.prefix("detail")
+def handle_detail_callback(call):
+    user_id = call.message.chat.id
+    print_message("[ЗАПРОС] ДЕТАЛИЗАЦИЯ РАСЧËТА")
+
+    entry = get_quote_entry(call.data)
+    quote = load_quote(entry["quote"]) if entry else None
+    if quote is None or quote.kind != KoreaQuote.kind:
+        bot.send_message(user_id, "Данные расчёта не найдены. Попробуйте рассчитать заново.")
+        return
+    ud = quote.breakdown()
+
+    detail_message = (
+        f"<i>ПЕРВАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
+        f"Задаток (бронь авто):\n<b>${format_number(ud['advance_usd'])}</b> | <b>₩1,000,000</b> | <b>{format_number(ud['advance_rub'])} ₽</b>\n\n\n"
+        f"<i>ВТОРАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
+        f"Стоимость автомобиля (за вычетом задатка):\n<b>${format_number(ud['car_price_usd'])}</b> | <b>₩{format_number(ud['car_price_krw'])}</b> | <b>{format_number(ud['car_price_rub'])} ₽</b>\n\n"
+        f"Диллерский сбор:\n<b>${format_number(ud['dealer_korea_usd'])}</b> | <b>₩{format_number(ud['dealer_korea_krw'])}</b> | <b>{format_number(ud['dealer_korea_rub'])} ₽</b>\n\n"
+        f"Доставка, снятие с учёта, оформление:\n<b>${format_number(ud['delivery_korea_usd'])}</b> | <b>₩{format_number(ud['delivery_korea_krw'])}</b> | <b>{format_number(ud['delivery_korea_rub'])} ₽</b>\n\n"
+        f"Транспортировка авто в порт:\n<b>${format_number(ud['transfer_korea_usd'])}</b> | <b>₩{format_number(ud['transfer_korea_krw'])}</b> | <b>{format_number(ud['transfer_korea_rub'])} ₽</b>\n\n"
+        f"Фрахт (Паром до Владивостока):\n<b>${format_number(ud['freight_korea_usd'])}</b> | <b>₩{format_number(ud['freight_korea_krw'])}</b> | <b>{format_number(ud['freight_korea_rub'])} ₽</b>\n\n"
+        f"<b>Итого расходов по Корее</b>:\n<b>${format_number(ud['korea_total_usd'])}</b> | <b>₩{format_number(ud['korea_total_krw'])}</b> | <b>{format_number(ud['korea_total_rub'])} ₽</b>\n\n\n"
+        f"<i>РАСХОДЫ РОССИЯ</i>:\n\n\n"
+        f"Единая таможенная ставка:\n<b>${format_number(ud['customs_duty_usd'])}</b> | <b>₩{format_number(ud['customs_duty_krw'])}</b> | <b>{format_number(ud['customs_duty_rub'])} ₽</b>\n\n"
+        f"Таможенное оформление:\n<b>${format_number(ud['customs_fee_usd'])}</b> | <b>₩{format_number(ud['customs_fee_krw'])}</b> | <b>{format_number(ud['customs_fee_rub'])} ₽</b>\n\n"
+        f"Утилизационный сбор:\n<b>${format_number(ud['util_fee_usd'])}</b> | <b>₩{format_number(ud['util_fee_krw'])}</b> | <b>{format_number(ud['util_fee_rub'])} ₽</b>\n\n\n"
+        f"Агентские услуги по договору:\n<b>${format_number(ud['agent_korea_usd'])}</b> | <b>₩{format_number(ud['agent_korea_krw'])}</b> | <b>50,000 ₽</b>\n\n"
+        f"Брокер-Владивосток:\n<b>${format_number(ud['broker_russia_usd'])}</b> | <b>₩{format_number(ud['broker_russia_krw'])}</b> | <b>{format_number(ud['broker_russia_rub'])} ₽</b>\n\n"
+        f"СВХ-Владивосток:\n<b>${format_number(ud['svh_russia_usd'])}</b> | <b>₩{format_number(ud['svh_russia_krw'])}</b> | <b>{format_number(ud['svh_russia_rub'])} ₽</b>\n\n"
+        f"Лаборатория, СБКТС, ЭПТС:\n<b>${format_number(ud['lab_russia_usd'])}</b> | <b>₩{format_number(ud['lab_russia_krw'])}</b> | <b>{format_number(ud['lab_russia_rub'])} ₽</b>\n\n"
+        f"Временная регистрация-Владивосток:\n<b>${format_number(ud['perm_registration_russia_usd'])}</b> | <b>₩{format_number(ud['perm_registration_russia_krw'])}</b> | <b>{format_number(ud['perm_registration_russia_rub'])} ₽</b>\n\n"
+        f"<b>Доставку до вашего города уточняйте у менеджера @GetAuto_manager_bot</b>\n\n"
+        "<b>СТОИМОСТЬ ПОД КЛЮЧ АКТУАЛЬНА НА СЕГОДНЯШНИЙ ДЕНЬ, ВОЗМОЖНЫ КОЛЕБАНИЯ КУРСА НА 3-5% ОТ СТОИМОСТИ АВТО, НА МОМЕНТ ПОКУПКИ АВТОМОБИЛЯ</b>\n\n"
+    )
+
+    # Inline buttons for further actions
+    keyboard = types.InlineKeyboardMarkup()
+
+    if call.data.startswith("detail_manual"):
         keyboard.add(
             types.InlineKeyboardButton(
-                "Написать менеджеру", url="https://t.me/GetAuto_manager_bot"
+                "Рассчитать стоимость другого автомобиля",
+                callback_data="calculate_another_manual",
+            )
+        )
+    else:
+        keyboard.add(
+            types.InlineKeyboardButton(
+                "Рассчитать стоимость другого автомобиля",
+                callback_data="calculate_another",
             )
         )
 
-        # Send as a new message (not edit)
-        bot.send_message(
-            call.message.chat.id,
-            result_message,
-            parse_mode="HTML",
-            reply_markup=keyboard,
+    keyboard.add(
+        types.InlineKeyboardButton(
+            "Связаться с менеджером", url="https://t.me/GetAuto_manager_bot"
         )
+    )
+
+    bot.send_message(
+        call.message.chat.id,
+        detail_message,
+        parse_mode="HTML",
+        reply_markup=keyboard,
+    )
+
+
+@callback_router.prefix("technical_report")
+def handle_technical_report_callback(call):
+    user_id = call.message.chat.id
+    entry = get_quote_entry(call.data)
+    if not entry:
+        bot.send_message(user_id, "Данные расчёта не найдены. Попробуйте рассчитать заново.")
         return
 
-    elif call.data.startswith("detail_china"):
-        # Detail view for Chinese car calculations
-        print_message("[ЗАПРОС] ДЕТАЛИЗАЦИЯ РАСЧËТА (КИТАЙ)")
+    bot.send_message(
+        call.message.chat.id,
+        "Запрашиваю отчёт по ДТП. Пожалуйста подождите ⏳",
+    )
 
-        ud = car_data.get(user_id, {})
-        if not ud:
-            bot.send_message(user_id, "Данные расчёта не найдены. Попробуйте рассчитать заново.")
-            return
+    # Retrieve insurance information for the quoted car
+    insurance_info = get_insurance_total(entry.get("vehicle_id", ""), entry.get("vehicle_no", ""))
+    user_car_id = entry.get("car_id", "")
 
-        detail_message = (
-            f"<i>ПЕРВАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
-            f"Задаток (бронь авто):\n<b>¥{format_number(ud['first_payment_cny'])}</b> | <b>{format_number(int(ud['first_payment_rub']))} ₽</b>\n\n\n"
-            f"<i>ВТОРАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
-            f"Стоимость авто (минус задаток):\n<b>¥{format_number(ud['car_price_cny'])}</b> | <b>{format_number(int(ud['car_price_rub']))} ₽</b>\n\n"
-            f"Дилерский сбор:\n<b>¥{format_number(ud['dealer_china_cny'])}</b> | <b>{format_number(int(ud['dealer_china_rub']))} ₽</b>\n\n"
-            f"Доставка, снятие с учёта, оформление:\n<b>¥{format_number(ud['delivery_china_cny'])}</b> | <b>{format_number(int(ud['delivery_china_rub']))} ₽</b>\n\n"
-            f"<b>Итого расходов по Китаю</b>:\n<b>¥{format_number(ud['china_total_cny'])}</b> | <b>{format_number(int(ud['china_total_rub']))} ₽</b>\n\n\n"
-            f"<i>РАСХОДЫ РОССИЯ</i>:\n\n"
-            f"Единая таможенная ставка:\n<b>{format_number(int(ud['customs_duty_rub']))} ₽</b>\n\n"
-            f"Таможенное оформление:\n<b>{format_number(int(ud['customs_fee_rub']))} ₽</b>\n\n"
-            f"Утилизационный сбор:\n<b>{format_number(int(ud['util_fee_rub']))} ₽</b>\n\n"
-            f"Агентские услуги:\n<b>{format_number(ud['agent_russia_rub'])} ₽</b>\n\n"
-            f"Брокер:\n<b>{format_number(ud['broker_russia_rub'])} ₽</b>\n\n"
-            f"СВХ:\n<b>{format_number(ud['svh_russia_rub'])} ₽</b>\n\n"
-            f"Лаборатория, СБКТС, ЭПТС:\n<b>{format_number(ud['lab_russia_rub'])} ₽</b>\n\n"
-            f"<b>Доставку до вашего города уточняйте у менеджера @GetAuto_manager_bot</b>\n\n"
-            "<b>СТОИМОСТЬ ПОД КЛЮЧ АКТУАЛЬНА НА СЕГОДНЯШНИЙ ДЕНЬ, ВОЗМОЖНЫ КОЛЕБАНИЯ КУРСА НА 3-5% ОТ СТОИМОСТИ АВТО, НА МОМЕНТ ПОКУПКИ АВТОМОБИЛЯ</b>\n\n"
+    # Проверка на наличие ошибки
+    if (
+        insurance_info is None
+        or "Нет данных" in insurance_info[0]
+        or "Нет данных" in insurance_info[1]
+    ):
+        error_message = (
+            "Не удалось получить данные о страховых выплатах. \n\n"
+            f'<a href="https://fem.encar.com/cars/report/accident/{user_car_id}">🔗 Посмотреть страховую историю вручную 🔗</a>\n\n\n'
+            f"<b>Найдите две строки:</b>\n\n"
+            f"보험사고 이력 (내차 피해) - Выплаты по представленному автомобилю\n"
+            f"보험사고 이력 (타차 가해) - Выплаты другим участникам ДТП"
         )
 
         # Inline buttons for further actions
         keyboard = types.InlineKeyboardMarkup()
-
-        if call.data == "detail_china_manual":
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another_manual",
-                )
-            )
-        else:
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another",
-                )
+        keyboard.add(
+            types.InlineKeyboardButton(
+                "Рассчитать стоимость другого автомобиля",
+                callback_data="calculate_another",
             )
-
+        )
         keyboard.add(
             types.InlineKeyboardButton(
                 "Связаться с менеджером", url="https://t.me/GetAuto_manager_bot"
             )
         )
 
+        # Отправка сообщения об ошибке
         bot.send_message(
             call.message.chat.id,
-            detail_message,
+            error_message,
             parse_mode="HTML",
             reply_markup=keyboard,
         )
+    else:
+        current_car_insurance_payments = (
+            "0" if len(insurance_info[0]) == 0 else insurance_info[0]
+        )
+        other_car_insurance_payments = (
+            "0" if len(insurance_info[1]) == 0 else insurance_info[1]
+        )
 
-    elif call.data.startswith("detail") or call.data.startswith("detail_manual"):
-        print_message("[ЗАПРОС] ДЕТАЛИЗАЦИЯ РАСЧËТА")
-
-        ud = car_data.get(user_id, {})
-        if not ud:
-            bot.send_message(user_id, "Данные расчёта не найдены. Попробуйте рассчитать заново.")
-            return
-
-        detail_message = (
-            f"<i>ПЕРВАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
-            f"Задаток (бронь авто):\n<b>${format_number(ud['advance_usd'])}</b> | <b>₩1,000,000</b> | <b>{format_number(ud['advance_rub'])} ₽</b>\n\n\n"
-            f"<i>ВТОРАЯ ЧАСТЬ ОПЛАТЫ</i>:\n\n"
-            f"Стоимость автомобиля (за вычетом задатка):\n<b>${format_number(ud['car_price_usd'])}</b> | <b>₩{format_number(ud['car_price_krw'])}</b> | <b>{format_number(ud['car_price_rub'])} ₽</b>\n\n"
-            f"Диллерский сбор:\n<b>${format_number(ud['dealer_korea_usd'])}</b> | <b>₩{format_number(ud['dealer_korea_krw'])}</b> | <b>{format_number(ud['dealer_korea_rub'])} ₽</b>\n\n"
-            f"Доставка, снятие с учёта, оформление:\n<b>${format_number(ud['delivery_korea_usd'])}</b> | <b>₩{format_number(ud['delivery_korea_krw'])}</b> | <b>{format_number(ud['delivery_korea_rub'])} ₽</b>\n\n"
-            f"Транспортировка авто в порт:\n<b>${format_number(ud['transfer_korea_usd'])}</b> | <b>₩{format_number(ud['transfer_korea_krw'])}</b> | <b>{format_number(ud['transfer_korea_rub'])} ₽</b>\n\n"
-            f"Фрахт (Паром до Владивостока):\n<b>${format_number(ud['freight_korea_usd'])}</b> | <b>₩{format_number(ud['freight_korea_krw'])}</b> | <b>{format_number(ud['freight_korea_rub'])} ₽</b>\n\n"
-            f"<b>Итого расходов по Корее</b>:\n<b>${format_number(ud['korea_total_usd'])}</b> | <b>₩{format_number(ud['korea_total_krw'])}</b> | <b>{format_number(ud['korea_total_rub'])} ₽</b>\n\n\n"
-            f"<i>РАСХОДЫ РОССИЯ</i>:\n\n\n"
-            f"Единая таможенная ставка:\n<b>${format_number(ud['customs_duty_usd'])}</b> | <b>₩{format_number(ud['customs_duty_krw'])}</b> | <b>{format_number(ud['customs_duty_rub'])} ₽</b>\n\n"
-            f"Таможенное оформление:\n<b>${format_number(ud['customs_fee_usd'])}</b> | <b>₩{format_number(ud['customs_fee_krw'])}</b> | <b>{format_number(ud['customs_fee_rub'])} ₽</b>\n\n"
-            f"Утилизационный сбор:\n<b>${format_number(ud['util_fee_usd'])}</b> | <b>₩{format_number(ud['util_fee_krw'])}</b> | <b>{format_number(ud['util_fee_rub'])} ₽</b>\n\n\n"
-            f"Агентские услуги по договору:\n<b>${format_number(ud['agent_korea_usd'])}</b> | <b>₩{format_number(ud['agent_korea_krw'])}</b> | <b>50,000 ₽</b>\n\n"
-            f"Брокер-Владивосток:\n<b>${format_number(ud['broker_russia_usd'])}</b> | <b>₩{format_number(ud['broker_russia_krw'])}</b> | <b>{format_number(ud['broker_russia_rub'])} ₽</b>\n\n"
-            f"СВХ-Владивосток:\n<b>${format_number(ud['svh_russia_usd'])}</b> | <b>₩{format_number(ud['svh_russia_krw'])}</b> | <b>{format_number(ud['svh_russia_rub'])} ₽</b>\n\n"
-            f"Лаборатория, СБКТС, ЭПТС:\n<b>${format_number(ud['lab_russia_usd'])}</b> | <b>₩{format_number(ud['lab_russia_krw'])}</b> | <b>{format_number(ud['lab_russia_rub'])} ₽</b>\n\n"
-            f"Временная регистрация-Владивосток:\n<b>${format_number(ud['perm_registration_russia_usd'])}</b> | <b>₩{format_number(ud['perm_registration_russia_krw'])}</b> | <b>{format_number(ud['perm_registration_russia_rub'])} ₽</b>\n\n"
-            f"<b>Доставку до вашего города уточняйте у менеджера @GetAuto_manager_bot</b>\n\n"
-            "<b>СТОИМОСТЬ ПОД КЛЮЧ АКТУАЛЬНА НА СЕГОДНЯШНИЙ ДЕНЬ, ВОЗМОЖНЫ КОЛЕБАНИЯ КУРСА НА 3-5% ОТ СТОИМОСТИ АВТО, НА МОМЕНТ ПОКУПКИ АВТОМОБИЛЯ</b>\n\n"
+        # Construct the message for the technical report
+        tech_report_message = (
+            f"Страховые выплаты по представленному автомобилю: \n<b>{current_car_insurance_payments} ₩</b>\n\n"
+            f"Страховые выплаты другим участникам ДТП: \n<b>{other_car_insurance_payments} ₩</b>\n\n"
+            f'<a href="https://fem.encar.com/cars/report/inspect/{user_car_id}">🔗 Ссылка на схему повреждений кузовных элементов 🔗</a>'
         )
 
         # Inline buttons for further actions
         keyboard = types.InlineKeyboardMarkup()
-
-        if call.data.startswith("detail_manual"):
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another_manual",
-                )
-            )
-        else:
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another",
-                )
+        keyboard.add(
+            types.InlineKeyboardButton(
+                "Рассчитать стоимость другого автомобиля",
+                callback_data="calculate_another",
             )
-
+        )
         keyboard.add(
             types.InlineKeyboardButton(
                 "Связаться с менеджером", url="https://t.me/GetAuto_manager_bot"
@@ -2516,150 +2666,79 @@ def handle_callback_query(call):
 
         bot.send_message(
             call.message.chat.id,
-            detail_message,
+            tech_report_message,
             parse_mode="HTML",
             reply_markup=keyboard,
         )
 
-    elif call.data == "technical_report":
-        bot.send_message(
-            call.message.chat.id,
-            "Запрашиваю отчёт по ДТП. Пожалуйста подождите ⏳",
-        )
 
-        # Retrieve insurance information (per-user)
-        insurance_info = get_insurance_total(user_id)
-        user_car_id = car_id_external.get(user_id, "")
+@callback_router.exact("calculate_another")
+def handle_calculate_another_callback(call):
+    bot.send_message(
+        call.message.chat.id,
+        "Пожалуйста, введите ссылку на автомобиль с сайта www.encar.com или che168.com:",
+    )
 
-        # Проверка на наличие ошибки
-        if (
-            insurance_info is None
-            or "Нет данных" in insurance_info[0]
-            or "Нет данных" in insurance_info[1]
-        ):
-            error_message = (
-                "Не удалось получить данные о страховых выплатах. \n\n"
-                f'<a href="https://fem.encar.com/cars/report/accident/{user_car_id}">🔗 Посмотреть страховую историю вручную 🔗</a>\n\n\n'
-                f"<b>Найдите две строки:</b>\n\n"
-                f"보험사고 이력 (내차 피해) - Выплаты по представленному автомобилю\n"
-                f"보험사고 이력 (타차 가해) - Выплаты другим участникам ДТП"
-            )
 
-            # Inline buttons for further actions
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another",
-                )
-            )
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Связаться с менеджером", url="https://t.me/GetAuto_manager_bot"
-                )
-            )
+@callback_router.exact("calculate_another_manual")
+def handle_calculate_another_manual_callback(call):
+    user_id = call.message.chat.id
+    user_manual_input[user_id] = {}  # Очищаем старые данные пользователя
+    bot.send_message(user_id, "Введите месяц выпуска (например, 10 для октября):")
+    bot.register_next_step_handler(call.message, process_manual_month)
+
+
+@callback_router.exact("main_menu")
+def handle_main_menu_callback(call):
+    bot.send_message(
+        call.message.chat.id, "📌 Главное меню", reply_markup=main_menu()
+    )
 
-            # Отправка сообщения об ошибке
+
+@callback_router.exact("check_subscription")
+def handle_check_subscription_callback(call):
+    user_id = call.message.chat.id
+    print(f"Проверка подписки для пользователя {user_id}")
+
+    try:
+        # Пользователь только что подписался — проверяем заново, минуя кэш
+        subscription_cache.pop(user_id)
+        if is_subscribed(user_id, use_cache=False):
             bot.send_message(
-                call.message.chat.id,
-                error_message,
-                parse_mode="HTML",
-                reply_markup=keyboard,
+                user_id,
+                "✅ Вы успешно подписаны! Теперь можете пользоваться ботом.",
+                reply_markup=main_menu(),
             )
+            print(f"Пользователь {user_id} успешно подписан")
         else:
-            current_car_insurance_payments = (
-                "0" if len(insurance_info[0]) == 0 else insurance_info[0]
-            )
-            other_car_insurance_payments = (
-                "0" if len(insurance_info[1]) == 0 else insurance_info[1]
-            )
-
-            # Construct the message for the technical report
-            tech_report_message = (
-                f"Страховые выплаты по представленному автомобилю: \n<b>{current_car_insurance_payments} ₩</b>\n\n"
-                f"Страховые выплаты другим участникам ДТП: \n<b>{other_car_insurance_payments} ₩</b>\n\n"
-                f'<a href="https://fem.encar.com/cars/report/inspect/{user_car_id}">🔗 Ссылка на схему повреждений кузовных элементов 🔗</a>'
-            )
-
-            # Inline buttons for further actions
             keyboard = types.InlineKeyboardMarkup()
             keyboard.add(
                 types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another",
+                    "🔗 Подписаться", url="https://t.me/Getauto_kor"
                 )
             )
             keyboard.add(
                 types.InlineKeyboardButton(
-                    "Связаться с менеджером", url="https://t.me/GetAuto_manager_bot"
+                    "✅ Проверить подписку", callback_data="check_subscription"
                 )
             )
-
             bot.send_message(
-                call.message.chat.id,
-                tech_report_message,
-                parse_mode="HTML",
+                user_id,
+                "🚫 Вы еще не подписались на канал! Подпишитесь и попробуйте снова.",
                 reply_markup=keyboard,
             )
-
-    elif call.data == "calculate_another":
-        bot.send_message(
-            call.message.chat.id,
-            "Пожалуйста, введите ссылку на автомобиль с сайта www.encar.com или che168.com:",
-        )
-
-    elif call.data == "calculate_another_manual":
-        user_manual_input[user_id] = {}  # Очищаем старые данные пользователя
-        bot.send_message(user_id, "Введите месяц выпуска (например, 10 для октября):")
-        bot.register_next_step_handler(call.message, process_manual_month)
-
-    elif call.data == "main_menu":
+            print(f"Пользователь {user_id} не подписан на канал")
+    except Exception as e:
+        print(f"Ошибка при обработке проверки подписки: {e}")
         bot.send_message(
-            call.message.chat.id, "📌 Главное меню", reply_markup=main_menu()
+            user_id,
+            "Произошла ошибка при проверке подписки. Пожалуйста, попробуйте позже.",
+            reply_markup=main_menu(),
         )
 
-    elif call.data == "check_subscription":
-        print(f"Проверка подписки для пользователя {user_id}")
-
-        try:
-            if is_subscribed(user_id):
-                bot.send_message(
-                    user_id,
-                    "✅ Вы успешно подписаны! Теперь можете пользоваться ботом.",
-                    reply_markup=main_menu(),
-                )
-                print(f"Пользователь {user_id} успешно подписан")
-            else:
-                keyboard = types.InlineKeyboardMarkup()
-                keyboard.add(
-                    types.InlineKeyboardButton(
-                        "🔗 Подписаться", url="https://t.me/Getauto_kor"
-                    )
-                )
-                keyboard.add(
-                    types.InlineKeyboardButton(
-                        "✅ Проверить подписку", callback_data="check_subscription"
-                    )
-                )
-                bot.send_message(
-                    user_id,
-                    "🚫 Вы еще не подписались на канал! Подпишитесь и попробуйте снова.",
-                    reply_markup=keyboard,
-                )
-                print(f"Пользователь {user_id} не подписан на канал")
-        except Exception as e:
-            print(f"Ошибка при обработке проверки подписки: {e}")
-            bot.send_message(
-                user_id,
-                "Произошла ошибка при проверке подписки. Пожалуйста, попробуйте позже.",
-                reply_markup=main_menu(),
-            )
-
 
 @bot.message_handler(func=lambda message: True)
 def handle_message(message):
-    global user_manual_input, user_manual_china_input
-
     user_id = message.chat.id
     user_message = message.text.strip()
 
@@ -2680,82 +2759,114 @@ def handle_message(message):
         )
         return  # Прерываем выполнение
 
-    # Проверяем нажатие кнопки "Рассчитать автомобиль" (Korea)
-    if user_message == CALCULATE_CAR_TEXT:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите ссылку на автомобиль с сайта www.encar.com или che168.com:",
-        )
+    message_router.dispatch(user_message, message)
 
-    elif user_message == MANUAL_CAR_TEXT:
-        user_manual_input[user_id] = {}  # Создаём пустой словарь для пользователя
-        bot.send_message(user_id, "Введите месяц выпуска (например, 10 для октября):")
-        bot.register_next_step_handler(message, process_manual_month)
 
-    # Проверяем нажатие кнопки "Рассчитать автомобиль" (China)
-    elif user_message == CALCULATE_CHINA_CAR_TEXT:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите ссылку на автомобиль с сайта che168.com:",
-        )
+# Проверяем нажатие кнопки "Рассчитать автомобиль" (Korea)
+@message_router.exact(CALCULATE_CAR_TEXT)
+def handle_calculate_car_text(message):
+    bot.send_message(
+        message.chat.id,
+        "Пожалуйста, введите ссылку на автомобиль с сайта www.encar.com или che168.com:",
+    )
 
-    elif user_message == MANUAL_CHINA_CAR_TEXT:
-        user_manual_china_input[user_id] = {}  # Создаём пустой словарь для пользователя
-        bot.send_message(user_id, "Введите месяц первой регистрации (например, 1 для января):")
-        bot.register_next_step_handler(message, process_china_manual_month)
 
-    # Проверка на корректность ссылки Encar (Korea)
-    elif re.match(r"^https?://(www|fem)\.encar\.com/.*", user_message):
-        calculate_cost(user_message, message)
+@message_router.exact(MANUAL_CAR_TEXT)
+def handle_manual_car_text(message):
+    user_id = message.chat.id
+    user_manual_input[user_id] = {}  # Создаём пустой словарь для пользователя
+    bot.send_message(user_id, "Введите месяц выпуска (например, 10 для октября):")
+    bot.register_next_step_handler(message, process_manual_month)
 
-    # Проверка на корректность ссылки Che168 (China)
-    elif is_che168_url(user_message):
-        calculate_china_cost(user_message, message)
 
-    # Проверка на другие команды
-    elif user_message == "Написать менеджеру":
-        bot.send_message(
-            message.chat.id,
-            "Вы можете связаться с менеджером по ссылке: @GetAuto_manager_bot",
-        )
-    elif user_message == "Написать в WhatsApp":
-        whatsapp_link = "https://wa.me/821030485191"  # Владимир Кан
+# Проверяем нажатие кнопки "Рассчитать автомобиль" (China)
+@message_router.exact(CALCULATE_CHINA_CAR_TEXT)
+def handle_calculate_china_car_text(message):
+    bot.send_message(
+        message.chat.id,
+        "Пожалуйста, введите ссылку на автомобиль с сайта che168.com:",
+    )
 
-        message_text = f"{whatsapp_link} - Владимир (Корея)"
 
-        bot.send_message(
-            message.chat.id,
-            message_text,
-        )
-    elif user_message == "Почему стоит выбрать нас?":
-        about_message = (
-            "🔹 *Почему выбирают GetAuto?*\n\n"
-            "🚗 *Экспертный опыт* — Мы знаем все нюансы подбора и доставки авто из Южной Кореи и Китая.\n\n"
-            "🎯 *Индивидуальный подход* — Учитываем все пожелания клиентов, подбираем оптимальный вариант.\n\n"
-            "🔧 *Комплексное обслуживание* — Полное сопровождение на всех этапах сделки.\n\n"
-            "✅ *Гарантированное качество* — Проверенные авто, прозрачная история и состояние.\n\n"
-            "💰 *Прозрачность ценообразования* — Честные цены, без скрытых платежей и комиссий.\n\n"
-            "🚛 *Надежная логистика* — Организуем доставку авто в любую точку СНГ.\n\n"
-            f"📲 Свяжитесь с нами и получите расчёт прямо сейчас! @GetAuto\\_manager\\_bot"
-        )
-        bot.send_message(message.chat.id, about_message, parse_mode="Markdown")
+@message_router.exact(MANUAL_CHINA_CAR_TEXT)
+def handle_manual_china_car_text(message):
+    user_id = message.chat.id
+    user_manual_china_input[user_id] = {}  # Создаём пустой словарь для пользователя
+    bot.send_message(user_id, "Введите месяц первой регистрации (например, 1 для января):")
+    bot.register_next_step_handler(message, process_china_manual_month)
 
-    elif user_message == "Мы в соц. сетях":
-        channel_link = "https://t.me/Getauto_kor"
-        instagram_link = "https://www.instagram.com/getauto_korea"
-        youtube_link = "https://youtube.com/@getauto_korea"
-        dzen_link = "https://dzen.ru/getauto_ru"
-        vk_link = "https://vk.com/getauto_korea"
 
-        message_text = f"Наш Телеграм Канал: \n{channel_link}\n\nНаш Инстаграм: \n{instagram_link}\n\nНаш YouTube Канал: \n{youtube_link}\n\nМы на Dzen: \n{dzen_link}\n\nМы в ВК: \n{vk_link}\n\n"
+# Проверка на корректность ссылки Encar (Korea)
+@message_router.match(ENCAR_URL_RE.match, "encar_url")
+def handle_encar_url(message):
+    user_id = message.chat.id
+    user_message = message.text.strip()
+    submit_quote_job(user_id, calculate_cost, user_message, message, key=user_message)
 
-        bot.send_message(message.chat.id, message_text)
 
-    else:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите корректную ссылку на автомобиль с сайта encar.com (Корея) или che168.com (Китай).",
-        )
+# Проверка на корректность ссылки Che168 (China)
+@message_router.match(is_che168_url, "che168_url")
+def handle_che168_url(message):
+    user_id = message.chat.id
+    user_message = message.text.strip()
+    submit_quote_job(user_id, calculate_china_cost, user_message, message, key=user_message)
+
+
+# Проверка на другие команды
+@message_router.exact("Написать менеджеру")
+def handle_manager_text(message):
+    bot.send_message(
+        message.chat.id,
+        "Вы можете связаться с менеджером по ссылке: @GetAuto_manager_bot",
+    )
+
+
+@message_router.exact("Написать в WhatsApp")
+def handle_whatsapp_text(message):
+    whatsapp_link = "https://wa.me/821030485191"  # Владимир Кан
+
+    message_text = f"{whatsapp_link} - Владимир (Корея)"
+
+    bot.send_message(
+        message.chat.id,
+        message_text,
+    )
+
+
+@message_router.exact("Почему стоит выбрать нас?")
+def handle_about_text(message):
+    about_message = (
+        "🔹 *Почему выбирают GetAuto?*\n\n"
+        "🚗 *Экспертный опыт* — Мы знаем все нюансы подбора и доставки авто из Южной Кореи и Китая.\n\n"
+        "🎯 *Индивидуальный подход* — Учитываем все пожелания клиентов, подбираем оптимальный вариант.\n\n"
+        "🔧 *Комплексное обслуживание* — Полное сопровождение на всех этапах сделки.\n\n"
+        "✅ *Гарантированное качество* — Проверенные авто, прозрачная история и состояние.\n\n"
+        "💰 *Прозрачность ценообразования* — Честные цены, без скрытых платежей и комиссий.\n\n"
+        "🚛 *Надежная логистика* — Организуем доставку авто в любую точку СНГ.\n\n"
+        f"📲 Свяжитесь с нами и получите расчёт прямо сейчас! @GetAuto\\_manager\\_bot"
+    )
+    bot.send_message(message.chat.id, about_message, parse_mode="Markdown")
+
+
+@message_router.exact("Мы в соц. сетях")
+def handle_social_text(message):
+    channel_link = "https://t.me/Getauto_kor"
+    instagram_link = "https://www.instagram.com/getauto_korea"
+    youtube_link = "https://youtube.com/@getauto_korea"
+    dzen_link = "https://dzen.ru/getauto_ru"
+    vk_link = "https://vk.com/getauto_korea"
+
+    message_text = f"Наш Телеграм Канал: \n{channel_link}\n\nНаш Инстаграм: \n{instagram_link}\n\nНаш YouTube Канал: \n{youtube_link}\n\nМы на Dzen: \n{dzen_link}\n\nМы в ВК: \n{vk_link}\n\n"
+
+    bot.send_message(message.chat.id, message_text)
+
+
+@message_router.fallback
+def handle_unknown_text(message):
+    bot.send_message(
+        message.chat.id,
+        "Пожалуйста, введите корректную ссылку на автомобиль с сайта encar.com (Корея) или che168.com (Китай).",
+    )
 
 
 #######################
@@ -2778,7 +2889,7 @@ def process_manual_month(message):
         return
 
     # Если всё ок, продолжаем ввод данных
-    user_manual_input[user_id]["month"] = int(user_input)
+    user_manual_input.patch(user_id, month=int(user_input))
     bot.send_message(
         user_id, "✅ Отлично! Теперь введите год выпуска (например, 2021):"
     )
@@ -2804,7 +2915,7 @@ def process_manual_year(message):
         bot.register_next_step_handler(message, process_manual_year)
         return
 
-    user_manual_input[user_id]["year"] = int(user_input)
+    user_manual_input.patch(user_id, year=int(user_input))
     bot.send_message(user_id, "Введите объём двигателя в CC (например, 2000):")
     bot.register_next_step_handler(message, process_manual_engine)
 
@@ -2826,7 +2937,7 @@ def process_manual_engine(message):
         bot.register_next_step_handler(message, process_manual_engine)
         return
 
-    user_manual_input[user_id]["engine_volume"] = int(user_input)
+    user_manual_input.patch(user_id, engine_volume=int(user_input))
     # Ask for HP next (required from December 1st for utilization fee calculation)
     bot.send_message(
         user_id, "Введите мощность двигателя в л.с. (например: 150):"
@@ -2854,7 +2965,7 @@ def process_manual_horsepower(message):
         return
 
     # Note: HP is NOT cached for manual calculations (no Make/Model info available)
-    user_manual_input[user_id]["horsepower"] = int(user_input)
+    user_manual_input.patch(user_id, horsepower=int(user_input))
     bot.send_message(
         user_id, "Введите стоимость автомобиля в Корее (например, 30000000):"
     )
@@ -2879,7 +2990,7 @@ def process_manual_price(message):
         bot.register_next_step_handler(message, process_manual_price)
         return
 
-    user_manual_input[user_id]["price_krw"] = int(user_input)
+    user_manual_input.patch(user_id, price_krw=int(user_input))
 
     # Показываем выбор типа двигателя
     bot.send_message(
@@ -2932,6 +3043,9 @@ def calculate_manual_cost(user_id):
         engine_type=fuel_type,  # Pass user-selected fuel type
     )
 
+    if job_superseded():
+        return
+
     if not response["ok"]:
         if response["reason"] == "rate_limited":
             bot.send_message(
@@ -2959,74 +3073,12 @@ def calculate_manual_cost(user_id):
     )
     total_cost = pricing["total_rub"]
 
-    # Store car_data for detail view (per-user)
-    car_data[user_id] = {}
-    car_data[user_id]["agent_korea_rub"] = AGENT_FEE_RUB
-    car_data[user_id]["agent_korea_usd"] = AGENT_FEE_RUB / usd_rate
-    car_data[user_id]["agent_korea_krw"] = AGENT_FEE_RUB / krw_rub_rate
-
-    car_data[user_id]["advance_rub"] = 1000000 * krw_rub_rate
-    car_data[user_id]["advance_usd"] = (1000000 * krw_rub_rate) / usd_rate
-    car_data[user_id]["advance_krw"] = 1000000
-
-    # Задаток 1 млн. вон
-    car_data[user_id]["car_price_krw"] = price_krw - 1000000
-    car_data[user_id]["car_price_usd"] = (price_krw - 1000000) * krw_rub_rate / usd_rate
-    car_data[user_id]["car_price_rub"] = (price_krw - 1000000) * krw_rub_rate
-
-    car_data[user_id]["dealer_korea_usd"] = DEALER_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["dealer_korea_krw"] = DEALER_KRW
-    car_data[user_id]["dealer_korea_rub"] = DEALER_KRW * krw_rub_rate
-
-    car_data[user_id]["delivery_korea_usd"] = KOREA_DELIVERY_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["delivery_korea_krw"] = KOREA_DELIVERY_KRW
-    car_data[user_id]["delivery_korea_rub"] = KOREA_DELIVERY_KRW * krw_rub_rate
-
-    car_data[user_id]["transfer_korea_usd"] = TRANSFER_TO_PORT_KRW * krw_rub_rate / usd_rate
-    car_data[user_id]["transfer_korea_krw"] = TRANSFER_TO_PORT_KRW
-    car_data[user_id]["transfer_korea_rub"] = TRANSFER_TO_PORT_KRW * krw_rub_rate
-
-    car_data[user_id]["freight_korea_usd"] = SEA_FREIGHT_USD
-    car_data[user_id]["freight_korea_krw"] = SEA_FREIGHT_USD * usd_rate / krw_rub_rate
-    car_data[user_id]["freight_korea_rub"] = SEA_FREIGHT_USD * usd_rate
-
-    car_data[user_id]["korea_total_usd"] = pricing["korea_operating_rub"] / usd_rate
-    car_data[user_id]["korea_total_krw"] = pricing["korea_operating_rub"] / krw_rub_rate
-    car_data[user_id]["korea_total_rub"] = pricing["korea_operating_rub"]
-
-    # Расходы Россия
-    car_data[user_id]["customs_duty_usd"] = customs_duty / usd_rate
-    car_data[user_id]["customs_duty_krw"] = customs_duty * rub_to_krw_rate
-    car_data[user_id]["customs_duty_rub"] = customs_duty
-
-    car_data[user_id]["customs_fee_usd"] = customs_fee / usd_rate
-    car_data[user_id]["customs_fee_krw"] = customs_fee / krw_rub_rate
-    car_data[user_id]["customs_fee_rub"] = customs_fee
-
-    car_data[user_id]["util_fee_usd"] = recycling_fee / usd_rate
-    car_data[user_id]["util_fee_krw"] = recycling_fee / krw_rub_rate
-    car_data[user_id]["util_fee_rub"] = recycling_fee
-
-    broker_rub = pricing["broker_rub"]
-    svh_rub = russia_fees["svh_rub"]
-    lab_rub = russia_fees["lab_rub"]
-    perm_reg_rub = russia_fees["perm_registration_rub"]
-
-    car_data[user_id]["broker_russia_usd"] = broker_rub / usd_rate
-    car_data[user_id]["broker_russia_krw"] = broker_rub * rub_to_krw_rate
-    car_data[user_id]["broker_russia_rub"] = broker_rub
-
-    car_data[user_id]["svh_russia_usd"] = svh_rub / usd_rate
-    car_data[user_id]["svh_russia_krw"] = svh_rub / krw_rub_rate
-    car_data[user_id]["svh_russia_rub"] = svh_rub
-
-    car_data[user_id]["lab_russia_usd"] = lab_rub / usd_rate
-    car_data[user_id]["lab_russia_krw"] = lab_rub / krw_rub_rate
-    car_data[user_id]["lab_russia_rub"] = lab_rub
-
-    car_data[user_id]["perm_registration_russia_usd"] = perm_reg_rub / usd_rate
-    car_data[user_id]["perm_registration_russia_krw"] = perm_reg_rub / krw_rub_rate
-    car_data[user_id]["perm_registration_russia_rub"] = perm_reg_rub
+    # Store the quote for "Детали расчёта"
+    quote_id = save_quote(
+        KoreaQuote.create(
+            price_krw, customs_duty, customs_fee, recycling_fee, russia_fees, krw_rub_rate, usd_rate, rub_to_krw_rate
+        )
+    )
 
     # Get fuel type name for display
     fuel_type_name = FUEL_TYPE_NAMES.get(fuel_type, "Бензин")
@@ -3046,7 +3098,7 @@ def calculate_manual_cost(user_id):
     # Клавиатура с действиями
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
-        types.InlineKeyboardButton("Детали расчёта", callback_data="detail_manual")
+        types.InlineKeyboardButton("Детали расчёта", callback_data=f"detail_manual:{quote_id}")
     )
     keyboard.add(
         types.InlineKeyboardButton(
@@ -3066,6 +3118,19 @@ def calculate_manual_cost(user_id):
 # Run the bot
 if __name__ == "__main__":
     rub_to_krw_rate = get_rub_to_krw_rate()
+    warm_translation_cache()
+    hp_cache.load()
+    hp_cache.start_resync()
+    broadcast_engine.resume_unfinished()
+    resume_broadcast_drafts()
     get_currency_rates()
     set_bot_commands()
-    bot.infinity_polling(timeout=30, long_polling_timeout=30)
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise SystemExit("BOT_MODE=webhook requires WEBHOOK_URL")
+        webhook_server = WebhookServer(bot)
+        webhook_server.register(WEBHOOK_URL)
+        webhook_server.serve_forever()
+    else:
+        bot.remove_webhook()
+        bot.infinity_polling(timeout=30, long_polling_timeout=30)
@@ -0,0 +1,165 @@
+"""
+Learn Chinese fragment -> English mappings from the translation cache.
+
+Every cached title pair is aligned against the brand/term-mapped title:
+the English words the mappings produce (brands, years, trims, engine
+codes) are anchors, and the Chinese fragments left between two anchors
+must have been translated to the English text between the same anchors in
+the cached translation. A fragment is kept when enough titles agree on
+its translation.
+
+The result is written as a JSON object that chinese_translator.py loads at
+import (LEARNED_TRANSLATIONS_FILE), so those fragments are translated
+locally and the network translator is needed for fewer titles.
+
+Run with:  python3 mine_translation_dictionary.py [--min-support 3] [--min-agreement 0.7]
+"""
+
+import re
+import json
+import logging
+import argparse
+from collections import Counter, defaultdict
+
+from dotenv import load_dotenv
+
+from db import get_connection, is_configured
+from chinese_translator import (
+    BRAND_TRANSLATIONS,
+    TERM_TRANSLATIONS,
+    LEARNED_TRANSLATIONS_FILE,
+    _CHINESE_SEGMENT_RE,
+    _apply_brand_mapping,
+    _apply_term_mapping,
+    _has_chinese,
+)
+
+MIN_SUPPORT = 3  # titles that must agree on a fragment's translation
+MIN_AGREEMENT = 0.7  # share of a fragment's alignments that must agree
+MAX_FRAGMENT_WORDS = 4  # longer English spans are most likely misalignments
+
+
+def _find_word(text, word, start):
+    """(start, end) of `word` as a whole word in text[start:], case-insensitive."""
+    match = re.compile(r"(?<!\w)" + re.escape(word) + r"(?!\w)", re.IGNORECASE).search(text, start)
+    return match.span() if match else None
+
+
+def _is_plausible(english):
+    words = english.split()
+    return (
+        0 < len(words) <= MAX_FRAGMENT_WORDS
+        and not _has_chinese(english)
+        and any(char.isalpha() for char in english)
+    )
+
+
+def align_pair(chinese_text: str, english_text: str) -> list[tuple[str, str]]:
+    """
+    Align one cached translation with its mapped title.
+
+    Returns:
+        [(chinese_fragment, english_span)] for fragments bounded by anchors
+        found in the translation; alignment stops at the first anchor that
+        can't be found.
+    """
+    mapped = _apply_term_mapping(_apply_brand_mapping(chinese_text))
+
+    # Anchor words and Chinese fragments in title order
+    items = []
+    position = 0
+    for match in _CHINESE_SEGMENT_RE.finditer(mapped):
+        items.extend(("anchor", word) for word in mapped[position:match.start()].split())
+        items.append(("fragment", match.group()))
+        position = match.end()
+    items.extend(("anchor", word) for word in mapped[position:].split())
+
+    aligned = []
+    cursor = 0
+    pending = None  # (fragment or None if ambiguous, span start)
+    for kind, value in items:
+        if kind == "fragment":
+            # Two fragments with no anchor between them can't be told apart
+            pending = (value if pending is None else None, cursor)
+            continue
+
+        span = _find_word(english_text, value, cursor)
+        if span is None:
+            break
+        if pending is not None:
+            fragment, start = pending
+            if fragment is not None:
+                aligned.append((fragment, english_text[start:span[0]]))
+            pending = None
+        cursor = span[1]
+    else:
+        if pending is not None and pending[0] is not None:
+            aligned.append((pending[0], english_text[pending[1]:]))
+
+    return [
+        (fragment, english.strip(" ,;-"))
+        for fragment, english in aligned
+        if _is_plausible(english.strip(" ,;-"))
+    ]
+
+
+def mine(pairs, min_support=MIN_SUPPORT, min_agreement=MIN_AGREEMENT) -> dict[str, str]:
+    """
+    Learn fragment translations from (chinese_text, english_text) pairs.
+
+    Returns:
+        {chinese_fragment: english} for fragments whose most common
+        translation has at least `min_support` votes and `min_agreement`
+        of all votes
+    """
+    votes = defaultdict(Counter)
+    for chinese_text, english_text in pairs:
+        for fragment, english in align_pair(chinese_text, english_text):
+            if fragment not in BRAND_TRANSLATIONS and fragment not in TERM_TRANSLATIONS:
+                votes[fragment][english] += 1
+
+    learned = {}
+    for fragment, counter in votes.items():
+        english, count = counter.most_common(1)[0]
+        if count >= min_support and count / sum(counter.values()) >= min_agreement:
+            learned[fragment] = english
+    return learned
+
+
+def load_pairs(limit=None):
+    """(chinese_text, english_text) rows from translation_cache."""
+    query = "SELECT chinese_text, english_text FROM translation_cache"
+    params = ()
+    if limit:
+        query += " ORDER BY last_used_at DESC LIMIT %s"
+        params = (limit,)
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default=LEARNED_TRANSLATIONS_FILE, help="JSON file to write")
+    parser.add_argument("--min-support", type=int, default=MIN_SUPPORT)
+    parser.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the N most recently used cached titles")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    if not is_configured():
+        raise SystemExit("DATABASE_URL is not set")
+
+    pairs = load_pairs(args.limit)
+    learned = mine(pairs, args.min_support, args.min_agreement)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(learned.items())), f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"Learned {len(learned)} fragment translations from {len(pairs)} cached titles -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
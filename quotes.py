@@ -0,0 +1,220 @@
+"""
+Compact quote records for the "Детали расчёта" view.
+
+A quote keeps only the inputs of a calculation (price, customs payments,
+fees and the exchange rates it was made with). The per-currency breakdown
+shown by the detail callbacks is derived from them on demand, so a quote
+costs a handful of numbers per user instead of ~45 precomputed floats.
+
+Records are stored in the per-user state as short JSON lists
+(to_record() / load_quote()), which works with every state backend.
+"""
+
+import secrets
+
+from utils import (
+    compute_turnkey_total,
+    AGENT_FEE_RUB,
+    DEALER_KRW,
+    KOREA_DELIVERY_KRW,
+    TRANSFER_TO_PORT_KRW,
+    SEA_FREIGHT_USD,
+    CHINA_FIRST_PAYMENT,
+    CHINA_DEALER_FEE,
+    CHINA_DELIVERY,
+    CHINA_BROKER_FEE,
+    CHINA_AGENT_FEE,
+    CHINA_SVH_FEE,
+    CHINA_LAB_FEE,
+)
+
+KOREA_ADVANCE_KRW = 1000000  # Задаток 1 млн. вон
+
+
+class KoreaQuote:
+    """Inputs of a Korea turn-key calculation."""
+
+    __slots__ = (
+        "price_krw",
+        "customs_duty_rub",
+        "customs_fee_rub",
+        "util_fee_rub",
+        "svh_rub",
+        "lab_rub",
+        "perm_registration_rub",
+        "krw_rub",
+        "usd_rub",
+        "rub_krw",
+    )
+    kind = "korea"
+
+    def __init__(
+        self,
+        price_krw,
+        customs_duty_rub,
+        customs_fee_rub,
+        util_fee_rub,
+        svh_rub,
+        lab_rub,
+        perm_registration_rub,
+        krw_rub,
+        usd_rub,
+        rub_krw,
+    ):
+        self.price_krw = price_krw
+        self.customs_duty_rub = customs_duty_rub
+        self.customs_fee_rub = customs_fee_rub
+        self.util_fee_rub = util_fee_rub
+        self.svh_rub = svh_rub
+        self.lab_rub = lab_rub
+        self.perm_registration_rub = perm_registration_rub
+        self.krw_rub = krw_rub
+        self.usd_rub = usd_rub
+        self.rub_krw = rub_krw
+
+    @classmethod
+    def create(cls, price_krw, customs_duty_rub, customs_fee_rub, util_fee_rub, russia_fees, krw_rub, usd_rub, rub_krw):
+        return cls(
+            price_krw,
+            customs_duty_rub,
+            customs_fee_rub,
+            util_fee_rub,
+            russia_fees["svh_rub"],
+            russia_fees["lab_rub"],
+            russia_fees["perm_registration_rub"],
+            krw_rub,
+            usd_rub,
+            rub_krw,
+        )
+
+    def breakdown(self) -> dict:
+        """Per-line USD/KRW/RUB amounts used by the detail view."""
+        krw_rub, usd_rub, rub_krw = self.krw_rub, self.usd_rub, self.rub_krw
+        pricing = compute_turnkey_total(
+            price_krw=self.price_krw,
+            krw_rub=krw_rub,
+            usd_rub=usd_rub,
+            customs_duty_rub=self.customs_duty_rub,
+            customs_fee_rub=self.customs_fee_rub,
+            recycling_fee_rub=self.util_fee_rub,
+            russia_fees={
+                "svh_rub": self.svh_rub,
+                "lab_rub": self.lab_rub,
+                "perm_registration_rub": self.perm_registration_rub,
+            },
+        )
+        car_price_krw = self.price_krw - KOREA_ADVANCE_KRW
+        broker_rub = pricing["broker_rub"]
+        korea_total_rub = pricing["korea_operating_rub"]
+
+        return {
+            "agent_korea_rub": AGENT_FEE_RUB,
+            "agent_korea_usd": AGENT_FEE_RUB / usd_rub,
+            "agent_korea_krw": AGENT_FEE_RUB / krw_rub,
+            "advance_rub": KOREA_ADVANCE_KRW * krw_rub,
+            "advance_usd": (KOREA_ADVANCE_KRW * krw_rub) / usd_rub,
+            "advance_krw": KOREA_ADVANCE_KRW,
+            "car_price_krw": car_price_krw,
+            "car_price_usd": car_price_krw * krw_rub / usd_rub,
+            "car_price_rub": car_price_krw * krw_rub,
+            "dealer_korea_usd": DEALER_KRW * krw_rub / usd_rub,
+            "dealer_korea_krw": DEALER_KRW,
+            "dealer_korea_rub": DEALER_KRW * krw_rub,
+            "delivery_korea_usd": KOREA_DELIVERY_KRW * krw_rub / usd_rub,
+            "delivery_korea_krw": KOREA_DELIVERY_KRW,
+            "delivery_korea_rub": KOREA_DELIVERY_KRW * krw_rub,
+            "transfer_korea_usd": TRANSFER_TO_PORT_KRW * krw_rub / usd_rub,
+            "transfer_korea_krw": TRANSFER_TO_PORT_KRW,
+            "transfer_korea_rub": TRANSFER_TO_PORT_KRW * krw_rub,
+            "freight_korea_usd": SEA_FREIGHT_USD,
+            "freight_korea_krw": SEA_FREIGHT_USD * usd_rub / krw_rub,
+            "freight_korea_rub": SEA_FREIGHT_USD * usd_rub,
+            "korea_total_usd": korea_total_rub / usd_rub,
+            "korea_total_krw": korea_total_rub / krw_rub,
+            "korea_total_rub": korea_total_rub,
+            "customs_duty_usd": self.customs_duty_rub / usd_rub,
+            "customs_duty_krw": self.customs_duty_rub * rub_krw,
+            "customs_duty_rub": self.customs_duty_rub,
+            "customs_fee_usd": self.customs_fee_rub / usd_rub,
+            "customs_fee_krw": self.customs_fee_rub / krw_rub,
+            "customs_fee_rub": self.customs_fee_rub,
+            "util_fee_usd": self.util_fee_rub / usd_rub,
+            "util_fee_krw": self.util_fee_rub / krw_rub,
+            "util_fee_rub": self.util_fee_rub,
+            "broker_russia_usd": broker_rub / usd_rub,
+            "broker_russia_krw": broker_rub * rub_krw,
+            "broker_russia_rub": broker_rub,
+            "svh_russia_usd": self.svh_rub / usd_rub,
+            "svh_russia_krw": self.svh_rub / krw_rub,
+            "svh_russia_rub": self.svh_rub,
+            "lab_russia_usd": self.lab_rub / usd_rub,
+            "lab_russia_krw": self.lab_rub / krw_rub,
+            "lab_russia_rub": self.lab_rub,
+            "perm_registration_russia_usd": self.perm_registration_rub / usd_rub,
+            "perm_registration_russia_krw": self.perm_registration_rub / krw_rub,
+            "perm_registration_russia_rub": self.perm_registration_rub,
+        }
+
+    def to_record(self) -> list:
+        return [self.kind] + [getattr(self, name) for name in self.__slots__]
+
+
+class ChinaQuote:
+    """Inputs of a China (Che168) turn-key calculation."""
+
+    __slots__ = ("price_cny", "customs_duty_rub", "customs_fee_rub", "util_fee_rub", "cny_rub")
+    kind = "china"
+
+    def __init__(self, price_cny, customs_duty_rub, customs_fee_rub, util_fee_rub, cny_rub):
+        self.price_cny = price_cny
+        self.customs_duty_rub = customs_duty_rub
+        self.customs_fee_rub = customs_fee_rub
+        self.util_fee_rub = util_fee_rub
+        self.cny_rub = cny_rub
+
+    def breakdown(self) -> dict:
+        """Per-line CNY/RUB amounts used by the detail view."""
+        cny_rub = self.cny_rub
+        car_price_cny = self.price_cny - CHINA_FIRST_PAYMENT
+        china_total_cny = car_price_cny + CHINA_DEALER_FEE + CHINA_DELIVERY
+
+        return {
+            "first_payment_cny": CHINA_FIRST_PAYMENT,
+            "first_payment_rub": CHINA_FIRST_PAYMENT * cny_rub,
+            "car_price_cny": car_price_cny,
+            "car_price_rub": car_price_cny * cny_rub,
+            "dealer_china_cny": CHINA_DEALER_FEE,
+            "dealer_china_rub": CHINA_DEALER_FEE * cny_rub,
+            "delivery_china_cny": CHINA_DELIVERY,
+            "delivery_china_rub": CHINA_DELIVERY * cny_rub,
+            "china_total_cny": china_total_cny,
+            "china_total_rub": china_total_cny * cny_rub,
+            "customs_duty_rub": self.customs_duty_rub,
+            "customs_fee_rub": self.customs_fee_rub,
+            "util_fee_rub": self.util_fee_rub,
+            "agent_russia_rub": CHINA_AGENT_FEE,
+            "broker_russia_rub": CHINA_BROKER_FEE,
+            "svh_russia_rub": CHINA_SVH_FEE,
+            "lab_russia_rub": CHINA_LAB_FEE,
+        }
+
+    def to_record(self) -> list:
+        return [self.kind] + [getattr(self, name) for name in self.__slots__]
+
+
+_QUOTE_TYPES = {cls.kind: cls for cls in (KoreaQuote, ChinaQuote)}
+
+
+def load_quote(record):
+    """Rebuild a quote from to_record() output. Returns None for unknown data."""
+    if not record or not isinstance(record, (list, tuple)):
+        return None
+    cls = _QUOTE_TYPES.get(record[0])
+    if cls is None or len(record) != len(cls.__slots__) + 1:
+        return None
+    return cls(*record[1:])
+
+
+def new_quote_id() -> str:
+    """Short random id for a quote, safe to embed in callback_data."""
+    return secrets.token_urlsafe(8)
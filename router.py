@@ -0,0 +1,148 @@
+"""
+Dispatch registry for callback_data and message text.
+
+Replaces long if/elif chains in the bot handlers: exact keys are looked up
+in a dict, prefixes in a character trie (longest registered prefix wins),
+and only keys that match neither fall through to predicate routes (e.g.
+URL regexes) and finally the fallback handler. Every dispatch is timed per
+route; slow routes are logged.
+
+Usage:
+    callback_router = Router("callback")
+
+    @callback_router.exact("main_menu")
+    def handle_main_menu(call):
+        ...
+
+    @callback_router.prefix("detail")
+    def handle_detail(call):
+        ...
+
+    callback_router.dispatch(call.data, call)
+"""
+
+import time
+import logging
+import threading
+
+SLOW_ROUTE_SECONDS = 2.0  # log dispatches that take longer than this
+
+_HANDLER = object()  # trie node key holding the route registered at that prefix
+
+
+class RouteStats:
+    """Call count and timing of one route."""
+
+    __slots__ = ("calls", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+
+class Router:
+    """Exact-match dict + prefix trie + ordered predicate routes."""
+
+    def __init__(self, name):
+        """
+        :param name: Label used in logs
+        """
+        self.name = name
+        self._exact = {}
+        self._trie = {}
+        self._predicates = []  # [(predicate, route)]
+        self._fallback = None
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def exact(self, *keys):
+        """Register a handler for keys that must match exactly."""
+
+        def decorator(fn):
+            for key in keys:
+                self._exact[key] = (f"={key}", fn)
+            return fn
+
+        return decorator
+
+    def prefix(self, *prefixes):
+        """Register a handler for keys starting with any of the prefixes."""
+
+        def decorator(fn):
+            for prefix in prefixes:
+                node = self._trie
+                for char in prefix:
+                    node = node.setdefault(char, {})
+                node[_HANDLER] = (f"{prefix}*", fn)
+            return fn
+
+        return decorator
+
+    def match(self, predicate, name=None):
+        """Register a handler for keys where predicate(key) is truthy (checked in order)."""
+
+        def decorator(fn):
+            self._predicates.append((predicate, (name or fn.__name__, fn)))
+            return fn
+
+        return decorator
+
+    def fallback(self, fn):
+        """Register the handler used when nothing else matches."""
+        self._fallback = ("fallback", fn)
+        return fn
+
+    def resolve(self, key):
+        """Return (route_name, handler) for key, or None."""
+        route = self._exact.get(key)
+        if route is not None:
+            return route
+
+        node = self._trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(_HANDLER, route)
+        if route is not None:
+            return route
+
+        for predicate, candidate in self._predicates:
+            if predicate(key):
+                return candidate
+        return self._fallback
+
+    def dispatch(self, key, *args, **kwargs) -> bool:
+        """Run the handler for key. Returns False if no route matched."""
+        route = self.resolve(key or "")
+        if route is None:
+            logging.debug(f"{self.name} router: no route for {key!r}")
+            return False
+
+        route_name, handler = route
+        started = time.perf_counter()
+        try:
+            handler(*args, **kwargs)
+        finally:
+            self._record(route_name, time.perf_counter() - started)
+        return True
+
+    def _record(self, route_name, elapsed):
+        with self._stats_lock:
+            stats = self._stats.get(route_name)
+            if stats is None:
+                stats = self._stats[route_name] = RouteStats()
+            stats.calls += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+        if elapsed > SLOW_ROUTE_SECONDS:
+            logging.warning(f"{self.name} route {route_name} took {elapsed:.2f}s")
+
+    def stats(self):
+        """{route_name: (calls, avg_seconds, max_seconds)} for every route used so far."""
+        with self._stats_lock:
+            return {
+                name: (s.calls, s.total_seconds / s.calls, s.max_seconds)
+                for name, s in self._stats.items()
+            }
@@ -0,0 +1,339 @@
+"""
+Per-user conversation state.
+
+Handlers keep things like the last calculation or a half-finished manual
+input keyed by user_id. StateStore gives them a dict-like interface on top
+of a pluggable backend:
+
+- MemoryBackend: in-process, bounded (LRU) and expiring. The default.
+- PostgresBackend: compact JSON rows in the shared database, so state
+  survives dyno restarts and can be shared by several worker processes.
+
+Pick one with STATE_BACKEND=memory|postgres (see create_backend()).
+
+Values must be JSON-serialisable (dicts, lists, numbers, strings; tuples
+come back as lists), and stores hand out copies for the Postgres backend,
+so nested changes have to be written back explicitly:
+``store[user_id] = entry`` or ``store.patch(user_id, field=value)``.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import Json
+from telebot.handler_backends import HandlerBackend
+
+from cache import TTLCache
+from db import get_connection, is_configured
+
+# Configuration
+STATE_TTL = 24 * 60 * 60  # idle seconds before a user's entry is dropped
+STATE_MAX_USERS = 10000  # entries kept per store (memory backend)
+STATE_PURGE_INTERVAL = 10 * 60  # seconds between expired-row cleanups (postgres)
+
+_MISSING = object()
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class MemoryBackend:
+    """In-process state: one bounded TTLCache per namespace."""
+
+    def __init__(self, maxsize=STATE_MAX_USERS):
+        """
+        :param maxsize: Maximum number of entries kept per namespace
+        """
+        self.maxsize = maxsize
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, namespace):
+        cache = self._namespaces.get(namespace)
+        if cache is None:
+            with self._lock:
+                cache = self._namespaces.setdefault(
+                    namespace, TTLCache(maxsize=self.maxsize, ttl=STATE_TTL)
+                )
+        return cache
+
+    def get(self, namespace, key, ttl):
+        cache = self._cache(namespace)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            cache.set(key, value, ttl=ttl)  # sliding expiry
+        return value
+
+    def set(self, namespace, key, value, ttl):
+        self._cache(namespace).set(key, value, ttl=ttl)
+
+    def contains(self, namespace, key):
+        return key in self._cache(namespace)
+
+    def pop(self, namespace, key):
+        return self._cache(namespace).pop(key, _MISSING)
+
+    def clear(self, namespace):
+        self._cache(namespace).clear()
+
+    def count(self, namespace):
+        cache = self._cache(namespace)
+        cache.expire()
+        return len(cache)
+
+
+class PostgresBackend:
+    """
+    State rows in the bot_state table, one per (namespace, key).
+
+    Reads extend the row's lifetime in the same statement, so a lookup is a
+    single round trip; use get() rather than `in` followed by `[]`, and
+    `in` on its own is a plain SELECT that doesn't extend it. Expired rows are ignored on read and deleted in the
+    background every STATE_PURGE_INTERVAL. Database errors are logged and
+    treated as a missing entry rather than failing the handler.
+    """
+
+    def __init__(self):
+        self._table_ready = False
+        self._table_lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+    def _ensure_table(self):
+        if self._table_ready:
+            return
+        with self._table_lock:
+            if self._table_ready:
+                return
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS bot_state (
+                            namespace TEXT NOT NULL,
+                            key TEXT NOT NULL,
+                            value JSONB NOT NULL,
+                            expires_at TIMESTAMPTZ NOT NULL,
+                            PRIMARY KEY (namespace, key)
+                        );
+                        CREATE INDEX IF NOT EXISTS bot_state_expires_at_idx
+                            ON bot_state (expires_at);
+                        """
+                    )
+            self._table_ready = True
+
+    def _execute(self, query, params, fetch=False):
+        try:
+            self._ensure_table()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    return cursor.fetchone() if fetch else None
+        except (psycopg2.Error, pool.PoolError) as e:
+            logging.error(f"State backend query failed: {e}")
+            return None
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now - self._last_purge < STATE_PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        threading.Thread(
+            target=self._execute,
+            args=("DELETE FROM bot_state WHERE expires_at <= now()", ()),
+            name="state-purge",
+            daemon=True,
+        ).start()
+
+    def get(self, namespace, key, ttl):
+        row = self._execute(
+            """
+            UPDATE bot_state SET expires_at = now() + make_interval(secs => %s)
+            WHERE namespace = %s AND key = %s AND expires_at > now()
+            RETURNING value
+            """,
+            (ttl, namespace, str(key)),
+            fetch=True,
+        )
+        return _MISSING if row is None else row[0]
+
+    def contains(self, namespace, key):
+        row = self._execute(
+            "SELECT 1 FROM bot_state WHERE namespace = %s AND key = %s AND expires_at > now()",
+            (namespace, str(key)),
+            fetch=True,
+        )
+        return row is not None
+
+    def set(self, namespace, key, value, ttl):
+        self._execute(
+            """
+            INSERT INTO bot_state (namespace, key, value, expires_at)
+            VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+            ON CONFLICT (namespace, key)
+            DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+            """,
+            (namespace, str(key), Json(value, dumps=_dumps), ttl),
+        )
+        self._maybe_purge()
+
+    def pop(self, namespace, key):
+        row = self._execute(
+            """
+            DELETE FROM bot_state WHERE namespace = %s AND key = %s
+            RETURNING value, expires_at > now()
+            """,
+            (namespace, str(key)),
+            fetch=True,
+        )
+        if row is None or not row[1]:
+            return _MISSING
+        return row[0]
+
+    def clear(self, namespace):
+        self._execute("DELETE FROM bot_state WHERE namespace = %s", (namespace,))
+
+    def count(self, namespace):
+        row = self._execute(
+            "SELECT COUNT(*) FROM bot_state WHERE namespace = %s AND expires_at > now()",
+            (namespace,),
+            fetch=True,
+        )
+        return row[0] if row else 0
+
+
+def create_backend():
+    """
+    Build the backend selected by STATE_BACKEND (read at call time, after
+    load_dotenv()). Falls back to memory if postgres is requested without
+    a DATABASE_URL.
+    """
+    name = os.getenv("STATE_BACKEND", "memory").lower()
+    if name == "postgres":
+        if is_configured():
+            return PostgresBackend()
+        logging.warning("STATE_BACKEND=postgres but DATABASE_URL is not set, using memory")
+    elif name != "memory":
+        logging.warning(f"Unknown STATE_BACKEND={name!r}, using memory")
+    return MemoryBackend()
+
+
+class StateStore:
+    """
+    Dict-like view of one namespace in a state backend.
+
+    Entries expire after `ttl` seconds without being read or written, so
+    state for users who are still active does not expire mid-conversation.
+
+    Usage:
+        car_data = StateStore("car_data", backend)
+        car_data[user_id] = {...}
+        car_data.patch(user_id, fuel_type=1)
+        details = car_data.get(user_id)  # one read; prefer it over `in` + `[]`
+    """
+
+    def __init__(self, name, backend=None, ttl=STATE_TTL):
+        """
+        :param name: Namespace of the store within the backend
+        :param backend: MemoryBackend / PostgresBackend (a private MemoryBackend if omitted)
+        :param ttl: Idle seconds before an entry expires
+        """
+        self.name = name
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.name, key, self.ttl)
+        return default if value is _MISSING else value
+
+    def pop(self, key, default=None):
+        value = self.backend.pop(self.name, key)
+        return default if value is _MISSING else value
+
+    def patch(self, key, **fields):
+        """Merge fields into the dict stored under key and write it back."""
+        entry = self[key]
+        entry.update(fields)
+        self[key] = entry
+
+    def clear(self):
+        self.backend.clear(self.name)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.set(self.name, key, value, self.ttl)
+
+    def __delitem__(self, key):
+        if self.backend.pop(self.name, key) is _MISSING:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        # Doesn't refresh the entry's lifetime
+        return self.backend.contains(self.name, key)
+
+    def __len__(self):
+        return self.backend.count(self.name)
+
+
+class StateHandlerBackend(HandlerBackend):
+    """
+    Next-step handler storage for TeleBot kept in a StateStore.
+
+    Handlers are stored by reference ("module:function") instead of being
+    pickled, so with the Postgres backend a user in the middle of a manual
+    calculation can keep answering after a restart. Handler arguments must
+    be JSON-serialisable.
+
+    Usage:
+        bot = telebot.TeleBot(token, next_step_backend=StateHandlerBackend(store))
+    """
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    @staticmethod
+    def _resolve(name):
+        module_name, _, qualname = name.partition(":")
+        target = sys.modules.get(module_name)
+        for part in qualname.split("."):
+            target = getattr(target, part, None)
+        return target
+
+    def register_handler(self, handler_group_id, handler):
+        handlers = self.store.get(handler_group_id) or []
+        handlers.append(
+            {
+                "callback": f"{handler.callback.__module__}:{handler.callback.__qualname__}",
+                "args": list(handler.args),
+                "kwargs": handler.kwargs,
+            }
+        )
+        self.store[handler_group_id] = handlers
+
+    def clear_handlers(self, handler_group_id):
+        self.store.pop(handler_group_id)
+
+    def get_handlers(self, handler_group_id):
+        stored = self.store.pop(handler_group_id)
+        if not stored:
+            return None
+        handlers = []
+        for item in stored:
+            callback = self._resolve(item["callback"])
+            if callback is None:
+                logging.warning(f"Dropping next-step handler {item['callback']}: not found")
+                continue
+            handlers.append({"callback": callback, "args": item["args"], "kwargs": item["kwargs"]})
+        return handlers or None
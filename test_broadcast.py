@@ -0,0 +1,245 @@
+"""Tests for broadcast.py: message kinds, albums and interrupted runs (no database or Telegram needed).
+
+Run with:  python3 test_broadcast.py
+"""
+
+import json
+import threading
+from types import SimpleNamespace
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+import broadcast
+from broadcast import BroadcastEngine, BroadcastMessage
+
+
+class _FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return type("Message", (), {"message_id": len(self.sent)})()
+
+    def edit_message_text(self, text, chat_id, message_id):
+        pass
+
+
+class _MediaBot:
+    def __init__(self):
+        self.calls = []
+
+    def send_photo(self, chat_id, file_id, caption=None, parse_mode=None):
+        self.calls.append(("photo", chat_id, file_id, caption))
+
+    def send_video(self, chat_id, file_id, caption=None, parse_mode=None):
+        self.calls.append(("video", chat_id, file_id, caption))
+
+    def send_media_group(self, chat_id, media):
+        self.calls.append(("album", chat_id, media))
+
+
+def _photo(message_id, file_id, caption=None):
+    sizes = [SimpleNamespace(file_id=file_id + "-small"), SimpleNamespace(file_id=file_id)]
+    return SimpleNamespace(message_id=message_id, content_type="photo", photo=sizes, caption=caption)
+
+
+def _video(message_id, file_id, caption=None):
+    return SimpleNamespace(
+        message_id=message_id, content_type="video", video=SimpleNamespace(file_id=file_id), caption=caption
+    )
+
+
+def _text(message_id, text):
+    return SimpleNamespace(message_id=message_id, content_type="text", text=text)
+
+
+class _FakeJob:
+    def __init__(self):
+        self.job_id = 7
+        self.admin_chat_id = 1
+        self.message = BroadcastMessage(BroadcastMessage.KIND_TEXT, "hello")
+        self.cursor_user_id = 0
+        self.statuses = []
+        self.deliveries = []
+
+    def save_cursor(self, cursor_user_id):
+        self.cursor_user_id = max(self.cursor_user_id, cursor_user_id)
+
+    def set_status(self, status):
+        self.statuses.append(status)
+
+    def record_delivery(self, user_id, status):
+        self.deliveries.append(user_id)
+
+    def delivery_counts(self):
+        return {"sent": len(self.deliveries)}
+
+
+class _FailingEngine(BroadcastEngine):
+    """Streams two recipients, then loses the database connection."""
+
+    def iter_recipients(self, job):
+        yield 10
+        yield 20
+        raise ConnectionError("server closed the connection unexpectedly")
+
+
+class _ListEngine(BroadcastEngine):
+    def __init__(self, bot, recipients, **kwargs):
+        super().__init__(bot, **kwargs)
+        self.recipients = recipients
+
+    def iter_recipients(self, job):
+        yield from self.recipients
+
+
+class _UnloggableJob(_FakeJob):
+    """Fails to write the delivery row for one user."""
+
+    def __init__(self, unloggable):
+        super().__init__()
+        self.unloggable = unloggable
+
+    def record_delivery(self, user_id, status):
+        if user_id == self.unloggable:
+            raise ConnectionError("could not write delivery")
+        super().record_delivery(user_id, status)
+
+
+def test_interrupted_run_keeps_job_resumable():
+    bot = _FakeBot()
+    engine = _FailingEngine(bot, rate_limit=1000, workers=2)
+    resumed = threading.Event()
+    engine._spawn = lambda *args, **kwargs: resumed.set()
+
+    original_delay = broadcast.BROADCAST_RESUME_DELAY
+    broadcast.BROADCAST_RESUME_DELAY = 0
+    try:
+        job = _FakeJob()
+        stats = engine.run(job)
+        assert resumed.wait(2), "interrupted job was not rescheduled"
+    finally:
+        broadcast.BROADCAST_RESUME_DELAY = original_delay
+
+    assert stats.sent == 2
+    assert job.statuses == []  # still running, so resume_unfinished() would pick it up too
+    assert job.cursor_user_id == 20
+    assert "прервана" in bot.sent[-1][1]
+
+
+def test_gives_up_retrying_after_max_resumes():
+    bot = _FakeBot()
+    engine = _FailingEngine(bot, rate_limit=1000, workers=2)
+    job = _FakeJob()
+    engine.run(job, resumed=True, retries=broadcast.BROADCAST_MAX_RESUMES)
+    assert job.statuses == []
+    assert "после перезапуска" in bot.sent[-1][1]
+
+
+def test_unlogged_delivery_pins_the_watermark():
+    bot = _FakeBot()
+    engine = _ListEngine(bot, [10, 20, 30], rate_limit=1000, workers=2)
+    engine._schedule_resume = lambda job, retries: None
+    job = _UnloggableJob(unloggable=20)
+    engine.run(job)
+
+    assert job.statuses == []  # not marked done with a recipient missing from the log
+    assert job.cursor_user_id == 19  # a resume starts at the unlogged user
+    assert sorted(job.deliveries) == [10, 30]
+
+
+class _FloodedBot(_FakeBot):
+    """Answers the first `floods` sends with 429 Too Many Requests."""
+
+    def __init__(self, floods):
+        super().__init__()
+        self.floods = floods
+
+    def send_message(self, chat_id, text, **kwargs):
+        if self.floods:
+            self.floods -= 1
+            raise ApiTelegramException("sendMessage", "", {
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 0",
+                "parameters": {"retry_after": 0},
+            })
+        return super().send_message(chat_id, text, **kwargs)
+
+
+def test_flood_waits_do_not_use_up_retries():
+    message = BroadcastMessage(BroadcastMessage.KIND_TEXT, "hello")
+    bot = _FloodedBot(floods=broadcast.BROADCAST_MAX_RETRIES + 2)
+    engine = BroadcastEngine(bot, rate_limit=1000)
+    assert engine.send_one(10, message) == "sent"
+
+    bot = _FloodedBot(floods=broadcast.BROADCAST_MAX_FLOOD_WAITS + 1)
+    engine = BroadcastEngine(bot, rate_limit=1000)
+    assert engine.send_one(10, message) == "failed"
+
+
+def test_single_photo_and_video_are_sent_with_caption():
+    bot = _MediaBot()
+    BroadcastMessage.from_message(_photo(1, "p1", "<b>Sale</b>")).send(bot, 42)
+    BroadcastMessage.from_message(_video(2, "v1")).send(bot, 42)
+    # The largest photo size is sent; an empty caption is omitted
+    assert bot.calls == [("photo", 42, "p1", "<b>Sale</b>"), ("video", 42, "v1", None)]
+    assert BroadcastMessage.from_message(SimpleNamespace(content_type="sticker")) is None
+
+
+def test_album_parts_are_ordered_and_keep_the_caption():
+    parts = [
+        BroadcastMessage.album_part(_video(12, "v1")),
+        BroadcastMessage.album_part(_photo(11, "p1", "Новые поступления")),
+        BroadcastMessage.album_part(_photo(13, "p2")),
+    ]
+    assert BroadcastMessage.album_part(_text(14, "hello")) is None
+
+    # Parts arrive out of order and go through the JSON state store
+    message = BroadcastMessage.from_album_parts(json.loads(json.dumps(parts)))
+    assert message.kind == BroadcastMessage.KIND_ALBUM
+    assert [item["file_id"] for item in message.items] == ["p1", "v1", "p2"]
+    assert message.text == "Новые поступления"
+    assert message.cost == 3
+    assert message.describe() == "альбом (3 шт.)"
+
+    bot = _MediaBot()
+    message.send(bot, 42)
+    (kind, chat_id, media), = bot.calls
+    assert [type(m) for m in media] == [types.InputMediaPhoto, types.InputMediaVideo, types.InputMediaPhoto]
+    assert media[0].caption == "Новые поступления" and media[1].caption is None
+
+
+def test_album_from_messages_and_payload_round_trip():
+    message = BroadcastMessage.from_album([_photo(2, "p2"), _text(3, "skip"), _photo(1, "p1", "Hi")])
+    assert [item["file_id"] for item in message.items] == ["p1", "p2"]
+    restored = BroadcastMessage.from_payload(json.loads(json.dumps(message.to_payload())))
+    assert (restored.kind, restored.text, restored.items, restored.cost) == (
+        BroadcastMessage.KIND_ALBUM, "Hi", message.items, 2
+    )
+    assert BroadcastMessage(BroadcastMessage.KIND_TEXT, "hello").cost == 1
+    assert BroadcastMessage(BroadcastMessage.KIND_ALBUM).cost == 1
+
+
+if __name__ == "__main__":
+    tests = [
+        test_single_photo_and_video_are_sent_with_caption,
+        test_album_parts_are_ordered_and_keep_the_caption,
+        test_album_from_messages_and_payload_round_trip,
+        test_interrupted_run_keeps_job_resumable,
+        test_gives_up_retrying_after_max_resumes,
+        test_unlogged_delivery_pins_the_watermark,
+        test_flood_waits_do_not_use_up_retries,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
@@ -0,0 +1,66 @@
+"""Tests for the in-process cache primitives in cache.py.
+
+Run with:  python3 test_cache.py
+"""
+
+import time
+
+from cache import LRUCache, TTLCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Touch "a" so "b" becomes the eviction candidate.
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_missing_key_returns_default():
+    cache = LRUCache(maxsize=2)
+    assert cache.get("missing") is None
+    assert cache.get("missing", "fallback") == "fallback"
+
+
+def test_ttl_entries_expire_per_entry():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("long", True)
+    cache.set("short", False, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("long") is True
+    assert cache.get("short") is None
+    assert "short" not in cache
+
+
+def test_ttl_cache_is_bounded():
+    cache = TTLCache(maxsize=2, ttl=60)
+    for key in range(5):
+        cache.set(key, key)
+    assert len(cache) == 2
+    assert cache.get(0) is None
+    assert cache.get(4) == 4
+
+
+if __name__ == "__main__":
+    tests = [
+        test_lru_evicts_least_recently_used,
+        test_lru_missing_key_returns_default,
+        test_ttl_entries_expire_per_entry,
+        test_ttl_cache_is_bounded,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
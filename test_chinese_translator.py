@@ -0,0 +1,216 @@
+"""Tests for the offline parts of chinese_translator.py (no network, no DB).
+
+Run with:  python3 test_chinese_translator.py
+"""
+
+import random
+import re
+import threading
+
+import chinese_translator
+from chinese_translator import (
+    BRAND_TRANSLATIONS,
+    TERM_TRANSLATIONS,
+    POST_PROCESS_PATTERNS,
+    POST_PROCESS_SIMPLE,
+    PhraseMatcher,
+    _apply_brand_mapping,
+    _apply_term_mapping,
+    _post_process,
+    get_car_title_translation,
+    preview_car_title,
+    start_car_title_translation,
+    translate_batch,
+    translate_car_title,
+)
+
+TITLES = [
+    "银河星舰6 2026款 60km 远航版",
+    "宝马 3系 2020款 325Li M运动套装",
+    "奔驰 E级 2021款 E300L 豪华型",
+    "丰田 凯美瑞 2022款 2.5L 双擎豪华版",
+    "特斯拉 Model 3 2023款 长续航全轮驱动版",
+    "比亚迪 汉 2023款 EV 冠军版 610KM 四驱旗舰型",
+    "问界 M9 2024款 纯电旗舰版",
+    "小米汽车 SU7 2024款 标准版",
+    "深蓝汽车 S7 2024款 增程版",
+    "星途 凌云 2024款 豪华版",
+    "极氪 001 2024款 长续航四驱版",
+    "理想汽车 L9 2024款 Pro版",
+    "蔚来 ET5 2024款 长续航版",
+    "吉利银河 E8 2024款 665km 星舰版",
+    "阿尔法·罗密欧 Giulia 2022款 2.0T 280HP 豪华版",
+    "Jeep 牧马人 2021款 2.0T Rubicon 4门版 8AT",
+]
+
+
+def _reference_mapping(text, translations):
+    """The previous implementation: one str.replace per key, longest first."""
+    result = text
+    for chinese in sorted(translations, key=len, reverse=True):
+        if chinese in result:
+            result = result.replace(chinese, translations[chinese] + " ")
+    while "  " in result:
+        result = result.replace("  ", " ")
+    return result.strip()
+
+
+def _reference_post_process(text):
+    """The previous implementation: one re.sub per pattern."""
+    result = text
+    for pattern, replacement in POST_PROCESS_PATTERNS:
+        result = re.sub(pattern, replacement, result)
+    for wrong, correct in POST_PROCESS_SIMPLE.items():
+        result = result.replace(wrong, correct)
+    while "  " in result:
+        result = result.replace("  ", " ")
+    return result.strip()
+
+
+def _random_translations(count, seed=45):
+    """English titles built from the phrases the post-processor rewrites."""
+    rng = random.Random(seed)
+    phrases = [re.sub(r"\\b|\(\?!ship\)", "", pattern) for pattern, _ in POST_PROCESS_PATTERNS]
+    phrases += ["Starship", "Voyager", "Edition", "SAILING", "version", "Geely", "2024", "6", "ship"]
+    separators = [" ", "  ", "-", "", ", "]
+    return [
+        "".join(rng.choice(phrases) + rng.choice(separators) for _ in range(rng.randint(1, 7)))
+        for _ in range(count)
+    ]
+
+
+def _random_titles(count, seed=44):
+    rng = random.Random(seed)
+    han_keys = [k for k in list(BRAND_TRANSLATIONS) + list(TERM_TRANSLATIONS) if not k.isascii()]
+    ascii_keys = [k for k in list(BRAND_TRANSLATIONS) + list(TERM_TRANSLATIONS) if k.isascii()]
+    fillers = ["", " ", "2024", "款", "版", "型", "的", "新", "L", "0"]
+    titles = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 8)):
+            if rng.random() < 0.1:
+                parts.append(f" {rng.choice(ascii_keys)} ")
+            elif rng.random() < 0.7:
+                key = rng.choice(han_keys)
+                # Slices of keys produce partial and overlapping matches
+                if rng.random() < 0.3 and len(key) > 1:
+                    cut = rng.randint(1, len(key) - 1)
+                    key = key[:cut] if rng.random() < 0.5 else key[cut:]
+                parts.append(key)
+            else:
+                parts.append(rng.choice(fillers))
+        titles.append("".join(parts))
+    return titles
+
+
+def test_mapping_matches_previous_implementation():
+    for title in TITLES + _random_titles(3000):
+        brands = _apply_brand_mapping(title)
+        assert brands == _reference_mapping(title, BRAND_TRANSLATIONS), title
+        assert _apply_term_mapping(brands) == _reference_mapping(brands, TERM_TRANSLATIONS), title
+
+
+def test_post_process_matches_previous_implementation():
+    samples = [
+        "Geely Galaxy Star 6 2026 60km sailing version",
+        "Galaxy Star Ship Four-wheel drive Luxury version Edition",
+        "BYD Han EV champion version 610KM four-wheel drive flagship version",
+    ]
+    for text in samples + _random_translations(3000):
+        assert _post_process(text) == _reference_post_process(text), text
+
+
+def _fake_translator(requests):
+    def fake_translate(text):
+        requests.append(text)
+        return "\n".join(f"w{ord(line[0])}" for line in text.split("\n"))
+    return fake_translate
+
+
+def test_translate_batch_uses_one_request_for_all_misses():
+    requests = []
+    original = chinese_translator._translate_with_retry
+    chinese_translator._translate_with_retry = _fake_translator(requests)
+    try:
+        titles = ["理想汽车 L9 2024款 Pro版", " 某某 甲 ", "某某 乙", "某某 甲", "", "某某 乙"]
+        result = translate_batch(titles)
+        # A second call is served from the cache without any request
+        assert translate_batch(titles[1:3]) == result[1:3]
+    finally:
+        chinese_translator._translate_with_retry = original
+
+    assert requests == ["某某\n甲\n乙"]
+    assert result == [
+        "Li Auto L9 2024 ProEdition", "w26576 w30002", "w26576 w20057", "w26576 w30002", "", "w26576 w20057",
+    ]
+
+
+def test_new_title_is_assembled_from_known_segments():
+    requests = []
+    original = chinese_translator._translate_with_retry
+    chinese_translator._translate_with_retry = _fake_translator(requests)
+    try:
+        assert translate_car_title("丰田 丙丁 2022款 2.5L 豪华版") == "Toyota w19993 2022 2.5L Luxury Edition"
+        # Same model, different trim: nothing left to translate remotely
+        assert translate_car_title("丰田 丙丁 2023款 2.0L 运动版") == "Toyota w19993 2023 2.0L Sport Edition"
+    finally:
+        chinese_translator._translate_with_retry = original
+
+    assert requests == ["丙丁"]
+
+
+def test_background_title_translation_is_joined_on_demand():
+    release = threading.Event()
+    requests = []
+    fake = _fake_translator(requests)
+
+    def slow_translate(text):
+        release.wait(5)
+        return fake(text)
+
+    original = chinese_translator._translate_with_retry
+    chinese_translator._translate_with_retry = slow_translate
+    try:
+        title = "丰田 戊己 2024款 豪华版"
+        # The preview is available while the translator is still busy
+        start_car_title_translation(title)
+        assert preview_car_title(title) == "Toyota 戊己 2024 Luxury Edition"
+        release.set()
+        assert get_car_title_translation(title) == "Toyota w25098 2024 Luxury Edition"
+        # Afterwards the preview is served from the cache
+        assert preview_car_title(title) == "Toyota w25098 2024 Luxury Edition"
+    finally:
+        release.set()
+        chinese_translator._translate_with_retry = original
+
+    assert requests == ["戊己"]
+
+
+def test_longer_key_wins_over_earlier_overlap():
+    matcher = PhraseMatcher({"AB": "x", "BCD": "y", "A": "a"})
+    # "BCD" is longer, so it is replaced first and "AB" no longer matches
+    assert matcher.replace("ABCD") == "a y "
+    assert matcher.replace("ABAB") == "x x "
+    assert matcher.replace("zzz") == "zzz"
+
+
+if __name__ == "__main__":
+    tests = [
+        test_mapping_matches_previous_implementation,
+        test_post_process_matches_previous_implementation,
+        test_translate_batch_uses_one_request_for_all_misses,
+        test_new_title_is_assembled_from_known_segments,
+        test_background_title_translation_is_joined_on_demand,
+        test_longer_key_wins_over_earlier_overlap,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
@@ -0,0 +1,84 @@
+"""Tests for the bounded job executor in executors.py.
+
+Run with:  python3 test_executors.py
+"""
+
+import threading
+
+from executors import BoundedExecutor, JobSlots, job_superseded
+
+
+def test_rejects_when_backlog_full():
+    release = threading.Event()
+    executor = BoundedExecutor("test", workers=1, max_pending=1)
+    try:
+        assert executor.submit(release.wait) is True  # running
+        assert executor.submit(release.wait) is True  # queued
+        assert executor.submit(release.wait) is False  # backlog full
+        assert executor.pending == 2
+    finally:
+        release.set()
+        executor.shutdown()
+    assert executor.pending == 0
+
+
+def test_failing_job_frees_its_slot():
+    def boom():
+        raise ValueError("boom")
+
+    executor = BoundedExecutor("test", workers=1, max_pending=0)
+    done = threading.Event()
+    assert executor.submit(boom) is True
+    # The single worker runs jobs in order, so this waits for boom to finish.
+    executor._executor.submit(lambda: None).result()
+    assert executor.submit(done.set) is True
+    executor.shutdown()
+    assert done.is_set()
+
+
+def test_new_claim_supersedes_running_job():
+    slots = JobSlots()
+    seen = []
+
+    def job():
+        seen.append(job_superseded())
+        slots.claim("chat")  # a newer request arrives mid-job
+        seen.append(job_superseded())
+
+    token = slots.claim("chat")
+    slots.run("chat", token, job)
+    assert seen == [False, True]
+    assert job_superseded() is False  # no job on this thread any more
+
+
+def test_duplicate_key_is_refused_and_queued_job_skipped():
+    slots = JobSlots()
+    first = slots.claim("chat", key="link-1")
+    assert slots.claim("chat", key="link-1") is None
+    second = slots.claim("chat", key="link-2")
+    ran = []
+    slots.run("chat", first, ran.append, "first")
+    slots.run("chat", second, ran.append, "second")
+    assert ran == ["second"]
+    # Finished jobs free the slot, so the same link can be requested again.
+    assert slots.claim("chat", key="link-2") is not None
+
+
+if __name__ == "__main__":
+    tests = [
+        test_rejects_when_backlog_full,
+        test_failing_job_frees_its_slot,
+        test_new_claim_supersedes_running_job,
+        test_duplicate_key_is_refused_and_queued_job_skipped,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
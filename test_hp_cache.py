@@ -0,0 +1,142 @@
+"""Tests for the fuzzy HP lookup in hp_cache.py.
+
+Run with:  python3 test_hp_cache.py
+
+No database is needed: without DATABASE_URL, HPCache.save() only updates
+the in-memory index. The load tests swap in a fake connection.
+"""
+
+from contextlib import contextmanager
+
+import hp_cache
+from hp_cache import HPCache
+
+
+def _cache_with(*rows):
+    cache = HPCache()
+    cache._loaded = True  # skip the database load
+    for row in rows:
+        cache.save(*row)
+    return cache
+
+
+def test_exact_match_has_full_confidence():
+    cache = _cache_with(("Hyundai", "Sonata", 1999, 2021, 160))
+    assert cache.find_nearest("Hyundai", "Sonata", 1999, 2021) == (160, 1.0)
+
+
+def test_neighbouring_displacement_and_year_match():
+    cache = _cache_with(("Hyundai", "Sonata", 1999, 2021, 160))
+    hp, confidence = cache.find_nearest("Hyundai", "Sonata", 1998, 2022)
+    assert hp == 160
+    assert 0.7 <= confidence < 1.0, confidence
+
+
+def test_out_of_tolerance_or_other_model_misses():
+    cache = _cache_with(("Hyundai", "Sonata", 1999, 2021, 160))
+    assert cache.find_nearest("Hyundai", "Sonata", 2497, 2021) is None
+    assert cache.find_nearest("Hyundai", "Sonata", 1999, 2018) is None
+    assert cache.find_nearest("Kia", "K5", 1999, 2021) is None
+
+
+def test_conflicting_equally_close_candidates_lower_confidence():
+    cache = _cache_with(
+        ("Kia", "K5", 1999, 2020, 160),
+        ("Kia", "K5", 1999, 2022, 180),
+    )
+    _, confidence = cache.find_nearest("Kia", "K5", 1999, 2021)
+    assert confidence < 0.7, confidence
+
+
+def test_save_overwrites_fuzzy_index_entry():
+    cache = _cache_with(("BMW", "5 Series", 1998, 2020, 184))
+    cache.save("BMW", "5 Series", 1998, 2020, 252)
+    assert cache.find_nearest("BMW", "5 Series", 1998, 2020) == (252, 1.0)
+
+
+class _FakeCursor:
+    def __init__(self, rows, on_select):
+        self._rows = rows
+        self._on_select = on_select
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if query.startswith("SELECT") and self._on_select:
+            self._on_select()
+
+    def fetchall(self):
+        return self._rows
+
+
+@contextmanager
+def _fake_database(rows=(), on_select=None, fail=False):
+    calls = []
+
+    @contextmanager
+    def get_connection():
+        calls.append(1)
+        if fail:
+            raise ConnectionError("database is down")
+
+        class _Conn:
+            def cursor(self):
+                return _FakeCursor(list(rows), on_select)
+
+        yield _Conn()
+
+    saved = hp_cache.get_connection, hp_cache.is_configured
+    hp_cache.get_connection, hp_cache.is_configured = get_connection, lambda: True
+    try:
+        yield calls
+    finally:
+        hp_cache.get_connection, hp_cache.is_configured = saved
+
+
+def test_failed_load_is_not_retried_on_every_lookup():
+    cache = HPCache()
+    with _fake_database(fail=True) as calls:
+        assert cache.get("Kia", "K5", 1999, 2021) is None
+        assert cache.find_nearest("Kia", "K5", 1999, 2021) is None
+        assert cache.get("Kia", "K5", 1999, 2021) is None
+    assert len(calls) == 1, calls
+
+
+def test_save_during_load_survives_the_index_swap():
+    cache = HPCache()
+    stale_row = ("Kia", "K5", 1999, 2021, 160)
+
+    def save_mid_load():
+        cache.save("Kia", "K5", 1999, 2021, 180)
+
+    with _fake_database(rows=[stale_row], on_select=save_mid_load):
+        cache.load()
+    assert cache.get("Kia", "K5", 1999, 2021) == 180
+    assert cache.find_nearest("Kia", "K5", 1999, 2021) == (180, 1.0)
+
+
+if __name__ == "__main__":
+    tests = [
+        test_exact_match_has_full_confidence,
+        test_neighbouring_displacement_and_year_match,
+        test_out_of_tolerance_or_other_model_misses,
+        test_conflicting_equally_close_candidates_lower_confidence,
+        test_save_overwrites_fuzzy_index_entry,
+        test_failed_load_is_not_retried_on_every_lookup,
+        test_save_during_load_survives_the_index_swap,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
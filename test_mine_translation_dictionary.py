@@ -0,0 +1,79 @@
+"""Tests for the cache mining tool in mine_translation_dictionary.py.
+
+Run with:  python3 test_mine_translation_dictionary.py
+"""
+
+import os
+import json
+import tempfile
+
+import chinese_translator
+from chinese_translator import _apply_mappings, load_learned_translations
+from mine_translation_dictionary import align_pair, mine
+
+
+def test_fragment_aligned_between_anchors():
+    assert align_pair("丰田 凯美瑞 2022款 2.5L 豪华版", "Toyota Camry 2022 2.5L Luxury Edition") == [
+        ("凯美瑞", "Camry"),
+    ]
+    # Fragment at the end of the title
+    assert align_pair("比亚迪 汉", "BYD Han") == [("汉", "Han")]
+
+
+def test_unreliable_alignments_are_skipped():
+    # Anchor missing from the translation
+    assert align_pair("丰田 凯美瑞 2022款", "Camry 2022") == []
+    # Two fragments with nothing between them
+    assert align_pair("丰田 凯美瑞 某某 2022款", "Toyota Camry Something 2022") == []
+
+
+def test_mine_requires_support_and_agreement():
+    pairs = [
+        ("丰田 凯美瑞 2022款", "Toyota Camry 2022"),
+        ("丰田 凯美瑞 2023款", "Toyota Camry 2023"),
+        ("丰田 凯美瑞 2021款", "Toyota Kemeirui 2021"),
+        ("本田 雅阁 2021款", "Honda Accord 2021"),
+    ]
+    assert mine(pairs, min_support=2, min_agreement=0.6) == {"凯美瑞": "Camry"}
+    assert mine(pairs, min_support=2, min_agreement=0.7) == {}
+
+
+def test_learned_file_skips_curated_entries():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "learned.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"凯美瑞": "Camry", "丰田": "Wrong", "空": " "}, f, ensure_ascii=False)
+        assert load_learned_translations(path) == {"凯美瑞": "Camry"}
+        assert load_learned_translations(os.path.join(tmp, "missing.json")) == {}
+
+
+def test_learned_entry_only_replaces_whole_segments():
+    original = chinese_translator.LEARNED_TRANSLATIONS
+    chinese_translator.LEARNED_TRANSLATIONS = {"汉": "Han"}
+    try:
+        assert _apply_mappings("比亚迪 汉 2022款 EV 豪华版") == "BYD Han 2022 EV Luxury Edition"
+        # 汉 (BYD Han) is a prefix of 汉兰达 (Toyota Highlander), which is left for the translator
+        assert _apply_mappings("丰田 汉兰达 2022款 2.5L 豪华版") == "Toyota 汉兰达 2022 2.5L Luxury Edition"
+    finally:
+        chinese_translator.LEARNED_TRANSLATIONS = original
+
+
+if __name__ == "__main__":
+    tests = [
+        test_fragment_aligned_between_anchors,
+        test_unreliable_alignments_are_skipped,
+        test_mine_requires_support_and_agreement,
+        test_learned_file_skips_curated_entries,
+        test_learned_entry_only_replaces_whole_segments,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
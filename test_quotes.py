@@ -0,0 +1,73 @@
+"""Tests for the compact quote records in quotes.py.
+
+Run with:  python3 test_quotes.py
+"""
+
+import json
+
+from quotes import ChinaQuote, KoreaQuote, load_quote, new_quote_id
+from utils import compute_turnkey_total
+
+RUSSIA_FEES = {"svh_rub": 35000, "lab_rub": 20000, "perm_registration_rub": 8000}
+
+
+def test_korea_breakdown_matches_turnkey_pricing():
+    quote = KoreaQuote.create(25_000_000, 900_000, 4_269, 5_200, RUSSIA_FEES, 0.062, 92.0, 16.1)
+    ud = quote.breakdown()
+    pricing = compute_turnkey_total(
+        price_krw=25_000_000,
+        krw_rub=0.062,
+        usd_rub=92.0,
+        customs_duty_rub=900_000,
+        customs_fee_rub=4_269,
+        recycling_fee_rub=5_200,
+        russia_fees=RUSSIA_FEES,
+    )
+    assert ud["korea_total_rub"] == pricing["korea_operating_rub"]
+    assert ud["broker_russia_rub"] == pricing["broker_rub"]
+    assert ud["car_price_krw"] == 24_000_000
+    assert ud["customs_duty_krw"] == 900_000 * 16.1
+    assert ud["svh_russia_rub"] == 35000
+
+
+def test_records_survive_json_round_trip():
+    korea = KoreaQuote.create(25_000_000, 900_000, 4_269, 5_200, RUSSIA_FEES, 0.062, 92.0, 16.1)
+    china = ChinaQuote(150_000, 600_000, 4_269, 5_200, 12.5)
+    for quote in (korea, china):
+        restored = load_quote(json.loads(json.dumps(quote.to_record())))
+        assert restored.kind == quote.kind
+        assert restored.breakdown() == quote.breakdown()
+
+
+def test_load_quote_rejects_old_data():
+    assert load_quote(None) is None
+    assert load_quote({"advance_rub": 1.0}) is None  # pre-record dict format
+    assert load_quote(["korea", 1, 2]) is None
+
+
+def test_quote_ids_fit_in_callback_data():
+    ids = {new_quote_id() for _ in range(1000)}
+    assert len(ids) == 1000
+    longest = max(len(f"detail_china_manual:{quote_id}".encode()) for quote_id in ids)
+    assert longest <= 64  # Telegram's callback_data limit
+    assert not any(":" in quote_id for quote_id in ids)
+
+
+if __name__ == "__main__":
+    tests = [
+        test_korea_breakdown_matches_turnkey_pricing,
+        test_records_survive_json_round_trip,
+        test_load_quote_rejects_old_data,
+        test_quote_ids_fit_in_callback_data,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
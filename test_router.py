@@ -0,0 +1,91 @@
+"""Tests for the callback/message dispatch registry in router.py.
+
+Run with:  python3 test_router.py
+"""
+
+import re
+
+from router import Router
+
+
+def _build():
+    router = Router("test")
+    calls = []
+
+    @router.exact("main_menu")
+    def main_menu(arg):
+        calls.append(("main_menu", arg))
+
+    @router.prefix("detail")
+    def detail(arg):
+        calls.append(("detail", arg))
+
+    @router.prefix("detail_china")
+    def detail_china(arg):
+        calls.append(("detail_china", arg))
+
+    @router.match(re.compile(r"^https?://").match, "url")
+    def url(arg):
+        calls.append(("url", arg))
+
+    return router, calls
+
+
+def test_exact_and_longest_prefix():
+    router, calls = _build()
+    assert router.dispatch("main_menu", 1) is True
+    assert router.dispatch("detail:abc", 2) is True
+    assert router.dispatch("detail_manual:abc", 3) is True
+    assert router.dispatch("detail_china_manual:abc", 4) is True
+    assert calls == [("main_menu", 1), ("detail", 2), ("detail", 3), ("detail_china", 4)]
+
+
+def test_predicate_then_fallback():
+    router, calls = _build()
+    assert router.dispatch("https://www.encar.com/x", 1) is True
+    assert router.dispatch("hello", 2) is False
+    assert router.dispatch(None, 3) is False
+
+    @router.fallback
+    def unknown(arg):
+        calls.append(("fallback", arg))
+
+    assert router.dispatch("hello", 4) is True
+    assert router.dispatch("main_men", 5) is True  # exact keys are not prefixes
+    assert calls == [("url", 1), ("fallback", 4), ("fallback", 5)]
+
+
+def test_stats_counted_even_when_handler_fails():
+    router = Router("test")
+
+    @router.exact("boom")
+    def boom():
+        raise ValueError("boom")
+
+    for _ in range(2):
+        try:
+            router.dispatch("boom")
+        except ValueError:
+            pass
+    calls, avg, worst = router.stats()["=boom"]
+    assert calls == 2
+    assert 0 <= avg <= worst
+
+
+if __name__ == "__main__":
+    tests = [
+        test_exact_and_longest_prefix,
+        test_predicate_then_fallback,
+        test_stats_counted_even_when_handler_fails,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
@@ -0,0 +1,101 @@
+"""Tests for the per-user state store in state.py.
+
+Run with:  python3 test_state.py
+"""
+
+import time
+
+from telebot import Handler
+
+from state import MemoryBackend, StateHandlerBackend, StateStore
+
+
+def test_behaves_like_a_dict():
+    store = StateStore("test")
+    store[1] = {"hp": 150}
+    assert 1 in store
+    assert store[1]["hp"] == 150
+    assert store.get(2) is None
+    assert store.pop(1) == {"hp": 150}
+    assert 1 not in store
+    try:
+        store[1]
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("expected KeyError for a missing user")
+
+
+def test_entries_expire_when_idle():
+    store = StateStore("test", ttl=0.05)
+    store[1] = "active"
+    store[2] = "idle"
+    time.sleep(0.03)
+    assert store.get(1) == "active"  # reading refreshes the lifetime
+    time.sleep(0.03)
+    assert store.get(1) == "active"
+    assert store.get(2) is None
+
+
+def test_count_and_membership_skip_expired_entries():
+    store = StateStore("test", ttl=0.05)
+    store[1] = "active"
+    store[2] = "idle"
+    time.sleep(0.03)
+    assert 1 in store  # checking membership doesn't refresh the lifetime
+    store.get(2)
+    time.sleep(0.03)
+    assert 1 not in store
+    assert len(store) == 1
+
+
+def test_store_is_bounded():
+    store = StateStore("test", MemoryBackend(maxsize=3))
+    for user_id in range(10):
+        store[user_id] = user_id
+    assert len(store) == 3
+    assert 0 not in store
+    assert store[9] == 9
+
+
+def test_patch_writes_fields_back():
+    store = StateStore("test")
+    store[1] = {"hp": 150}
+    store.patch(1, fuel_type=2)
+    assert store[1] == {"hp": 150, "fuel_type": 2}
+
+
+def next_step(message):
+    return message
+
+
+def test_next_step_handlers_are_stored_by_reference():
+    backend = StateHandlerBackend(StateStore("handlers"))
+    backend.register_handler(42, Handler(next_step))
+    stored = backend.store.get(42)
+    assert stored[0]["callback"] == f"{__name__}:next_step"
+    handlers = backend.get_handlers(42)
+    assert handlers[0]["callback"] is next_step
+    assert backend.get_handlers(42) is None
+
+
+if __name__ == "__main__":
+    tests = [
+        test_behaves_like_a_dict,
+        test_entries_expire_when_idle,
+        test_count_and_membership_skip_expired_entries,
+        test_store_is_bounded,
+        test_patch_writes_fields_back,
+        test_next_step_handlers_are_stored_by_reference,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
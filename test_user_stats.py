@@ -0,0 +1,123 @@
+"""Tests for the /stats keyset pagination in user_stats.py.
+
+Run with:  python3 test_user_stats.py
+
+A fake cursor answers the handful of queries fetch_stats_page() sends
+from an in-memory list of users, so no database is needed.
+"""
+
+import datetime
+
+from user_stats import (
+    USERS_PER_PAGE,
+    STATS_EPOCH,
+    decode_stats_cursor,
+    encode_stats_cursor,
+    fetch_stats_page,
+)
+
+START = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+class _FakeCursor:
+    def __init__(self, users):
+        self.users = users  # [(user_id, username, first_name, created_at)]
+        self._result = []
+
+    @staticmethod
+    def _key(user):
+        return (user[3], user[0])
+
+    def execute(self, query, params):
+        newest_first = sorted(self.users, key=self._key, reverse=True)
+        if query.startswith("SELECT COUNT(*)"):
+            self._result = [(sum(1 for user in self.users if self._key(user) > params),)]
+        elif "<" in query:
+            key, limit = params[:2], params[2]
+            self._result = [user for user in newest_first if self._key(user) < key][:limit]
+        elif ">" in query:
+            key, limit = params[:2], params[2]
+            self._result = [user for user in reversed(newest_first) if self._key(user) > key][:limit]
+        else:
+            self._result = newest_first[:params[0]]
+
+    def fetchall(self):
+        return list(self._result)
+
+    def fetchone(self):
+        return self._result[0]
+
+
+def _users(first_id, count):
+    return [
+        (user_id, f"user{user_id}", "Имя", START + datetime.timedelta(minutes=user_id))
+        for user_id in range(first_id, first_id + count)
+    ]
+
+
+def _boundary(user, direction):
+    # What the button carries: encoded into callback_data and decoded back
+    return decode_stats_cursor(encode_stats_cursor(user[3], user[0])), direction
+
+
+def test_cursor_round_trips_through_callback_data():
+    created_at = datetime.datetime(2025, 3, 4, 5, 6, 7, 891011)
+    value = encode_stats_cursor(created_at, 728438182)
+    assert len(f"stats_prev_{value}") <= 64  # Telegram's callback_data limit
+    assert decode_stats_cursor(value) == (created_at, 728438182)
+    assert decode_stats_cursor(encode_stats_cursor(STATS_EPOCH, 1)) == (STATS_EPOCH, 1)
+
+
+def test_pages_are_numbered_by_position():
+    cursor = _FakeCursor(_users(1, 45))
+    users, rank, has_next = fetch_stats_page(cursor)
+    assert (rank, has_next, users[0][0]) == (0, True, 45)
+
+    users, rank, has_next = fetch_stats_page(cursor, *_boundary(users[-1], "next"))
+    assert (rank, has_next, users[0][0]) == (20, True, 25)
+
+    last, rank, has_next = fetch_stats_page(cursor, *_boundary(users[-1], "next"))
+    assert (rank, has_next, [user[0] for user in last]) == (40, False, [5, 4, 3, 2, 1])
+
+    # New signups push the same rows further down; the rank follows them
+    cursor.users += _users(100, 3)
+    users, rank, has_next = fetch_stats_page(cursor, *_boundary(last[0], "prev"))
+    assert (rank, has_next, users[0][0], users[-1][0]) == (23, True, 25, 6)
+
+
+def test_prev_near_the_top_shows_the_first_page():
+    cursor = _FakeCursor(_users(1, 45))
+    first, _, _ = fetch_stats_page(cursor)
+    second, rank, _ = fetch_stats_page(cursor, *_boundary(first[-1], "next"))
+    assert rank == 20
+
+    # Ten of the newest users are deleted: only 10 rows remain above page 2
+    cursor.users = [user for user in cursor.users if user[0] <= 35]
+    users, rank, has_next = fetch_stats_page(cursor, *_boundary(second[0], "prev"))
+    assert (rank, has_next, users[0][0], len(users)) == (0, True, 35, USERS_PER_PAGE)
+
+
+def test_stale_next_boundary_falls_back_to_the_first_page():
+    cursor = _FakeCursor(_users(1, 5))
+    users, rank, has_next = fetch_stats_page(cursor, *_boundary((0, "", "", STATS_EPOCH), "next"))
+    assert (rank, has_next, users[0][0]) == (0, False, 5)
+
+
+if __name__ == "__main__":
+    tests = [
+        test_cursor_round_trips_through_callback_data,
+        test_pages_are_numbered_by_position,
+        test_prev_near_the_top_shows_the_first_page,
+        test_stale_next_boundary_falls_back_to_the_first_page,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
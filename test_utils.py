@@ -0,0 +1,56 @@
+"""Tests for the shared RateLimiter in utils.py (calcus.ru client, broadcasts, translator).
+
+Run with:  python3 test_utils.py
+
+A fake clock is passed in, so reserve() is checked without sleeping.
+"""
+
+from utils import RateLimiter
+
+
+def _delays(limiter, count):
+    return [round(limiter.reserve(), 9) for _ in range(count)]
+
+
+def test_default_limiter_keeps_previous_spacing():
+    # Without `burst` the bucket holds rate_limit tokens, as before: a full
+    # second's worth of requests goes out at once, then one every 1/rate_limit
+    now = [100.0]
+    calcus = RateLimiter(rate_limit=5, clock=lambda: now[0])
+    assert _delays(calcus, 7) == [0.0] * 5 + [0.2, 0.4]
+
+    broadcast = RateLimiter(rate_limit=25, clock=lambda: now[0])
+    assert _delays(broadcast, 27) == [0.0] * 25 + [0.04, 0.08]
+
+    # Once the booked slots have passed and a second of idling refilled the
+    # bucket, the full burst is available again
+    now[0] += 2
+    assert _delays(calcus, 5) == [0.0] * 5
+
+
+def test_rate_limiter_spaces_requests_after_burst():
+    now = [100.0]
+    limiter = RateLimiter(rate_limit=5, burst=3, clock=lambda: now[0])
+    assert _delays(limiter, 5) == [0.0, 0.0, 0.0, 0.2, 0.4]
+
+    # After an idle period the burst is available again
+    now[0] += 10
+    assert _delays(limiter, 3) == [0.0, 0.0, 0.0]
+
+
+if __name__ == "__main__":
+    tests = [
+        test_default_limiter_keeps_previous_spacing,
+        test_rate_limiter_spaces_requests_after_burst,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
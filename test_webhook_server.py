@@ -0,0 +1,113 @@
+"""Tests for the webhook endpoint in webhook_server.py.
+
+Run with:  python3 test_webhook_server.py
+"""
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from telebot import types
+
+from webhook_server import WebhookServer
+
+
+class FakeBot:
+    def __init__(self):
+        self.updates = []
+
+    def process_new_updates(self, updates):
+        self.updates.extend(updates)
+
+
+UPDATE = {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"}}
+
+
+def _update(update_id, chat_id):
+    payload = json.loads(json.dumps(UPDATE))
+    payload["update_id"] = update_id
+    payload["message"]["chat"]["id"] = chat_id
+    return types.Update.de_json(payload)
+
+
+def _start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for _ in range(100):
+        if server._httpd is not None:
+            return f"http://127.0.0.1:{server._httpd.server_address[1]}"
+        time.sleep(0.01)
+    raise AssertionError("webhook server did not start")
+
+
+def _post(url, body, headers=None):
+    request = urllib.request.Request(url, data=body, headers=headers or {}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_updates_are_dispatched_to_workers():
+    bot = FakeBot()
+    server = WebhookServer(bot, host="127.0.0.1", port=0, path="/hook", secret="s3cret", workers=2)
+    base = _start(server)
+    try:
+        body = json.dumps(UPDATE).encode()
+        assert _post(base + "/hook", body) == 403
+        assert _post(base + "/other", body) == 404
+        assert _post(base + "/hook", body, {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}) == 200
+        server.join()
+        assert [u.update_id for u in bot.updates] == [1]
+    finally:
+        server._httpd.shutdown()
+
+
+def test_full_queue_rejects_update():
+    server = WebhookServer(FakeBot(), port=0, secret="", workers=1, queue_size=1)
+    # No workers started, so the queue never drains.
+    assert server.enqueue(object()) is True
+    assert server.enqueue(object()) is False
+
+
+def test_updates_from_one_chat_keep_their_order():
+    order = []
+
+    class SlowBot(FakeBot):
+        def process_new_updates(self, updates):
+            # The first update of each chat is slow; a shared queue would let
+            # the chat's next update finish first on another worker
+            if updates[0].update_id in (1, 2):
+                time.sleep(0.05)
+            order.append(updates[0].update_id)
+
+    server = WebhookServer(SlowBot(), port=0, secret="", workers=4)
+    server.start_workers()
+    try:
+        for update_id, chat_id in [(1, 100), (2, 200), (3, 100), (4, 200)]:
+            assert server.enqueue(_update(update_id, chat_id))
+        server.join()
+    finally:
+        server.shutdown()
+    assert order.index(1) < order.index(3) and order.index(2) < order.index(4), order
+
+
+if __name__ == "__main__":
+    tests = [
+        test_updates_are_dispatched_to_workers,
+        test_full_queue_rejects_update,
+        test_updates_from_one_chat_keep_their_order,
+    ]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"ok  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {t.__name__}: {e}")
+    if failures:
+        raise SystemExit(f"{failures} test(s) failed")
+    print(f"\n{len(tests)} test(s) passed")
@@ -0,0 +1,113 @@
+"""
+Keyset pagination for the admin /stats user list.
+
+Users are listed newest first, ordered by (created_at, user_id). The
+navigation buttons carry the boundary row of the current page
+(encode_stats_cursor()), so a page is one index range scan no matter how
+deep it is. The page number shown to the admin is derived from the
+position of the page's first row, so it stays correct when users are
+added or removed between clicks.
+
+created_at is NOT NULL (see ensure_users_table()): a NULL would drop out
+of every row comparison and the user would never appear on any page.
+Rows created before the column existed are backfilled with STATS_EPOCH
+and shown without a date.
+"""
+
+import datetime
+
+USERS_PER_PAGE = 20
+STATS_EPOCH = datetime.datetime(1970, 1, 1)  # created_at of users with an unknown signup date
+
+_COLUMNS = "SELECT user_id, username, first_name, created_at FROM users "
+
+
+def ensure_users_table(cursor):
+    """Create the users table and its /stats index; backfill and forbid NULL created_at."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR,
+            first_name VARCHAR,
+            phone_number VARCHAR,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """)
+    cursor.execute("""
+        SELECT is_nullable FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'users' AND column_name = 'created_at';
+    """)
+    row = cursor.fetchone()
+    if row and row[0] == "YES":
+        cursor.execute("UPDATE users SET created_at = %s WHERE created_at IS NULL;", (STATS_EPOCH,))
+        cursor.execute("ALTER TABLE users ALTER COLUMN created_at SET NOT NULL;")
+    # Keyset pagination index for /stats (newest first)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS users_created_at_user_id_idx
+        ON users (created_at DESC, user_id DESC);
+    """)
+
+
+def encode_stats_cursor(created_at, user_id):
+    """(created_at, user_id) -> compact string for callback_data."""
+    micros = (created_at - STATS_EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{micros}_{user_id}"
+
+
+def decode_stats_cursor(value):
+    micros, user_id = value.split("_")
+    return STATS_EPOCH + datetime.timedelta(microseconds=int(micros)), int(user_id)
+
+
+def fetch_stats_page(cursor, cursor_key=None, direction="next"):
+    """
+    Load one page of users.
+
+    :param cursor_key: boundary (created_at, user_id) of the neighbouring
+        page; None for the first page
+    :param direction: "next" — rows older than cursor_key, "prev" — newer
+    :returns: (users, rank, has_next) where rank is the number of users
+        listed before users[0]. A "prev" that reaches the top of the list
+        and a boundary whose rows were all deleted both give the first page.
+    """
+    has_next = False
+    if cursor_key is not None and direction == "prev":
+        cursor.execute(
+            _COLUMNS + "WHERE (created_at, user_id) > (%s, %s) "
+            "ORDER BY created_at ASC, user_id ASC LIMIT %s;",
+            (*cursor_key, USERS_PER_PAGE),
+        )
+        users = list(reversed(cursor.fetchall()))
+        if len(users) < USERS_PER_PAGE:
+            # Fewer rows above than a full page: the first page covers them
+            cursor_key = None
+        else:
+            has_next = True
+    elif cursor_key is not None:
+        cursor.execute(
+            _COLUMNS + "WHERE (created_at, user_id) < (%s, %s) "
+            "ORDER BY created_at DESC, user_id DESC LIMIT %s;",
+            (*cursor_key, USERS_PER_PAGE + 1),
+        )
+        users = cursor.fetchall()
+        if not users:
+            cursor_key = None
+        else:
+            has_next = len(users) > USERS_PER_PAGE
+            users = users[:USERS_PER_PAGE]
+
+    if cursor_key is None:
+        cursor.execute(
+            _COLUMNS + "ORDER BY created_at DESC, user_id DESC LIMIT %s;",
+            (USERS_PER_PAGE + 1,),
+        )
+        users = cursor.fetchall()
+        has_next = len(users) > USERS_PER_PAGE
+        return users[:USERS_PER_PAGE], 0, has_next
+
+    first_user_id, _, _, first_created_at = users[0]
+    cursor.execute(
+        "SELECT COUNT(*) FROM users WHERE (created_at, user_id) > (%s, %s);",
+        (first_created_at, first_user_id),
+    )
+    return users, cursor.fetchone()[0], has_next
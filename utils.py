@@ -34,35 +34,42 @@ FUEL_TYPE_NAMES = {
 
 
 class RateLimiter:
-    """Простой rate limiter для ограничения количества запросов в секунду"""
+    """
+    Rate limiter для ограничения количества запросов в секунду.
+
+    reserve() под коротким локом бронирует следующий свободный слот и
+    возвращает, сколько нужно подождать; ждать вызывающий поток будет уже
+    вне лока, поэтому потоки, ожидающие более поздних слотов, не блокируют
+    друг друга. После простоя до `burst` запросов уходят без ожидания.
+    """
 
-    def __init__(self, rate_limit=5):
+    def __init__(self, rate_limit=5, burst=None, clock=time.monotonic):
         """
         :param rate_limit: Максимальное количество запросов в секунду
+        :param burst: Сколько запросов можно сделать подряд после простоя
+            (по умолчанию rate_limit)
+        :param clock: Источник времени (монотонные секунды)
         """
         self.rate_limit = rate_limit
-        self.tokens = rate_limit
-        self.last_update = time.time()
+        self.interval = 1.0 / rate_limit
+        self.burst = max(1, int(rate_limit if burst is None else burst))
+        self._clock = clock
         self.lock = threading.Lock()
+        self._next_slot = 0.0
 
-    def acquire(self):
-        """Ожидает, пока можно будет сделать запрос"""
+    def reserve(self):
+        """Бронирует следующий слот. Возвращает, сколько секунд ждать до него."""
         with self.lock:
-            while True:
-                now = time.time()
-                time_passed = now - self.last_update
-                self.tokens = min(
-                    self.rate_limit, self.tokens + time_passed * self.rate_limit
-                )
-                self.last_update = now
-
-                if self.tokens >= 1:
-                    self.tokens -= 1
-                    return
+            now = self._clock()
+            slot = max(self._next_slot, now - (self.burst - 1) * self.interval)
+            self._next_slot = slot + self.interval
+            return max(0.0, slot - now)
 
-                # Ждем, пока появится токен
-                sleep_time = (1 - self.tokens) / self.rate_limit
-                time.sleep(sleep_time)
+    def acquire(self):
+        """Ожидает, пока можно будет сделать запрос"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
 
 
 # Создаем глобальный rate limiter для calcus.ru (5 запросов в секунду)
@@ -564,6 +571,17 @@ SEA_FREIGHT_USD = 600           # Фрахт паромом до Владиво
 BROKER_PERCENT = 0.015          # 1.5% от суммы таможенных платежей
 BROKER_FIXED_RUB = 15_000       # Фиксированная часть брокерских услуг
 
+# China constants
+CHINA_DEPOSIT = 5000           # ¥5,000 задаток
+CHINA_EXPERT_REPORT = 1600     # ¥1,600 отчет эксперта
+CHINA_FIRST_PAYMENT = 6600     # ¥6,600 итого первая часть
+CHINA_DEALER_FEE = 3000        # ¥3,000 дилерский сбор
+CHINA_DELIVERY = 15000         # ¥15,000 доставка + оформление
+CHINA_BROKER_FEE = 60000       # ₽60,000 брокер (фиксированная)
+CHINA_AGENT_FEE = 50000        # ₽50,000 агентские услуги
+CHINA_SVH_FEE = 50000          # ₽50,000 СВХ
+CHINA_LAB_FEE = 30000          # ₽30,000 лаборатория
+
 
 def compute_broker_fee(customs_duty_rub, customs_fee_rub, recycling_fee_rub):
     """Брокерские услуги Владивосток = 1.5% × (пошлина + сбор + утиль) + 15 000 ₽."""
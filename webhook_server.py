@@ -0,0 +1,184 @@
+"""
+Webhook mode for the bot (alternative to infinity_polling).
+
+Telegram POSTs updates to a local HTTP endpoint; the request thread only
+parses the update and puts it on a bounded queue, and a fixed pool of
+worker threads runs the bot handlers. Each worker has its own queue and
+updates are sharded by chat, so one chat's messages are handled in the
+order they arrived (a next-step handler never races the message before
+it) while different chats run in parallel. When a queue is full the
+endpoint answers 503 so Telegram redelivers later instead of the process
+piling up work. A GET on /healthz lets a load balancer check the instance.
+
+Enabled from main.py with BOT_MODE=webhook and WEBHOOK_URL set to the
+public base URL; polling stays the default. On Heroku only web dynos get
+a routed $PORT, so webhook mode runs as the `web` process from the
+Procfile and polling as `worker`; scale exactly one of them
+(e.g. `heroku ps:scale web=1 worker=0`).
+"""
+
+import os
+import json
+import hmac
+import queue
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+WEBHOOK_DEFAULT_PORT = 8443
+WEBHOOK_DEFAULT_PATH = "/telegram/webhook"
+WEBHOOK_DEFAULT_WORKERS = 8
+WEBHOOK_DEFAULT_QUEUE_SIZE = 500
+WEBHOOK_MAX_BODY = 1024 * 1024  # Telegram updates are far smaller than this
+
+
+class WebhookServer:
+    """
+    HTTP endpoint + bounded update queue + worker pool.
+
+    Settings not passed explicitly are read from the environment when the
+    server is created (after load_dotenv() in main.py):
+    WEBHOOK_HOST, PORT (Heroku) or WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_SECRET, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE.
+    """
+
+    def __init__(self, bot, host=None, port=None, path=None, secret=None, workers=None, queue_size=None):
+        self.bot = bot
+        self.host = host or os.getenv("WEBHOOK_HOST", "0.0.0.0")
+        self.port = port if port is not None else int(os.getenv("PORT") or os.getenv("WEBHOOK_PORT") or WEBHOOK_DEFAULT_PORT)
+        self.path = path or os.getenv("WEBHOOK_PATH", WEBHOOK_DEFAULT_PATH)
+        self.secret = secret if secret is not None else os.getenv("WEBHOOK_SECRET", "")
+        self.workers = workers or int(os.getenv("WEBHOOK_WORKERS", WEBHOOK_DEFAULT_WORKERS))
+        queue_size = queue_size or int(os.getenv("WEBHOOK_QUEUE_SIZE", WEBHOOK_DEFAULT_QUEUE_SIZE))
+        # One queue per worker; queue_size is the total across them
+        self.queues = [queue.Queue(maxsize=max(1, queue_size // self.workers)) for _ in range(self.workers)]
+        self._threads = []
+        self._httpd = None
+
+    @staticmethod
+    def _chat_key(update):
+        """Chat the update belongs to, or its update_id if it has none."""
+        for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+            message = getattr(update, name, None)
+            if message is not None:
+                return message.chat.id
+        callback_query = getattr(update, "callback_query", None)
+        if callback_query is not None:
+            if callback_query.message is not None:
+                return callback_query.message.chat.id
+            return callback_query.from_user.id
+        for name in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query"):
+            query = getattr(update, name, None)
+            if query is not None:
+                return query.from_user.id
+        return getattr(update, "update_id", 0)
+
+    def enqueue(self, update) -> bool:
+        """Queue an update for its chat's worker. Returns False if that queue is full."""
+        updates = self.queues[hash(self._chat_key(update)) % len(self.queues)]
+        try:
+            updates.put_nowait(update)
+            return True
+        except queue.Full:
+            logging.warning("Webhook update queue full, asking Telegram to retry")
+            return False
+
+    def join(self):
+        """Block until every queued update has been processed."""
+        for updates in self.queues:
+            updates.join()
+
+    def _worker(self, updates):
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                logging.error(f"Error processing webhook update {update.update_id}: {e}")
+            finally:
+                updates.task_done()
+
+    def _make_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, body=b""):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/healthz":
+                    self._reply(200, b"ok")
+                else:
+                    self._reply(404)
+
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+
+                if server.secret:
+                    token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+                    if not hmac.compare_digest(token, server.secret):
+                        self._reply(403)
+                        return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                if length <= 0 or length > WEBHOOK_MAX_BODY:
+                    self._reply(400)
+                    return
+
+                try:
+                    payload = json.loads(self.rfile.read(length).decode("utf-8"))
+                    update = types.Update.de_json(payload)
+                except Exception as e:
+                    logging.warning(f"Malformed webhook update: {e}")
+                    self._reply(400)
+                    return
+
+                self._reply(200 if server.enqueue(update) else 503)
+
+            def log_message(self, format, *args):
+                logging.debug("webhook: " + format % args)
+
+        return _Handler
+
+    def start_workers(self):
+        for i, updates in enumerate(self.queues):
+            thread = threading.Thread(target=self._worker, args=(updates,), name=f"webhook-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def register(self, public_url):
+        """Point Telegram at this instance's public URL."""
+        self.bot.remove_webhook()
+        self.bot.set_webhook(
+            url=public_url.rstrip("/") + self.path,
+            secret_token=self.secret or None,
+            max_connections=self.workers,
+        )
+        logging.info(f"Webhook registered at {public_url.rstrip('/')}{self.path}")
+
+    def serve_forever(self):
+        """Start workers and block serving HTTP until interrupted."""
+        self.start_workers()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.port = self._httpd.server_address[1]
+        logging.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self._httpd is not None:
+            self._httpd.server_close()
+        for updates in self.queues:
+            updates.put(None)